@@ -17,6 +17,15 @@ class InvalidHostIP(Exception):
     def __str__(self):
         return self.message
 
+class InvalidHostMAC(Exception):
+
+    def __init__(self, mac):
+        self.message = "MAC <{0}> does not belong to any host".format(mac)
+        super(InvalidHostMAC, self).__init__('InvalidHostMAC: {0}'.format(self.message))
+
+    def __str__(self):
+        return self.message
+
 FAILED_STATUS = 100
 SUCCESS_STATUS = 200
 
@@ -1,6 +1,11 @@
 from p4utils.utils.utils import read_entries, add_entries
+from multiprocessing.pool import ThreadPool
+from time import time
 import os
 
+# maximum number of switches programmed concurrently in thrift mode
+MAX_CONTROLLER_WORKERS = 32
+
 class AppController(object):
 
     def __init__(self, conf, net, log_dir, log_enabled, quiet=False):
@@ -9,32 +14,111 @@ class AppController(object):
         self.log_dir = log_dir
         self.log_enabled = log_enabled
         self.quiet = quiet
+        # "cli": pipe the cli_input files through switch_cli subprocesses
+        # "thrift": run them in-process over a thrift connection per switch
+        self.mode = conf.get('controller_mode', 'cli')
+        # switch name -> list of CommandResult (thrift mode only)
+        self.results = {}
 
     def logger(self, *items):
         if not self.quiet:
             print ' '.join(items)
 
-    def start(self):
-
-        cli = self.conf['switch_cli']
+    def get_switches_to_configure(self):
+        """Returns a list of (switch name, cli_input path) for the switches with a cli_input file."""
+        switches = []
         for sw_name, sw_dict in self.conf.get('topology',{}).get('switches', {}).items():
             if 'cli_input' not in sw_dict:
                 continue
+            cli_input_commands = sw_dict['cli_input']
+            if os.path.exists(cli_input_commands):
+                switches.append((sw_name, cli_input_commands))
+            else:
+                self.logger('Could not find file %s for switch %s' % (cli_input_commands, sw_name))
+        return switches
+
+    def start(self):
+
+        if self.mode == 'thrift':
+            self.start_thrift()
+        else:
+            self.start_cli()
+
+    def start_cli(self):
+
+        cli = self.conf['switch_cli']
+        for sw_name, cli_input_commands in self.get_switches_to_configure():
             # get the port for this particular switch's thrift server
             sw_obj = self.net.get(sw_name)
             thrift_port = sw_obj.thrift_port
 
             cli_outfile = '%s/%s_cli_output.log' % (self.log_dir, sw_name) if self.log_enabled else None
 
-            cli_input_commands = sw_dict['cli_input']
             self.logger('Configuring switch %s with file %s' % (sw_name, cli_input_commands))
 
-            if os.path.exists(cli_input_commands):
-                entries = read_entries(cli_input_commands)
-                add_entries(thrift_port, entries, cli_outfile, cli)
-            else:
-                self.logger('Could not find file %s for switch %s' % (cli_input_commands, sw_name))
+            entries = read_entries(cli_input_commands)
+            add_entries(thrift_port, entries, cli_outfile, cli)
+
+    def configure_switch(self, sw_name, cli_input_commands):
+        """Runs the cli_input file of a switch over thrift.
+
+        Args:
+            sw_name: name of the switch
+            cli_input_commands: path to the command file
+
+        Returns:
+            list of CommandResult
+        """
+        from p4utils.utils.runtime_API import OutputPolicy
+        from p4utils.utils.sswitch_API import SimpleSwitchAPI
+        from p4utils.utils.command_loader import iter_commands, CommandResult
+
+        sw_obj = self.net.get(sw_name)
+        log_file = None
+        if self.log_enabled:
+            log_file = open('%s/%s_cli_output.log' % (self.log_dir, sw_name), 'w')
+        results = []
+        try:
+            controller = SimpleSwitchAPI(sw_obj.thrift_port, json_path=sw_obj.json_path,
+                                         output=OutputPolicy.SILENT, cache_program=True)
+            # the file is read and the log written as the commands run
+            with open(cli_input_commands, 'r') as commands:
+                for result in iter_commands(controller, commands):
+                    results.append(result)
+                    if log_file:
+                        log_file.write('%r\n' % result)
+        except Exception as e:
+            result = CommandResult(0, cli_input_commands, error=e)
+            results.append(result)
+            if log_file:
+                log_file.write('%r\n' % result)
+        finally:
+            if log_file:
+                log_file.close()
+        return results
+
+    def start_thrift(self):
+
+        switches = self.get_switches_to_configure()
+        if not switches:
+            return
+
+        start = time()
+        pool = ThreadPool(min(len(switches), MAX_CONTROLLER_WORKERS))
+        try:
+            results = pool.map(lambda switch: self.configure_switch(*switch), switches)
+        finally:
+            pool.close()
+            pool.join()
 
+        for (sw_name, cli_input_commands), sw_results in zip(switches, results):
+            self.results[sw_name] = sw_results
+            errors = [result for result in sw_results if result.error is not None]
+            self.logger('Configured switch %s with file %s: %d commands, %d errors' % (
+                sw_name, cli_input_commands, len(sw_results), len(errors)))
+            for result in errors:
+                self.logger('  %r' % result)
+        self.logger('Configured %d switches in %.2fs' % (len(switches), time() - start))
 
     def stop(self):
         pass
@@ -126,7 +126,8 @@ class P4CLI(CLI):
 
         program_flag = last_modified(p4source_path_source, output_file)
         includes_flag = check_imports_last_modified(p4source_path_source,
-                                                    self.import_last_modifications)
+                                                    self.import_last_modifications,
+                                                    switch_conf.get('options', None))
 
         log.debug("%s %s %s %s\n" % (p4source_path_source, output_file, program_flag, includes_flag))
 
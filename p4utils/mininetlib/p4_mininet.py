@@ -14,28 +14,35 @@
 #
 
 from sys import exit
-from time import sleep
+from time import time
 import os
 import tempfile
-import socket
 from mininet.node import Switch, Host
 from mininet.log import setLogLevel, info, error, debug
 from mininet.moduledeps import pathCheck
 
-from p4utils.utils.utils import check_listening_on_port
+from p4utils.utils.utils import check_listening_on_port, wait_for_port, PortAllocator
 
 SWITCH_START_TIMEOUT = 10
 
 def configureP4Switch(**switch_args):
     """ Helper class that is called by mininet to initialize the virtual P4 switches.
     The purpose is to ensure each switch's thrift server is using a unique port number.
+
+    Ports are handed out by a PortAllocator, which skips ports that are
+    already bound by another process.
     """
 
     if "sw_path" in switch_args and 'grpc' in switch_args['sw_path']:
         # If grpc appears in the BMv2 switch target, we assume will start P4 Runtime
         class ConfiguredP4RuntimeSwitch(P4RuntimeSwitch):
+            grpc_ports = PortAllocator(P4RuntimeSwitch.next_grpc_port)
+
             def __init__(self, *opts, **kwargs):
                 kwargs.update(switch_args)
+                # a gRPC port given explicitly is kept
+                if kwargs.get('grpc_port') is None:
+                    kwargs['grpc_port'] = ConfiguredP4RuntimeSwitch.grpc_ports.allocate()
                 P4RuntimeSwitch.__init__(self, *opts, **kwargs)
 
             def describe(self):
@@ -44,13 +51,11 @@ def configureP4Switch(**switch_args):
         return ConfiguredP4RuntimeSwitch
     else:
         class ConfiguredP4Switch(P4Switch):
-            next_thrift_port = 9090
+            thrift_ports = PortAllocator(9090)
 
             def __init__(self, *opts, **kwargs):
-                global next_thrift_port
                 kwargs.update(switch_args)
-                kwargs['thrift_port'] = ConfiguredP4Switch.next_thrift_port
-                ConfiguredP4Switch.next_thrift_port += 1
+                kwargs['thrift_port'] = ConfiguredP4Switch.thrift_ports.allocate()
                 P4Switch.__init__(self, *opts, **kwargs)
 
             def describe(self):
@@ -63,14 +68,12 @@ class P4Host(Host):
     def config(self, **params):
         r = super(P4Host, self).config(**params)
 
-        for off in ["rx", "tx", "sg"]:
-            cmd = "/sbin/ethtool --offload %s %s off" % (self.defaultIntf().name, off)
-            self.cmd(cmd)
-
-        # disable IPv6
-        self.cmd("sysctl -w net.ipv6.conf.all.disable_ipv6=1")
-        self.cmd("sysctl -w net.ipv6.conf.default.disable_ipv6=1")
-        self.cmd("sysctl -w net.ipv6.conf.lo.disable_ipv6=1")
+        # disable offloads and IPv6 (all, default and lo) with a single
+        # round-trip to the host shell
+        self.cmd("/sbin/ethtool --offload %s rx off tx off sg off; "
+                 "sysctl -q -w net.ipv6.conf.all.disable_ipv6=1 "
+                 "net.ipv6.conf.default.disable_ipv6=1 "
+                 "net.ipv6.conf.lo.disable_ipv6=1" % self.defaultIntf().name)
 
         return r
 
@@ -102,6 +105,7 @@ class P4Switch(Switch):
                  verbose=False,
                  device_id=None,
                  enable_debugger=False,
+                 start_timeout=SWITCH_START_TIMEOUT,
                  **kwargs):
 
         id = device_id if device_id else P4Switch.device_id
@@ -141,6 +145,14 @@ class P4Switch(Switch):
         self.nanomsg = "ipc:///tmp/bm-{}-log.ipc".format(self.device_id)
 
         self.simple_switch_pid = None
+        self.start_timeout = start_timeout
+        # time at which the switch process was launched, and seconds it took
+        # until its server accepted connections
+        self.start_time = None
+        self.startup_latency = None
+        # when set, start() only launches the process and the caller is
+        # expected to call wait_started() (see P4Mininet.start)
+        self.batch_startup = False
 
     @classmethod
     def setup(cls):
@@ -153,22 +165,25 @@ class P4Switch(Switch):
             return "0"*(16-len(strDpid)) + strDpid
         return strDpid
 
-    def check_switch_started(self):
+    def check_switch_started(self, timeout=None):
         """Check if switch has started properly.
 
         While the process is running (pid exists), we check if the Thrift
         server has been started. If the Thrift server is ready, we assume that
         the switch was started successfully. This is only reliable if the Thrift
         server is started at the end of the init process.
+
+        Args:
+            timeout: seconds to wait for the Thrift server (defaults to start_timeout)
         """
-        while True:
-            if not os.path.exists(os.path.join("/proc", str(self.simple_switch_pid))):
-                return False
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(0.5)
-            result = sock.connect_ex(("localhost", self.thrift_port))
-            if result == 0:
-                return  True
+        if self.simple_switch_pid is None:
+            return False
+        if timeout is None:
+            timeout = self.start_timeout
+        started = wait_for_port(self.thrift_port, self.simple_switch_pid, timeout)
+        if started and self.startup_latency is None and self.start_time is not None:
+            self.startup_latency = time() - self.start_time
+        return started
 
     def start(self, controllers = None):
         """Start up a new P4 switch."""
@@ -198,19 +213,25 @@ class P4Switch(Switch):
         info(' '.join(args) + "\n")
 
         self.simple_switch_pid = None
+        self.startup_latency = None
+        self.start_time = time()
         with tempfile.NamedTemporaryFile() as f:
             self.cmd(' '.join(args) + ' 2>&1 & echo $! >> ' + f.name)
             self.simple_switch_pid = int(f.read())
         debug("P4 switch {} PID is {}.\n".format(self.name, self.simple_switch_pid))
-        sleep(1)
+        if not self.batch_startup:
+            self.wait_started()
+
+        # only do this for l3..
+        #self.cmd('sysctl', '-w', 'net.ipv4.ip_forward=1')
+
+    def wait_started(self):
+        """Wait until the switch launched by start() is ready, exit if it fails."""
         if not self.check_switch_started():
             error("P4 switch {} did not start correctly."
                   " Check the switch log file.\n".format(self.name))
             exit(1)
-        info("P4 switch {} has been started.\n".format(self.name))
-
-        # only do this for l3..
-        #self.cmd('sysctl', '-w', 'net.ipv4.ip_forward=1')
+        info("P4 switch {} has been started in {:.2f}s.\n".format(self.name, self.startup_latency))
 
 
     def stop_p4switch(self):
@@ -247,6 +268,7 @@ class P4RuntimeSwitch(P4Switch):
                  verbose = False,
                  device_id = None,
                  enable_debugger = False,
+                 start_timeout = SWITCH_START_TIMEOUT,
                  **kwargs):
         Switch.__init__(self, name, **kwargs)
         assert (sw_path)
@@ -287,14 +309,29 @@ class P4RuntimeSwitch(P4Switch):
             P4Switch.device_id += 1
         self.nanomsg = "ipc:///tmp/bm-{}-log.ipc".format(self.device_id)
 
+        self.simple_switch_pid = None
+        self.start_timeout = start_timeout
+        self.start_time = None
+        self.startup_latency = None
+        self.batch_startup = False
 
-    def check_switch_started(self, pid):
-        for _ in range(SWITCH_START_TIMEOUT * 2):
-            if not os.path.exists(os.path.join("/proc", str(pid))):
-                return False
-            if check_listening_on_port(self.grpc_port):
-                return True
-            sleep(0.5)
+    def check_switch_started(self, pid=None, timeout=None):
+        """Check if the switch gRPC server is up while its process is alive.
+
+        Args:
+            pid: switch process id (defaults to the last started process)
+            timeout: seconds to wait for the gRPC server (defaults to start_timeout)
+        """
+        if pid is None:
+            pid = self.simple_switch_pid
+        if pid is None:
+            return False
+        if timeout is None:
+            timeout = self.start_timeout
+        started = wait_for_port(self.grpc_port, pid, timeout)
+        if started and self.startup_latency is None and self.start_time is not None:
+            self.startup_latency = time() - self.start_time
+        return started
 
     def start(self, controllers):
         info("Starting P4 switch {}.\n".format(self.name))
@@ -323,13 +360,20 @@ class P4RuntimeSwitch(P4Switch):
         info(cmd + "\n")
 
         logfile = "/tmp/p4s.{}.log".format(self.name)
-        pid = None
+        self.simple_switch_pid = None
+        self.startup_latency = None
+        self.start_time = time()
         with tempfile.NamedTemporaryFile() as f:
             self.cmd(cmd + ' >' + logfile + ' 2>&1 & echo $! >> ' + f.name)
-            pid = int(f.read())
-        debug("P4 switch {} PID is {}.\n".format(self.name, pid))
-        if not self.check_switch_started(pid):
+            self.simple_switch_pid = int(f.read())
+        debug("P4 switch {} PID is {}.\n".format(self.name, self.simple_switch_pid))
+        if not self.batch_startup:
+            self.wait_started()
+
+    def wait_started(self):
+        """Wait until the switch launched by start() is ready, exit if it fails."""
+        if not self.check_switch_started():
             error("P4 switch {} did not start correctly.\n".format(self.name))
             exit(1)
-        info("P4 switch {} has been started.\n".format(self.name))
+        info("P4 switch {} has been started in {:.2f}s.\n".format(self.name, self.startup_latency))
 
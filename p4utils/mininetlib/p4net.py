@@ -1,4 +1,14 @@
+from sys import exit
+from time import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from mininet.net import Mininet
+from mininet.log import info, error
+
+from p4utils.utils.utils import run_node_scripts
+
+# maximum number of switches whose readiness is checked concurrently
+MAX_STARTUP_WORKERS = 64
 
 class P4Mininet(Mininet):
     """P4Mininet is the Mininet Class extended with P4 switches."""
@@ -18,36 +28,84 @@ class P4Mininet(Mininet):
                 self.p4switches.append(switch)
 
 
-    def start(self):
-        super(P4Mininet, self).start()
+    def wait_p4switches_started(self):
+        """Waits concurrently until all the P4 switches are ready.
 
-        hosts_mtu = 9500
-        # Trick to allow switches to add headers
-        # when packets have the max MTU
-        switches_mtu = 9520
+        Exits if any of them did not start correctly.
+        """
+        if not self.p4switches:
+            return
+        start = time()
+        pool = ThreadPool(min(len(self.p4switches), MAX_STARTUP_WORKERS))
+        try:
+            started = pool.map(lambda switch: switch.check_switch_started(), self.p4switches)
+        finally:
+            pool.close()
+            pool.join()
 
-        #remove Ipv6 for all the interfaces
-        for link in self.links:
-            cmd1 = "/sbin/ethtool --offload {0} rx off tx off sg off"
-            cmd2 = "sysctl net.ipv6.conf.{0}.disable_ipv6=1"
-            cmd3 = "ip link set {} mtu {}"
+        failed = [switch.name for switch, ok in zip(self.p4switches, started) if not ok]
+        if failed:
+            error("P4 switches {} did not start correctly."
+                  " Check the switch log files.\n".format(", ".join(failed)))
+            exit(1)
 
-            #execute the ethtool command to remove some offloads
-            link.intf1.cmd(cmd1.format(link.intf1.name))
-            link.intf2.cmd(cmd1.format(link.intf2.name))
+        slowest = max(self.p4switches, key=lambda switch: switch.startup_latency)
+        info("{} P4 switches have been started in {:.2f}s (slowest: {} in {:.2f}s).\n".format(
+            len(self.p4switches), time() - start, slowest.name, slowest.startup_latency))
 
-            #remove ipv6
-            link.intf1.cmd(cmd2.format(link.intf1.name))
-            link.intf2.cmd(cmd2.format(link.intf2.name))
+    def start(self):
+        # launch all the P4 switch processes first and then wait for all of
+        # them at once, so bring-up time follows the slowest switch
+        for switch in self.p4switches:
+            switch.batch_startup = True
+        try:
+            super(P4Mininet, self).start()
+        finally:
+            for switch in self.p4switches:
+                switch.batch_startup = False
+        self.wait_p4switches_started()
 
-            #increase mtu to 9500 (jumbo frames) for switches we do it special
-            node1_is_host = link.intf1.node in self.hosts
-            node2_is_host = link.intf2.node in self.hosts
+        self.configure_interfaces()
 
-            if node1_is_host or node2_is_host:
+    def configure_interfaces(self, hosts_mtu=9500, switches_mtu=9520):
+        """Disables offloads and IPv6 and sets the MTU of every link interface.
+
+        All the settings of a node are applied by a single script, and the
+        scripts of all the nodes run in parallel.
+
+        Args:
+            hosts_mtu: MTU of the links that have a host at one end
+            switches_mtu: MTU of switch to switch links. Slightly bigger than
+                          hosts_mtu, a trick to allow switches to add headers
+                          when packets have the max MTU
+        """
+        start = time()
+        hosts = set(self.hosts)
+        # node -> [(interface name, mtu)]
+        node_intfs = OrderedDict()
+        for link in self.links:
+            #increase mtu to 9500 (jumbo frames) for switches we do it special
+            if link.intf1.node in hosts or link.intf2.node in hosts:
                 mtu = hosts_mtu
             else:
                 mtu = switches_mtu
+            for intf in (link.intf1, link.intf2):
+                node_intfs.setdefault(intf.node, []).append((intf.name, mtu))
+
+        node_scripts = OrderedDict()
+        for node, intfs in node_intfs.items():
+            script = []
+            #execute the ethtool command to remove some offloads
+            for name, _ in intfs:
+                script.append("/sbin/ethtool --offload {0} rx off tx off sg off".format(name))
+            #remove ipv6
+            script.append("sysctl -q -w " + " ".join(
+                "net.ipv6.conf.{0}.disable_ipv6=1".format(name) for name, _ in intfs))
+            script.append("ip -force -batch - <<EOF")
+            script.extend("link set dev {0} mtu {1}".format(name, mtu) for name, mtu in intfs)
+            script.append("EOF")
+            node_scripts[node] = script
 
-            link.intf1.cmd(cmd3.format(link.intf1.name, mtu))
-            link.intf2.cmd(cmd3.format(link.intf2.name, mtu))
\ No newline at end of file
+        run_node_scripts(node_scripts)
+        info("*** Configured {} interfaces of {} nodes in {:.2f}s\n".format(
+            sum(len(intfs) for intfs in node_intfs.values()), len(node_intfs), time() - start))
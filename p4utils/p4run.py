@@ -30,12 +30,12 @@ from ipaddress import ip_interface
 
 from p4utils import *
 from p4utils.mininetlib.p4net import P4Mininet
-from p4utils.mininetlib.p4_mininet import P4Switch, P4Host, P4RuntimeSwitch, configureP4Switch
+from p4utils.mininetlib.p4_mininet import P4Switch, P4Host, P4RuntimeSwitch, configureP4Switch, SWITCH_START_TIMEOUT
 from p4utils.utils.topology import Topology as DefaultTopoDB
 from p4utils.mininetlib.cli import P4CLI
 from p4utils.mininetlib.apptopo import AppTopoStrategies as DefaultTopo
 from p4utils.mininetlib.appcontroller import AppController as DefaultController
-from p4utils.utils.utils import run_command,compile_all_p4, load_conf, CompilationError, read_entries, add_entries, cleanup
+from p4utils.utils.utils import run_command,compile_all_p4, load_conf, CompilationError, read_entries, add_entries, cleanup, run_node_scripts
 
 from p4utils.mininetlib.link import TCLink
 from mininet.log import setLogLevel, info
@@ -272,7 +272,8 @@ class AppRunner(object):
         # TODO: this should not be for the entire net, we should support non p4 switches
         switchClass = configureP4Switch(sw_path=self.bmv2_exe,
                                         log_console=self.log_enabled,
-                                        pcap_dump=self.pcap_dump, pcap_dir= self.pcap_dir)
+                                        pcap_dump=self.pcap_dump, pcap_dir= self.pcap_dir,
+                                        start_timeout=self.conf.get('switch_start_timeout', SWITCH_START_TIMEOUT))
 
         # start P4 Mininet
         self.net = self.app_mininet(topo=self.topo,
@@ -304,13 +305,28 @@ class AppRunner(object):
     def program_hosts(self):
         """Adds static ARP entries and default routes to each mininet host.
 
+        Hosts are bucketed by subnet once, so finding the neighbors of a host
+        is a dictionary lookup. The ARP entries of each host are installed by
+        a single `ip -batch` call, and all the hosts are programmed in parallel.
+
         Assumes:
             A mininet instance is stored as self.net and self.net.start() has been called.
         """
         topology = self.conf.get('topology')
         auto_arp_tables = topology.get('auto_arp_tables', True)
         auto_gw_arp = topology.get('auto_gw_arp', True)
-
+        hosts_info = self.topo.hosts_info
+
+        # subnet -> [(host name, ip, mac)]
+        subnets = {}
+        if auto_arp_tables:
+            for host_name in self.topo.hosts():
+                host_info = hosts_info[host_name]
+                network = ip_interface(unicode("%s/%d" % (host_info['ip'], host_info['mask']))).network
+                subnets.setdefault(network, []).append((host_name, host_info['ip'], host_info['mac']))
+
+        host_scripts = {}
+        dhcp_hosts = []
         for host_name in self.topo.hosts():
             h = self.net.get(host_name)
 
@@ -318,34 +334,42 @@ class AppRunner(object):
             # mininet cannot shutdown gracefully
             h_iface = h.intfs.values()[0]
 
+            # (ip, mac) entries to add to the host arp table
+            arp_entries = []
+
             # if there is gateway assigned
             if auto_gw_arp:
                 if 'defaultRoute' in h.params:
                     link = h_iface.link
                     sw_iface = link.intf1 if link.intf1 != h_iface else link.intf2
                     gw_ip = h.params['defaultRoute'].split()[-1]
-                    h.cmd('arp -i %s -s %s %s' % (h_iface.name, gw_ip, sw_iface.mac))
+                    arp_entries.append((gw_ip, sw_iface.mac))
 
             if auto_arp_tables:
                 # set arp rules for all the hosts in the same subnet
-                host_address = ip_interface(u"%s/%d" % (h.IP(), self.topo.hosts_info[host_name]["mask"]))
-                for hosts_same_subnet in self.topo.hosts():
-                    if hosts_same_subnet == host_name:
-                        continue
-
-                    #check if same subnet
-                    other_host_address = ip_interface(unicode("%s/%d" % (self.topo.hosts_info[hosts_same_subnet]['ip'],
-                                                        self.topo.hosts_info[hosts_same_subnet]["mask"])))
-
-                    if host_address.network.compressed == other_host_address.network.compressed:
-                            h.cmd('arp -i %s -s %s %s' % (h_iface.name, self.topo.hosts_info[hosts_same_subnet]['ip'],
-                                                          self.topo.hosts_info[hosts_same_subnet]['mac']))
+                host_address = ip_interface(u"%s/%d" % (h.IP(), hosts_info[host_name]["mask"]))
+                for other_host, other_ip, other_mac in subnets.get(host_address.network, []):
+                    if other_host != host_name:
+                        arp_entries.append((other_ip, other_mac))
+
+            if arp_entries:
+                script = ["ip -force -batch - <<EOF"]
+                script.extend("neigh replace %s lladdr %s dev %s nud permanent" % (ip, mac, h_iface.name)
+                              for ip, mac in arp_entries)
+                script.append("EOF")
+                host_scripts[h] = script
 
             # if the host is configured to use dhcp
             auto_ip = topology["hosts"][host_name].pop("auto", None)
             if auto_ip:
-                h.cmd('dhclient -r %s' % h_iface.name)
-                h.cmd('dhclient %s &' % h_iface.name)
+                dhcp_hosts.append(h)
+
+        run_node_scripts(host_scripts)
+
+        for h in dhcp_hosts:
+            h_iface = h.intfs.values()[0]
+            h.cmd('dhclient -r %s' % h_iface.name)
+            h.cmd('dhclient %s &' % h_iface.name)
 
 
     def save_topology(self):
@@ -0,0 +1,176 @@
+"""Asynchronous front-end for RuntimeAPI/SimpleSwitchAPI objects.
+
+Thrift calls are blocking, so every switch gets a worker thread that runs
+the calls made through its `AsyncSwitchAPI` in order, and calls return
+futures instead of results. With an asyncio event loop (trollius on python
+2) the futures can be awaited/yielded from and gathered:
+
+    controllers = AsyncControllers(SimpleSwitchAPI, {"s1": 9090, "s2": 9091})
+    futures = controllers.call_all("counter_read", "port_counter", 0)
+    results = yield From(asyncio.gather(*futures.values()))
+
+Without an event loop they are `concurrent.futures` futures.
+
+Requires the `futures` backport on python 2 (and `trollius` for the event
+loop), see the `async` extra of the package.
+"""
+
+import threading
+from Queue import Queue, Full
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+# maximum number of calls queued per switch
+MAX_PENDING_CALLS = 1024
+
+class SwitchBusyError(Exception):
+    """The worker of a switch already has max_pending calls queued."""
+    pass
+
+class SwitchWorker(object):
+    """Thread running the calls made on one API object, in order.
+
+    Attributes:
+        api: RuntimeAPI/SimpleSwitchAPI object the calls are made on
+        max_pending: maximum number of queued calls, submit blocks beyond it
+    """
+
+    _STOP = object()
+
+    def __init__(self, api, max_pending=MAX_PENDING_CALLS, name=None):
+        if Future is None:
+            raise ImportError("AsyncSwitchAPI needs concurrent.futures, "
+                              "install the futures package (p4utils[async])")
+        self.api = api
+        self.max_pending = max_pending
+        self.queue = Queue(max_pending)
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                return
+            future, method_name, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(getattr(self.api, method_name)(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, method_name, *args, **kwargs):
+        """Queues a call, returns its concurrent.futures.Future.
+
+        Blocks while max_pending calls are queued.
+        """
+        future = Future()
+        self.queue.put((future, method_name, args, kwargs))
+        return future
+
+    def submit_nowait(self, method_name, *args, **kwargs):
+        """Queues a call without blocking, returns its concurrent.futures.Future.
+
+        If max_pending calls are queued, the future fails with SwitchBusyError.
+        """
+        future = Future()
+        try:
+            self.queue.put_nowait((future, method_name, args, kwargs))
+        except Full:
+            future.set_exception(SwitchBusyError(
+                "%d calls are already queued" % self.max_pending))
+        return future
+
+    def stop(self):
+        """Stops the worker once the queued calls are done."""
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+class AsyncSwitchAPI(object):
+    """Asynchronous proxy of a RuntimeAPI/SimpleSwitchAPI object.
+
+    Any method of the API can be called on the proxy, the call returns a
+    future of its result. Use a SILENT output policy to get errors as
+    exceptions set on the futures.
+
+    With an event loop, calls never block the loop: when max_pending calls
+    are queued the returned future fails with SwitchBusyError. Without one,
+    callers block until the queue has room.
+
+    Attributes:
+        api: wrapped API object
+        loop: asyncio event loop the futures are bound to, None to get
+              concurrent.futures futures
+    """
+
+    def __init__(self, api, loop=None, max_pending=MAX_PENDING_CALLS):
+        self.api = api
+        self.loop = loop
+        self.worker = SwitchWorker(api, max_pending)
+
+    def submit(self, method_name, *args, **kwargs):
+        """Calls an API method in the worker, returns a future."""
+        if self.loop is not None:
+            future = self.worker.submit_nowait(method_name, *args, **kwargs)
+            return asyncio.wrap_future(future, loop=self.loop)
+        return self.worker.submit(method_name, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.api, name)):
+            raise AttributeError(name)
+        def call(*args, **kwargs):
+            return self.submit(name, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+    def close(self):
+        self.worker.stop()
+
+class AsyncControllers(object):
+    """Asynchronous API objects for a set of switches.
+
+    Attributes:
+        controllers: dict mapping switch names to AsyncSwitchAPI objects
+    """
+
+    def __init__(self, api_cls, thrift_ports, thrift_ip='localhost', loop=None,
+                 max_pending=MAX_PENDING_CALLS, **api_kwargs):
+        """Creates an API object per switch.
+
+        Args:
+            api_cls: RuntimeAPI subclass, e.g. SimpleSwitchAPI
+            thrift_ports: dict mapping switch names to thrift ports
+            thrift_ip: ip of the thrift servers
+            loop: asyncio event loop, None to get concurrent.futures futures
+            max_pending: maximum number of queued calls per switch
+            api_kwargs: extra arguments for api_cls (e.g. output, json_path)
+        """
+        self.controllers = {}
+        for sw_name, thrift_port in thrift_ports.items():
+            api = api_cls(thrift_port, thrift_ip, **api_kwargs)
+            self.controllers[sw_name] = AsyncSwitchAPI(api, loop, max_pending)
+
+    def __getitem__(self, sw_name):
+        return self.controllers[sw_name]
+
+    def call_all(self, method_name, *args, **kwargs):
+        """Calls a method on every switch, returns a dict of futures by switch name."""
+        return dict((sw_name, controller.submit(method_name, *args, **kwargs))
+                    for sw_name, controller in self.controllers.items())
+
+    def close(self):
+        for controller in self.controllers.values():
+            controller.close()
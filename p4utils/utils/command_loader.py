@@ -0,0 +1,293 @@
+"""Native loader for simple_switch_CLI command files (`cli_input`).
+
+Command lines are parsed in-process and mapped onto `SimpleSwitchAPI`
+calls, instead of being piped through a `simple_switch_CLI` subprocess.
+With the SILENT output policy, failing commands report the typed exception
+they raised.
+
+Files are read lazily, and runs of consecutive `table_add` commands on the
+same table are sent as one pipelined `table_add_many` batch, so large files
+are loaded at the speed of the switch.
+
+Example:
+    from p4utils.utils.runtime_API import OutputPolicy
+    from p4utils.utils.sswitch_API import SimpleSwitchAPI
+    from p4utils.utils.command_loader import load_command_file
+
+    controller = SimpleSwitchAPI(9090, output=OutputPolicy.SILENT)
+    for result in load_command_file(controller, "s1-commands.txt"):
+        if result.error:
+            print result
+"""
+
+import shlex
+
+from p4utils.utils.runtime_API import ResType, MatchType
+
+# maximum number of consecutive table_add commands sent as one batch
+MAX_BATCH_SIZE = 4096
+
+class CommandError(Exception):
+    """Error found while parsing a command line."""
+    pass
+
+class CommandResult(object):
+    """Outcome of one command.
+
+    Attributes:
+        line_number: line of the command in its file (starting at 1)
+        line: command line as found in the file
+        command: name of the command (e.g. table_add)
+        value: value returned by the API call
+        error: exception raised while parsing or running the command, if any
+    """
+
+    def __init__(self, line_number, line, command=None, value=None, error=None):
+        self.line_number = line_number
+        self.line = line
+        self.command = command
+        self.value = value
+        self.error = error
+
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.error is not None:
+            return "line %d: %s -> error: %s" % (self.line_number, self.line, self.error)
+        return "line %d: %s -> %s" % (self.line_number, self.line, self.value)
+
+def _split_on(args, separator):
+    """Splits args into the tokens before and after separator."""
+    if separator in args:
+        idx = args.index(separator)
+        return args[:idx], args[idx + 1:]
+    return args, []
+
+def _check_num_args(command, args, minimum, maximum=None):
+    if len(args) < minimum or (maximum is not None and len(args) > maximum):
+        raise CommandError("Wrong number of arguments for %s" % command)
+
+def _parse_table_add(api, args):
+    _check_num_args("table_add", args, 2)
+    table_name, action_name = args[0], args[1]
+    match_keys, action_params = _split_on(args[2:], "=>")
+    prio = None
+    table = api.get_res("table", table_name, ResType.table)
+    if table.match_type in {MatchType.TERNARY, MatchType.RANGE}:
+        if not action_params:
+            raise CommandError("Table %s is ternary, but no priority was given" % table_name)
+        prio = action_params.pop(-1)
+    return "table_add", (table_name, action_name, match_keys, action_params, prio)
+
+def _parse_table_set_default(api, args):
+    _check_num_args("table_set_default", args, 2)
+    return "table_set_default", (args[0], args[1], args[2:])
+
+def _parse_table_modify(api, args):
+    _check_num_args("table_modify", args, 3)
+    action_params = args[3:]
+    if action_params and action_params[0] == "=>":
+        action_params = action_params[1:]
+    return "table_modify", (args[0], args[1], args[2], action_params)
+
+def _parse_mc_node_create(api, args):
+    _check_num_args("mc_node_create", args, 1)
+    ports, lags = _split_on(args[1:], "|")
+    return "mc_node_create", (args[0], ports, lags)
+
+def _parse_mc_node_update(api, args):
+    _check_num_args("mc_node_update", args, 1)
+    ports, lags = _split_on(args[1:], "|")
+    return "mc_node_update", (args[0], ports, lags)
+
+def _parse_mc_set_lag_membership(api, args):
+    _check_num_args("mc_set_lag_membership", args, 1)
+    return "mc_set_lag_membership", (args[0], args[1:])
+
+def _parse_meter_array_set_rates(api, args):
+    _check_num_args("meter_array_set_rates", args, 1)
+    return "meter_array_set_rates", (args[0], args[1:])
+
+def _parse_meter_set_rates(api, args):
+    _check_num_args("meter_set_rates", args, 2)
+    return "meter_set_rates", (args[0], args[1], args[2:])
+
+def _parse_act_prof_create_member(api, args):
+    _check_num_args("act_prof_create_member", args, 2)
+    return "act_prof_create_member", (args[0], args[1], args[2:])
+
+def _positional(command, minimum, maximum=None):
+    """Parser for commands whose tokens map one to one to API arguments."""
+    def parse(api, args):
+        _check_num_args(command, args, minimum, maximum if maximum is not None else minimum)
+        return command, tuple(args)
+    return parse
+
+COMMAND_PARSERS = {
+    "table_add": _parse_table_add,
+    "table_set_default": _parse_table_set_default,
+    "table_modify": _parse_table_modify,
+    "table_reset_default": _positional("table_reset_default", 1),
+    "table_delete": _positional("table_delete", 2),
+    "table_clear": _positional("table_clear", 1),
+    "table_set_timeout": _positional("table_set_timeout", 3),
+    "act_prof_create_member": _parse_act_prof_create_member,
+    "act_prof_create_group": _positional("act_prof_create_group", 1),
+    "act_prof_add_member_to_group": _positional("act_prof_add_member_to_group", 3),
+    "mc_mgrp_create": _positional("mc_mgrp_create", 1),
+    "mc_mgrp_destroy": _positional("mc_mgrp_destroy", 1),
+    "mc_node_create": _parse_mc_node_create,
+    "mc_node_update": _parse_mc_node_update,
+    "mc_node_associate": _positional("mc_node_associate", 2),
+    "mc_node_dissociate": _positional("mc_node_dissociate", 2),
+    "mc_node_destroy": _positional("mc_node_destroy", 1),
+    "mc_set_lag_membership": _parse_mc_set_lag_membership,
+    "meter_array_set_rates": _parse_meter_array_set_rates,
+    "meter_set_rates": _parse_meter_set_rates,
+    "counter_reset": _positional("counter_reset", 1),
+    "counter_write": _positional("counter_write", 4),
+    "register_write": _positional("register_write", 3),
+    "register_reset": _positional("register_reset", 1),
+    "mirroring_add": _positional("mirroring_add", 2),
+    "mirroring_add_mc": _positional("mirroring_add_mc", 2),
+    "mirroring_add_port_and_mgrp": _positional("mirroring_add_port_and_mgrp", 3),
+    "mirroring_delete": _positional("mirroring_delete", 1),
+    "set_queue_depth": _positional("set_queue_depth", 1, 2),
+    "set_queue_rate": _positional("set_queue_rate", 1, 2),
+}
+
+def parse_command(api, line):
+    """Parses a command line into an API method name and its arguments.
+
+    Args:
+        api: RuntimeAPI object, used to look up table properties
+        line: command line (without comments)
+
+    Returns:
+        (method name, tuple of arguments)
+
+    Raises:
+        CommandError: if the command is unknown or malformed
+    """
+    # shlex is slow, only lines with quotes need it
+    if '"' in line or "'" in line:
+        try:
+            tokens = shlex.split(line)
+        except ValueError as e:
+            raise CommandError(str(e))
+    else:
+        tokens = line.split()
+    command, args = tokens[0], tokens[1:]
+    parser = COMMAND_PARSERS.get(command, None)
+    if parser is None:
+        raise CommandError("Unknown command %s" % command)
+    return parser(api, args)
+
+def iter_command_lines(lines):
+    """Yields (line number, command line) for every non empty, non comment line."""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield line_number, line
+
+def run_table_add_batch(api, batch):
+    """Runs consecutive table_add commands on the same table as one table_add_many call.
+
+    Args:
+        api: RuntimeAPI or SimpleSwitchAPI object
+        batch: list of (CommandResult, table_add arguments), results are
+               filled in with the entry handles or the errors
+    """
+    table_name = batch[0][1][0]
+    entries = [(action_name, match_keys, action_params, prio)
+               for _, (_, action_name, match_keys, action_params, prio) in batch]
+    try:
+        bulk_result = api.table_add_many(table_name, entries)
+        if bulk_result is None:
+            # with the PRINT output policy, errors are printed and None returned
+            raise CommandError("table_add_many failed on table %s" % table_name)
+    except Exception as e:
+        for result, _ in batch:
+            result.error = e
+        return
+    for idx, (result, _) in enumerate(batch):
+        if idx in bulk_result.errors:
+            result.error = bulk_result.errors[idx]
+        else:
+            result.value = bulk_result.handles[idx]
+
+def iter_commands(api, lines, batch_size=MAX_BATCH_SIZE):
+    """Runs command lines against a RuntimeAPI/SimpleSwitchAPI object, lazily.
+
+    Lines are consumed as they are needed. Consecutive table_add commands on
+    the same table are batched, other commands run one by one, in order.
+
+    Args:
+        api: RuntimeAPI or SimpleSwitchAPI object
+        lines: iterable of command lines (e.g. an open file)
+        batch_size: maximum number of table_add commands per batch, 1 to
+                    disable batching
+
+    Yields:
+        CommandResult, one per command, in file order
+    """
+    # results not yielded yet, and the table_add commands among them
+    pending = []
+    batch = []
+    for line_number, line in iter_command_lines(lines):
+        result = CommandResult(line_number, line)
+        try:
+            result.command, args = parse_command(api, line)
+        except Exception as e:
+            # nothing runs for this line, the batch can go on
+            result.error = e
+            pending.append(result)
+            continue
+
+        if result.command == "table_add" and batch_size > 1:
+            if batch and (batch[0][1][0] != args[0] or len(batch) == batch_size):
+                run_table_add_batch(api, batch)
+                for done in pending:
+                    yield done
+                pending = []
+                batch = []
+            batch.append((result, args))
+            pending.append(result)
+            continue
+
+        if batch:
+            run_table_add_batch(api, batch)
+            batch = []
+        for done in pending:
+            yield done
+        pending = []
+        try:
+            result.value = getattr(api, result.command)(*args)
+        except Exception as e:
+            result.error = e
+        yield result
+
+    if batch:
+        run_table_add_batch(api, batch)
+    for done in pending:
+        yield done
+
+def load_commands(api, lines, batch_size=MAX_BATCH_SIZE):
+    """Runs command lines against a RuntimeAPI/SimpleSwitchAPI object.
+
+    Args:
+        api: RuntimeAPI or SimpleSwitchAPI object
+        lines: iterable of command lines
+        batch_size: maximum number of table_add commands per batch, see iter_commands
+
+    Returns:
+        list of CommandResult, one per command
+    """
+    return list(iter_commands(api, lines, batch_size))
+
+def load_command_file(api, path, batch_size=MAX_BATCH_SIZE):
+    """Runs a simple_switch_CLI command file. See load_commands."""
+    with open(path, "r") as f:
+        return load_commands(api, f, batch_size)
@@ -0,0 +1,192 @@
+"""Content-addressed cache for compiled P4 programs.
+
+Entries are keyed by a hash of the main P4 file, every file it (transitively)
+includes (see include_graph), the compiler version and the compiler options.
+A cache hit copies the cached compiler outputs next to the program instead of
+running the compiler again.
+"""
+
+import os
+import shlex
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from distutils.spawn import find_executable
+
+from mininet import log
+
+from p4utils.utils.include_graph import IncludeGraph
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "p4utils", "compile")
+
+# extensions of the files the compiler writes next to its JSON output
+OUTPUT_EXTENSIONS = (".json", ".p4i", ".p4rt")
+
+class CompileCache(object):
+    """On-disk cache of compiler outputs.
+
+    Every entry is a directory named after the job key, holding the cached
+    artifacts and a MANIFEST file listing where each artifact has to be
+    restored, relative to the compiler output directory.
+
+    Attributes:
+        cache_dir: directory where entries are stored
+    """
+
+    MANIFEST = "MANIFEST"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def compiler_version(self, compiler):
+        """Returns a string identifying the compiler binary (memoized)."""
+        with self._lock:
+            if compiler in self._versions:
+                return self._versions[compiler]
+
+        path = find_executable(compiler) or compiler
+        try:
+            p = subprocess.Popen([path, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = p.communicate()
+            version = stdout + stderr
+        except OSError:
+            version = "unknown"
+        if os.path.exists(path):
+            version += "%s:%d:%d" % (path, os.path.getmtime(path), os.path.getsize(path))
+
+        with self._lock:
+            self._versions[compiler] = version
+        return version
+
+    def job_key(self, job):
+        """Returns the cache key of a CompilationJob, None if it can not be cached."""
+        program = os.path.realpath(job.program)
+        try:
+            includes = IncludeGraph.from_options(job.options).dependencies(program)
+        except IOError as e:
+            log.debug("%s: not using the compilation cache (%s)\n" % (job.program, e))
+            return None
+
+        h = hashlib.sha256()
+        h.update("compiler\0%s\0%s\0" % (job.compiler, self.compiler_version(job.compiler)))
+        h.update("options\0%s\0" % (job.options or ""))
+        h.update("program\0%s\0" % os.path.basename(program))
+        with open(program, "rb") as f:
+            h.update(f.read())
+        base_dir = os.path.dirname(program)
+        for include in sorted(includes):
+            h.update("\0include\0%s\0" % os.path.relpath(include, base_dir))
+            with open(include, "rb") as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    @staticmethod
+    def output_dir(job):
+        return os.path.dirname(os.path.realpath(job.output_file))
+
+    @staticmethod
+    def extra_outputs(job):
+        """Returns files written by the compiler because of its options (e.g. p4info)."""
+        outputs = []
+        try:
+            args = shlex.split(job.options or "")
+        except ValueError:
+            return outputs
+        for i, arg in enumerate(args):
+            value = None
+            if arg in ("--p4runtime-file", "--p4runtime-files") and i + 1 < len(args):
+                value = args[i + 1]
+            elif arg.startswith("--p4runtime-file=") or arg.startswith("--p4runtime-files="):
+                value = arg.split("=", 1)[1]
+            if value:
+                outputs.extend(x for x in value.split(",") if x)
+        return outputs
+
+    def restore(self, job, key):
+        """Copies the cached outputs of job into place.
+
+        Args:
+            job: CompilationJob to restore
+            key: cache key of the job (see job_key)
+
+        Returns:
+            True on a cache hit, False otherwise
+        """
+        if key is None:
+            return False
+        entry = os.path.join(self.cache_dir, key)
+        manifest = os.path.join(entry, self.MANIFEST)
+        if not os.path.isfile(manifest):
+            return False
+
+        output_dir = self.output_dir(job)
+        with open(manifest, "r") as f:
+            artifacts = [line.rstrip("\n").split("\t", 1) for line in f if line.strip()]
+        try:
+            for cached_name, destination in artifacts:
+                destination = os.path.join(output_dir, destination)
+                shutil.copyfile(os.path.join(entry, cached_name), destination)
+        except (IOError, OSError, ValueError) as e:
+            log.warn("Ignoring broken compilation cache entry %s (%s)\n" % (entry, e))
+            return False
+        return True
+
+    def store(self, job, key, start_time):
+        """Stores the outputs of a successful job.
+
+        Args:
+            job: finished CompilationJob
+            key: cache key computed before the compiler was started
+            start_time: time at which the compiler was started, outputs
+                        modified before it are not cached (nothing is cached
+                        if one of the files named in the options is stale)
+        """
+        if key is None:
+            return
+
+        output_dir = self.output_dir(job)
+        base = os.path.splitext(os.path.basename(job.output_file))[0]
+        program = os.path.realpath(job.program)
+
+        # only the exact output names, other jobs may write files sharing
+        # the same prefix (e.g. foo.json and foo_v2.json) at the same time
+        def fresh(path):
+            return os.path.isfile(path) and os.path.getmtime(path) >= int(start_time)
+
+        artifacts = set()
+        for extension in OUTPUT_EXTENSIONS:
+            path = os.path.join(output_dir, base + extension)
+            if path != program and fresh(path):
+                artifacts.add(path)
+        if os.path.realpath(job.output_file) not in artifacts:
+            return
+        for path in self.extra_outputs(job):
+            if not fresh(path):
+                # a stale file from an earlier build would be restored on every hit
+                log.debug("%s: not caching the outputs, %s was not written\n" % (job.program, path))
+                return
+            artifacts.add(os.path.realpath(path))
+
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        tmp_entry = None
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            tmp_entry = tempfile.mkdtemp(dir=self.cache_dir)
+            with open(os.path.join(tmp_entry, self.MANIFEST), "w") as manifest:
+                for i, path in enumerate(sorted(artifacts)):
+                    cached_name = "%d-%s" % (i, os.path.basename(path))
+                    shutil.copyfile(path, os.path.join(tmp_entry, cached_name))
+                    manifest.write("%s\t%s\n" % (cached_name, os.path.relpath(path, output_dir)))
+            # make the entry visible atomically
+            os.rename(tmp_entry, entry)
+        except (IOError, OSError) as e:
+            log.warn("Could not store %s in the compilation cache (%s)\n" % (job.program, e))
+            if tmp_entry and os.path.isdir(tmp_entry):
+                shutil.rmtree(tmp_entry, ignore_errors=True)
@@ -0,0 +1,150 @@
+"""Dependency graph of P4 source files.
+
+Resolves `#include` directives the way the compiler preprocessor does:
+quoted includes are searched relative to the including file and then in the
+`-I` directories, angle-bracket includes only in the `-I` directories
+(anything else is assumed to be a compiler system header, e.g. core.p4).
+
+Parsed files are memoized by (path, mtime), so stale/fresh checks on an
+unchanged tree only stat the files.
+"""
+
+import os
+import re
+import shlex
+import threading
+
+_INCLUDE_RE = re.compile(r'^\s*#\s*include\s+(?:"([^"]+)"|<([^>]+)>)')
+
+# realpath -> (mtime, [(is_quoted, name), ...])
+_parsed_files = {}
+_parsed_files_lock = threading.Lock()
+
+class MissingIncludeError(IOError):
+
+    def __init__(self, include, including_file):
+        self.include = include
+        self.including_file = including_file
+        super(MissingIncludeError, self).__init__(
+            "File %s included from %s does not exist" % (include, including_file))
+
+def parse_includes(path):
+    """Returns the include directives of a file as (is_quoted, name) tuples.
+
+    Results are memoized by (path, mtime).
+    """
+    path = os.path.realpath(path)
+    mtime = os.path.getmtime(path)
+    with _parsed_files_lock:
+        cached = _parsed_files.get(path, None)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    includes = []
+    with open(path, "r") as f:
+        for line in f:
+            match = _INCLUDE_RE.match(line)
+            if match:
+                quoted, angled = match.groups()
+                includes.append((quoted is not None, quoted or angled))
+
+    with _parsed_files_lock:
+        _parsed_files[path] = (mtime, includes)
+    return includes
+
+def include_paths_from_options(options, cwd=None):
+    """Extracts the -I directories from a compiler options string.
+
+    Args:
+        options: compiler options string
+        cwd: directory relative paths are resolved from (defaults to the
+             current directory, where the compiler runs)
+
+    Returns:
+        list of absolute directories, in command line order
+    """
+    if not options:
+        return []
+    if cwd is None:
+        cwd = os.getcwd()
+    try:
+        args = shlex.split(options)
+    except ValueError:
+        args = options.split()
+
+    paths = []
+    for i, arg in enumerate(args):
+        if arg == "-I" and i + 1 < len(args):
+            paths.append(args[i + 1])
+        elif arg.startswith("-I") and len(arg) > 2:
+            paths.append(arg[2:])
+    return [os.path.realpath(os.path.join(cwd, p)) for p in paths]
+
+class IncludeGraph(object):
+    """Include dependency graph of a set of P4 programs.
+
+    Attributes:
+        include_paths: directories searched for includes (the -I options)
+    """
+
+    def __init__(self, include_paths=None):
+        self.include_paths = list(include_paths or [])
+
+    @classmethod
+    def from_options(cls, options, cwd=None):
+        """Builds a graph using the -I directories of a compiler options string."""
+        return cls(include_paths_from_options(options, cwd))
+
+    def resolve(self, is_quoted, name, including_file):
+        """Returns the real path of an include, None if it is a system header.
+
+        Raises:
+            MissingIncludeError: if a quoted include can not be found
+        """
+        candidates = []
+        if is_quoted:
+            candidates.append(os.path.dirname(including_file))
+        candidates.extend(self.include_paths)
+        for directory in candidates:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return os.path.realpath(path)
+        if is_quoted:
+            raise MissingIncludeError(name, including_file)
+        return None
+
+    def graph(self, input_file):
+        """Returns the include graph reachable from input_file.
+
+        Returns:
+            dict mapping every file (real path) to the set of files it includes
+        """
+        root = os.path.realpath(input_file)
+        graph = {}
+        pending = [root]
+        while pending:
+            current = pending.pop()
+            if current in graph:
+                continue
+            edges = set()
+            for is_quoted, name in parse_includes(current):
+                include = self.resolve(is_quoted, name, current)
+                if include is not None:
+                    edges.add(include)
+                    if include not in graph:
+                        pending.append(include)
+            graph[current] = edges
+        return graph
+
+    def dependencies(self, input_file):
+        """Returns the set of files transitively included by input_file."""
+        root = os.path.realpath(input_file)
+        dependencies = set(self.graph(root))
+        dependencies.discard(root)
+        return dependencies
+
+    def last_modified(self, input_file):
+        """Returns the newest modification time of input_file and its dependencies."""
+        files = self.dependencies(input_file)
+        files.add(os.path.realpath(input_file))
+        return max(os.path.getmtime(f) for f in files)
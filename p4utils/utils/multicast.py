@@ -0,0 +1,327 @@
+"""Multicast (PRE) programming from a desired state.
+
+A `MulticastManager` keeps a local mirror of the multicast engine of a switch
+(groups, the L1 nodes associated to them with their rid, and the ports/lags
+of their L2 nodes), so reading it does not cost an RPC. Controllers describe
+the groups they want and `apply` sends only the operations needed to get
+there, pipelined per kind of operation:
+
+    manager = MulticastManager(controller)
+    manager.apply({1: [(0, [1, 2, 3])], 2: [(0, [1, 2]), (1, [4], [0])]},
+                  lags={0: [5, 6]})
+
+The mirror is read from the switch (`bm_mc_get_entries`) on first use and
+when `sync` is called. Changes made to the multicast engine by other means
+(e.g. the mc_* functions of RuntimeAPI) require a `sync`.
+"""
+
+import json
+import time
+
+from p4utils.utils.runtime_API import PreType, UIn_Error, PIPELINE_WINDOW, pipeline_calls
+from p4utils.utils.thrift_pool import CONNECTION_ERRORS
+
+def port_list(ports):
+    """Returns a sorted tuple of port (or lag) numbers without duplicates."""
+    try:
+        return tuple(sorted(set(int(port) for port in ports)))
+    except (TypeError, ValueError):
+        raise UIn_Error("Bad format for port list %r" % (ports,))
+
+def node_spec(node):
+    """Returns the (rid, ports, lags) tuple of a node given as (rid, ports) or (rid, ports, lags)."""
+    if len(node) == 2:
+        rid, ports = node
+        lags = ()
+    else:
+        rid, ports, lags = node
+    try:
+        rid = int(rid)
+    except (TypeError, ValueError):
+        raise UIn_Error("Bad format for rid")
+    return rid, port_list(ports), port_list(lags)
+
+class MulticastResult(object):
+    """Outcome of MulticastManager.apply.
+
+    Attributes:
+        operations: dict mapping operation names (e.g. node_create) to the
+                    number of successful calls
+        errors: list of (operation name, arguments, exception) tuples
+        elapsed: time taken, in seconds
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self.errors = []
+        self.elapsed = 0
+
+    def num_operations(self):
+        return sum(self.operations.values())
+
+    def __repr__(self):
+        done = ", ".join("%d %s" % (count, name) for name, count in sorted(self.operations.items()))
+        return "MulticastResult(%s; %d errors in %.3fs)" % (
+            done or "no changes", len(self.errors), self.elapsed)
+
+class MulticastManager(object):
+    """Indexed mirror of the multicast engine of a switch.
+
+    Attributes:
+        api: RuntimeAPI object of the switch
+        groups: dict mapping multicast group ids to the list of their L1 node handles
+        nodes: dict mapping L1 node handles to (rid, ports, lags) tuples
+        node_group: dict mapping L1 node handles to their group (None if not associated)
+        lags: dict mapping lag indexes to their ports
+        synced: False until the mirror has been read from the switch
+    """
+
+    def __init__(self, api):
+        api.check_has_pre()
+        self.api = api
+        self.groups = {}
+        self.nodes = {}
+        self.node_group = {}
+        self.lags = {}
+        self.synced = False
+
+    def sync(self):
+        """Reads the whole multicast engine state from the switch into the mirror."""
+        try:
+            mc_json = json.loads(self.api.mc_client.bm_mc_get_entries(0))
+        except ValueError:
+            raise UIn_Error("Exception when retrieving MC entries")
+
+        l2_nodes = {}
+        for h in mc_json["l2_handles"]:
+            l2_nodes[h["handle"]] = (port_list(h["ports"]), port_list(h.get("lags", [])))
+        self.nodes = {}
+        self.node_group = {}
+        for h in mc_json["l1_handles"]:
+            ports, lags = l2_nodes.get(h.get("l2_handle", None), ((), ()))
+            self.nodes[h["handle"]] = (h["rid"], ports, lags)
+            self.node_group[h["handle"]] = None
+        self.groups = {}
+        for mgrp in mc_json["mgrps"]:
+            self.groups[mgrp["id"]] = list(mgrp["l1_handles"])
+            for l1_hdl in mgrp["l1_handles"]:
+                self.node_group[l1_hdl] = mgrp["id"]
+        self.lags = dict((lag["id"], port_list(lag["ports"]))
+                         for lag in mc_json.get("lags", []))
+        self.synced = True
+
+    def check_synced(self):
+        if not self.synced:
+            self.sync()
+
+    def get_group(self, mgrp):
+        """Returns the (rid, ports, lags) nodes of a multicast group, None if it does not exist."""
+        self.check_synced()
+        l1_handles = self.groups.get(mgrp, None)
+        if l1_handles is None:
+            return None
+        return [self.nodes[l1_hdl] for l1_hdl in l1_handles]
+
+    def get_groups(self):
+        """Returns a dict mapping multicast group ids to their (rid, ports, lags) nodes."""
+        self.check_synced()
+        return dict((mgrp, [self.nodes[l1_hdl] for l1_hdl in l1_handles])
+                    for mgrp, l1_handles in self.groups.items())
+
+    def get_lags(self):
+        """Returns a dict mapping lag indexes to their ports."""
+        self.check_synced()
+        return dict(self.lags)
+
+    def diff_group(self, mgrp, specs):
+        """Computes the node operations turning a group into the given nodes.
+
+        Nodes equal to a wanted one are kept, nodes with the same rid as a
+        wanted one are updated, the others are removed and the missing ones
+        created.
+
+        Args:
+            mgrp: multicast group id
+            specs: list of wanted (rid, ports, lags) tuples
+
+        Returns:
+            (nodes to create, (l1 handle, spec) to update, l1 handles to remove)
+        """
+        # spec -> l1 handles and rid -> l1 handles of the nodes not matched yet
+        by_spec = {}
+        by_rid = {}
+        for l1_hdl in self.groups.get(mgrp, []):
+            by_spec.setdefault(self.nodes[l1_hdl], []).append(l1_hdl)
+        missing = []
+        for spec in specs:
+            if by_spec.get(spec):
+                by_spec[spec].pop(0)
+            else:
+                missing.append(spec)
+        for l1_handles in by_spec.values():
+            for l1_hdl in l1_handles:
+                by_rid.setdefault(self.nodes[l1_hdl][0], []).append(l1_hdl)
+
+        to_create = []
+        to_update = []
+        for spec in missing:
+            if by_rid.get(spec[0]):
+                to_update.append((by_rid[spec[0]].pop(0), spec))
+            else:
+                to_create.append(spec)
+        to_remove = [l1_hdl for l1_handles in by_rid.values() for l1_hdl in l1_handles]
+        return to_create, to_update, to_remove
+
+    def _map_strs(self, ports, lags):
+        port_map_str = self.api.ports_to_port_map_str(ports)
+        if self.api.pre_type == PreType.SimplePre:
+            if lags:
+                raise UIn_Error("Lags require the SimplePreLAG packet replication engine")
+            return (port_map_str,)
+        return port_map_str, self.api.ports_to_port_map_str(lags, description="lag")
+
+    def _run(self, result, operation, method_name, calls, items, window):
+        """Runs a pipeline of calls, returns the (item, reply) pairs of the successful ones."""
+        if not calls:
+            return []
+        done = []
+        replies = pipeline_calls(self.api.mc_client, method_name, calls, window)
+        for item, args, (value, e) in zip(items, calls, replies):
+            if e is not None:
+                result.errors.append((operation, args, e))
+            else:
+                result.operations[operation] = result.operations.get(operation, 0) + 1
+                done.append((item, value))
+        return done
+
+    def apply(self, groups, lags=None, prune=True, window=PIPELINE_WINDOW):
+        """Programs the multicast engine to match a desired state.
+
+        Args:
+            groups: dict mapping multicast group ids to lists of (rid, ports)
+                    or (rid, ports, lags) nodes
+            lags: dict mapping lag indexes to their ports (SimplePreLAG only),
+                  lags not in the dict are left as they are
+            prune: remove the groups (and their nodes) that are not in groups
+            window: maximum number of requests in flight
+
+        Returns:
+            MulticastResult
+        """
+        self.check_synced()
+        start = time.time()
+        result = MulticastResult()
+
+        desired = {}
+        for mgrp, nodes in groups.items():
+            desired[self.api.get_mgrp(mgrp)] = [node_spec(node) for node in nodes]
+        desired_lags = dict((int(lag), port_list(ports)) for lag, ports in (lags or {}).items())
+        if desired_lags and self.api.pre_type != PreType.SimplePreLAG:
+            raise UIn_Error("Lags require the SimplePreLAG packet replication engine")
+
+        to_create = []
+        to_update = []
+        to_remove = []
+        for mgrp, specs in desired.items():
+            group_create, group_update, group_remove = self.diff_group(mgrp, specs)
+            to_create.extend((mgrp, spec) for spec in group_create)
+            to_update.extend(group_update)
+            to_remove.extend((mgrp, l1_hdl) for l1_hdl in group_remove)
+        removed_groups = [mgrp for mgrp in self.groups if mgrp not in desired] if prune else []
+        for mgrp in removed_groups:
+            to_remove.extend((mgrp, l1_hdl) for l1_hdl in self.groups[mgrp])
+        new_groups = [mgrp for mgrp in desired if mgrp not in self.groups]
+        changed_lags = [(lag, ports) for lag, ports in sorted(desired_lags.items())
+                        if self.lags.get(lag, None) != ports]
+
+        create_calls = [(0, spec[0]) + self._map_strs(spec[1], spec[2]) for _, spec in to_create]
+        update_calls = [(0, l1_hdl) + self._map_strs(spec[1], spec[2]) for l1_hdl, spec in to_update]
+        lag_calls = [(0, lag, self.api.ports_to_port_map_str(ports, description="lag"))
+                     for lag, ports in changed_lags]
+
+        # hold the connection while the pipelines are in flight
+        with self.api.connection.lock:
+            try:
+                self._apply(result, to_create, create_calls, to_update, update_calls,
+                            to_remove, removed_groups, new_groups, changed_lags, lag_calls, window)
+            except CONNECTION_ERRORS:
+                # unread replies are left on the socket, and the state is unknown
+                self.api.connection.close()
+                self.synced = False
+                raise
+        result.elapsed = time.time() - start
+        return result
+
+    def _apply(self, result, to_create, create_calls, to_update, update_calls,
+               to_remove, removed_groups, new_groups, changed_lags, lag_calls, window):
+
+        dissociated = self._run(result, "node_dissociate", "bm_mc_node_dissociate",
+                                [(0, mgrp, l1_hdl) for mgrp, l1_hdl in to_remove],
+                                to_remove, window)
+        for (mgrp, l1_hdl), _ in dissociated:
+            self.groups[mgrp].remove(l1_hdl)
+            self.node_group[l1_hdl] = None
+
+        dissociated = [l1_hdl for (_, l1_hdl), _ in dissociated]
+        for l1_hdl, _ in self._run(result, "node_destroy", "bm_mc_node_destroy",
+                                   [(0, l1_hdl) for l1_hdl in dissociated],
+                                   dissociated, window):
+            del self.nodes[l1_hdl]
+            del self.node_group[l1_hdl]
+
+        for mgrp, _ in self._run(result, "mgrp_destroy", "bm_mc_mgrp_destroy",
+                                 [(0, mgrp) for mgrp in removed_groups],
+                                 removed_groups, window):
+            for l1_hdl in self.groups.pop(mgrp):
+                self.node_group[l1_hdl] = None
+
+        for mgrp, _ in self._run(result, "mgrp_create", "bm_mc_mgrp_create",
+                                 [(0, mgrp) for mgrp in new_groups],
+                                 new_groups, window):
+            self.groups[mgrp] = []
+
+        for (lag, ports), _ in self._run(result, "set_lag_membership", "bm_mc_set_lag_membership",
+                                         lag_calls, changed_lags, window):
+            self.lags[lag] = ports
+
+        # nodes of groups that could not be created would never be associated
+        creatable = [i for i, (mgrp, _) in enumerate(to_create) if mgrp in self.groups]
+        to_associate = []
+        for (mgrp, spec), l1_hdl in self._run(result, "node_create", "bm_mc_node_create",
+                                              [create_calls[i] for i in creatable],
+                                              [to_create[i] for i in creatable], window):
+            self.nodes[l1_hdl] = spec
+            self.node_group[l1_hdl] = None
+            to_associate.append((mgrp, l1_hdl))
+
+        for (l1_hdl, spec), _ in self._run(result, "node_update", "bm_mc_node_update",
+                                           update_calls, to_update, window):
+            self.nodes[l1_hdl] = spec
+
+        for (mgrp, l1_hdl), _ in self._run(result, "node_associate", "bm_mc_node_associate",
+                                           [(0, mgrp, l1_hdl) for mgrp, l1_hdl in to_associate],
+                                           to_associate, window):
+            self.groups[mgrp].append(l1_hdl)
+            self.node_group[l1_hdl] = mgrp
+
+        # do not leak the new nodes that could not be associated
+        orphans = [l1_hdl for _, l1_hdl in to_associate if self.node_group[l1_hdl] is None]
+        for l1_hdl, _ in self._run(result, "node_destroy", "bm_mc_node_destroy",
+                                   [(0, l1_hdl) for l1_hdl in orphans], orphans, window):
+            del self.nodes[l1_hdl]
+            del self.node_group[l1_hdl]
+
+        if result.errors:
+            # some calls failed, read the state back from the switch next time
+            self.synced = False
+
+    def set_group(self, mgrp, nodes, window=PIPELINE_WINDOW):
+        """Programs a single multicast group, leaving the other groups as they are."""
+        return self.apply({mgrp: nodes}, prune=False, window=window)
+
+    def remove_groups(self, mgrps, window=PIPELINE_WINDOW):
+        """Removes multicast groups and their nodes, leaving the other groups as they are."""
+        self.check_synced()
+        mgrps = set(self.api.get_mgrp(mgrp) for mgrp in mgrps)
+        keep = dict((mgrp, self.get_group(mgrp)) for mgrp in self.groups if mgrp not in mgrps)
+        return self.apply(keep, prune=True, window=window)
@@ -0,0 +1,330 @@
+"""Periodic sampling of register and counter arrays.
+
+A `Poller` takes a snapshot of the same register and counter arrays of every
+P4 switch of a topology at a fixed interval, and keeps the last `capacity`
+samples of every array in a ring buffer allocated up front:
+
+    poller = Poller(Topology("topology.db"), counters=["port_counter"], interval=1)
+    poller.start()
+    ...
+    timestamps, packets = poller.series("s1", "port_counter", index=2)
+    packet_rates = poller.rate("s1", "port_counter")
+    poller.stop()
+
+Memory use is fixed at start: capacity * array size * 8 bytes per register
+array, twice that per counter array (bytes and packets).
+"""
+
+import threading
+import time
+from array import array
+from multiprocessing.pool import ThreadPool
+
+from p4utils.utils.runtime_API import OutputPolicy, ResType
+from p4utils.utils.snapshots import np, array_delta, delta64, INT64_TYPECODE
+from p4utils.utils.sswitch_API import SimpleSwitchAPI
+
+# number of samples kept per array by default
+DEFAULT_CAPACITY = 3600
+# maximum number of switches read concurrently
+MAX_POLL_WORKERS = 32
+
+def find_res(api, name, res_type):
+    """Returns a resource of the program of a switch, None if it is not defined."""
+    return api.program.suffix_lookup_map.get((res_type, name), None)
+
+class RingBuffer(object):
+    """Last `capacity` samples of an array, the oldest one is overwritten first.
+
+    Attributes:
+        capacity: number of samples kept
+        width: number of cells of the array
+        bitwidth: width of the cells, in bits
+        count: number of samples appended so far
+        timestamps: time of every sample slot
+        values: sample slots, a 2D numpy array (or a list of array.array),
+                signed 64 bit integers for arrays up to 64 bits wide
+    """
+
+    def __init__(self, capacity, width, bitwidth=64):
+        self.capacity = capacity
+        self.width = width
+        self.bitwidth = bitwidth
+        self.count = 0
+        # same types as snapshots.to_array
+        if np is not None:
+            self.timestamps = np.zeros(capacity, dtype=np.float64)
+            dtype = np.int64 if bitwidth <= 64 else object
+            self.values = np.zeros((capacity, width), dtype=dtype)
+        else:
+            self.timestamps = array('d', [0.0]) * capacity
+            if bitwidth <= 64 and INT64_TYPECODE is not None:
+                self.values = [array(INT64_TYPECODE, [0]) * width for _ in xrange(capacity)]
+            else:
+                self.values = [[0] * width for _ in xrange(capacity)]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, values):
+        """Copies a sample into the oldest slot."""
+        slot = self.count % self.capacity
+        self.timestamps[slot] = timestamp
+        self.values[slot][:] = values
+        self.count += 1
+
+    def _slots(self, first, last):
+        """Slots of the kept samples first to last - 1, 0 being the oldest one."""
+        start = self.count - len(self)
+        return [(start + i) % self.capacity for i in xrange(first, last)]
+
+    def get(self, age=0):
+        """Returns (timestamp, values) of a sample, age 0 being the latest one.
+
+        The values are a view of the slot, copy them to keep them.
+
+        Raises:
+            IndexError: if the sample is not kept (or was never taken)
+        """
+        if not 0 <= age < len(self):
+            raise IndexError("no sample %d samples ago" % age)
+        slot = (self.count - 1 - age) % self.capacity
+        return self.timestamps[slot], self.values[slot]
+
+    def series(self, index=None, since=None):
+        """Returns the kept samples, oldest first.
+
+        Args:
+            index: cell to return, None for the whole arrays
+            since: only return samples taken after this time
+
+        Returns:
+            (timestamps, values) copies, numpy arrays when numpy is installed
+        """
+        slots = self._slots(0, len(self))
+        if since is not None:
+            slots = [slot for slot in slots if self.timestamps[slot] > since]
+        if np is not None:
+            if index is None:
+                return self.timestamps[slots], self.values[slots]
+            return self.timestamps[slots], self.values[slots, index]
+        timestamps = [self.timestamps[slot] for slot in slots]
+        if index is None:
+            return timestamps, [self.values[slot][:] for slot in slots]
+        return timestamps, [self.values[slot][index] for slot in slots]
+
+class Poller(object):
+    """Samples register and counter arrays of all the P4 switches of a topology.
+
+    Arrays that a switch program does not define are not sampled for that
+    switch. A switch that fails to answer misses the sample, the error is
+    kept in `errors` and the next samples are still taken.
+
+    Attributes:
+        interval: seconds between two samples
+        capacity: number of samples kept per array
+        controllers: dict mapping switch names to API objects
+        buffers: dict mapping switch names to dicts mapping (array name, field)
+                 to RingBuffer objects, field is None for registers and
+                 "bytes" or "packets" for counters
+        errors: dict mapping switch names to the last error while sampling them
+        missed: number of samples skipped because sampling took too long
+    """
+
+    def __init__(self, topology, registers=(), counters=(), interval=1.0,
+                 capacity=DEFAULT_CAPACITY, switches=None, thrift_ip='localhost',
+                 api_cls=SimpleSwitchAPI, **api_kwargs):
+        """Connects to the switches and allocates the ring buffers.
+
+        Args:
+            topology: Topology object, used to find the P4 switches and their thrift ports
+            registers: names of the register arrays to sample
+            counters: names of the (indirect) counter arrays to sample
+            interval: seconds between two samples
+            capacity: number of samples kept per array
+            switches: names of the switches to sample, all P4 switches by default
+            thrift_ip: ip of the thrift servers
+            api_cls: RuntimeAPI subclass used to talk to the switches
+            api_kwargs: extra arguments for api_cls (e.g. json_path, pool),
+                        output is always OutputPolicy.SILENT
+
+        Raises:
+            ValueError: if interval or capacity is not positive
+        """
+        if interval <= 0:
+            raise ValueError("The polling interval must be positive, got %r" % (interval,))
+        if capacity <= 0:
+            raise ValueError("The capacity must be positive, got %r" % (capacity,))
+        self.interval = interval
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.errors = {}
+        self.missed = 0
+        self.controllers = {}
+        self.buffers = {}
+        # switch name -> (register names, counter names) present in its program
+        self.arrays = {}
+
+        if switches is None:
+            switches = sorted(topology.get_p4switches().keys())
+        # errors must raise, PRINT would return None instead of a snapshot
+        api_kwargs['output'] = OutputPolicy.SILENT
+        for sw_name in switches:
+            api = api_cls(topology.get_thrift_port(sw_name), thrift_ip, **api_kwargs)
+            self.controllers[sw_name] = api
+            self.buffers[sw_name] = buffers = {}
+            sw_registers = []
+            for name in registers:
+                register = find_res(api, name, ResType.register_array)
+                if register is not None:
+                    buffers[(name, None)] = RingBuffer(capacity, register.size, register.width)
+                    sw_registers.append(name)
+            sw_counters = []
+            for name in counters:
+                counter = find_res(api, name, ResType.counter_array)
+                if counter is not None:
+                    buffers[(name, "bytes")] = RingBuffer(capacity, counter.size)
+                    buffers[(name, "packets")] = RingBuffer(capacity, counter.size)
+                    sw_counters.append(name)
+            self.arrays[sw_name] = (sw_registers, sw_counters)
+
+        self.workers = ThreadPool(max(1, min(len(self.controllers), MAX_POLL_WORKERS)))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def poll_switch(self, sw_name):
+        """Takes one sample of the arrays of a switch."""
+        sw_registers, sw_counters = self.arrays[sw_name]
+        if not sw_registers and not sw_counters:
+            return
+        try:
+            snapshot = self.controllers[sw_name].snapshot(sw_registers, sw_counters)
+        except Exception as e:
+            self.errors[sw_name] = e
+            return
+        if snapshot is None:
+            self.errors[sw_name] = RuntimeError("no snapshot returned by switch %s" % sw_name)
+            return
+        buffers = self.buffers[sw_name]
+        with self.lock:
+            for name, values in snapshot.registers.items():
+                buffers[(name, None)].append(snapshot.timestamp, values)
+            for name, (byte_values, packet_values) in snapshot.counters.items():
+                buffers[(name, "bytes")].append(snapshot.timestamp, byte_values)
+                buffers[(name, "packets")].append(snapshot.timestamp, packet_values)
+
+    def poll(self):
+        """Takes one sample of every switch, switches are read concurrently."""
+        self.workers.map(self.poll_switch, self.controllers.keys())
+
+    def run(self):
+        next_poll = time.time()
+        while not self._stop_event.is_set():
+            self.poll()
+            next_poll += self.interval
+            now = time.time()
+            if now > next_poll:
+                # sampling took longer than the interval, skip the late samples
+                late = int((now - next_poll) / self.interval) + 1
+                self.missed += late
+                next_poll += late * self.interval
+            self._stop_event.wait(next_poll - now)
+
+    def start(self):
+        """Starts sampling in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="poller")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling, the samples taken so far can still be queried."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.workers.close()
+        self.workers.join()
+
+    def get_buffer(self, sw_name, name, field=None):
+        """Returns the RingBuffer of an array of a switch.
+
+        Args:
+            sw_name: switch name
+            name: register or counter array name
+            field: "bytes" or "packets" for counters (packets by default)
+
+        Raises:
+            KeyError: if the array is not sampled on that switch
+        """
+        buffers = self.buffers[sw_name]
+        if field is None and (name, None) not in buffers:
+            field = "packets"
+        try:
+            return buffers[(name, field)]
+        except KeyError:
+            raise KeyError("%s is not sampled on switch %s" % (name, sw_name))
+
+    def latest(self, sw_name, name, field=None):
+        """Returns (timestamp, values) of the latest sample of an array, or None."""
+        buffer = self.get_buffer(sw_name, name, field)
+        with self.lock:
+            if not len(buffer):
+                return None
+            timestamp, values = buffer.get()
+            return timestamp, values[:] if np is None else values.copy()
+
+    def series(self, sw_name, name, index=None, since=None, field=None):
+        """Returns the kept samples of an array, oldest first.
+
+        Args:
+            sw_name: switch name
+            name: register or counter array name
+            index: cell to return, None for the whole arrays
+            since: only return samples taken after this time
+            field: "bytes" or "packets" for counters (packets by default)
+
+        Returns:
+            (timestamps, values), see RingBuffer.series
+        """
+        buffer = self.get_buffer(sw_name, name, field)
+        with self.lock:
+            return buffer.series(index, since)
+
+    def rate(self, sw_name, name, index=None, window=1, field=None):
+        """Returns the per second change of an array over the last samples.
+
+        Args:
+            sw_name: switch name
+            name: register or counter array name
+            index: cell to return, None for the whole array
+            window: number of intervals to compute the rate over
+            field: "bytes" or "packets" for counters (packets by default)
+
+        Returns:
+            rate of the cell, or of every cell (numpy float array or list),
+            None if there are not enough samples yet (or they were taken at
+            the same time)
+        """
+        buffer = self.get_buffer(sw_name, name, field)
+        with self.lock:
+            if len(buffer) <= window:
+                return None
+            current_time, current = buffer.get()
+            previous_time, previous = buffer.get(window)
+            elapsed = current_time - previous_time
+            if elapsed <= 0:
+                return None
+            if index is not None:
+                if buffer.bitwidth > 64:
+                    return (current[index] - previous[index]) / float(elapsed)
+                return delta64(current[index], previous[index]) / float(elapsed)
+            delta = array_delta(current, previous)
+        if np is not None:
+            return delta / float(elapsed)
+        return [value / float(elapsed) for value in delta]
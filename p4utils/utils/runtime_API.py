@@ -25,11 +25,23 @@
 from collections import Counter
 import os
 import sys
+import time
+import socket
+import stat
 import struct
+import binascii
+import hashlib
+import tempfile
+import threading
+import warnings
+import cPickle
 import json
 from functools import wraps
 import bmpy_utils as utils
+from p4utils.utils.thrift_pool import default_pool, CONNECTION_ERRORS
+from p4utils.utils.snapshots import Snapshot, to_array
 
+from thrift.transport import TTransport
 from bm_runtime.standard import Standard
 from bm_runtime.standard.ttypes import *
 try:
@@ -58,6 +70,10 @@ def enum(type_name, *sequential, **named):
     return type(type_name, (), enums)
 
 PreType = enum('PreType', 'None', 'SimplePre', 'SimplePreLAG')
+# PRINT: legacy behaviour, results are printed and errors are printed and swallowed
+# SILENT: nothing is formatted or printed, results are only returned and errors
+#         are raised as typed exceptions (UIn_Error, InvalidTableOperation, ...)
+OutputPolicy = enum('OutputPolicy', 'PRINT', 'SILENT')
 MeterType = enum('MeterType', 'packets', 'bytes')
 TableType = enum('TableType', 'simple', 'indirect', 'indirect_ws')
 ResType = enum('ResType', 'table', 'action_prof', 'action', 'meter_array',
@@ -71,16 +87,51 @@ def table_error_name(x):
     return TableOperationErrorCode._VALUES_TO_NAMES[x]
 
 
-TABLES = {}
-ACTION_PROFS = {}
-ACTIONS = {}
-METER_ARRAYS = {}
-COUNTER_ARRAYS = {}
-REGISTER_ARRAYS = {}
-CUSTOM_CRC_CALCS = {}
+class P4ProgramInfo(object):
+    """Objects (tables, actions, ...) of a compiled P4 program.
 
-# maps (object type, unique suffix) to object
-SUFFIX_LOOKUP_MAP = {}
+    Built by load_json_str. Instances are not modified once loaded, so they
+    can be shared by all the API objects of switches running the same
+    program (see get_program_info).
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.action_profs = {}
+        self.actions = {}
+        self.meter_arrays = {}
+        self.counter_arrays = {}
+        self.register_arrays = {}
+        self.custom_crc_calcs = {}
+
+        # maps (object type, unique suffix) to object
+        self.suffix_lookup_map = {}
+
+    def build_suffix_lookup_map(self):
+        # Builds a dictionary mapping (object type, unique suffix) to the object
+        # (Table, Action, etc...). In P4_16 the object name is the fully-qualified
+        # name, which can be quite long, which is why we accept unique suffixes as
+        # valid identifiers.
+        # Auto-complete does not support suffixes, only the fully-qualified names,
+        # but that can be changed in the future if needed.
+        self.suffix_lookup_map.clear()
+        suffix_count = Counter()
+        for res_type, res_dict in [
+                (ResType.table, self.tables), (ResType.action_prof, self.action_profs),
+                (ResType.action, self.actions), (ResType.meter_array, self.meter_arrays),
+                (ResType.counter_array, self.counter_arrays),
+                (ResType.register_array, self.register_arrays)]:
+            for name, res in res_dict.items():
+                suffix = None
+                for s in reversed(name.split('.')):
+                    suffix = s if suffix is None else s + '.' + suffix
+                    key = (res_type, suffix)
+                    self.suffix_lookup_map[key] = res
+                    suffix_count[key] += 1
+        #checks if a table is repeated, in that case it removes the only suffix entries
+        for key, c in suffix_count.items():
+            if c > 1:
+                del self.suffix_lookup_map[key]
 
 class MatchType:
     EXACT = 0
@@ -98,7 +149,8 @@ class MatchType:
         return {"exact": 0, "lpm": 1, "ternary": 2, "valid": 3, "range": 4}[x]
 
 class Table:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.match_type_ = None
@@ -108,12 +160,24 @@ class Table:
         self.type_ = None
         self.support_timeout = False
         self.action_prof = None
+        self.key_encoder = None
 
-        TABLES[name] = self
+        program.tables[name] = self
 
     def num_key_fields(self):
         return len(self.key)
 
+    def get_key_encoder(self):
+        if self.key_encoder is None:
+            self.key_encoder = MatchKeyEncoder(self)
+        return self.key_encoder
+
+    def __getstate__(self):
+        # encoders are rebuilt on demand and can not be pickled
+        state = self.__dict__.copy()
+        state["key_encoder"] = None
+        return state
+
     def key_str(self):
         return ",\t".join([name + "(" + MatchType.to_str(t) + ", " + str(bw) + ")" for name, t, bw in self.key])
 
@@ -124,42 +188,55 @@ class Table:
 
     def get_action(self, action_name):
         key = ResType.action, action_name
-        action = SUFFIX_LOOKUP_MAP.get(key, None)
+        action = self.program.suffix_lookup_map.get(key, None)
         if action is None or action.name not in self.actions:
             return None
         return action
 
 class ActionProf:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.with_selection = False
         self.actions = {}
         self.ref_cnt = 0
 
-        ACTION_PROFS[name] = self
+        program.action_profs[name] = self
 
     def action_prof_str(self):
         return "{0:30} [{1}]".format(self.name, self.with_selection)
 
     def get_action(self, action_name):
         key = ResType.action, action_name
-        action = SUFFIX_LOOKUP_MAP.get(key, None)
+        action = self.program.suffix_lookup_map.get(key, None)
         if action is None or action.name not in self.actions:
             return None
         return action
 
 class Action:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.runtime_data = []
+        self.data_encoder = None
 
-        ACTIONS[name] = self
+        program.actions[name] = self
 
     def num_params(self):
         return len(self.runtime_data)
 
+    def get_data_encoder(self):
+        if self.data_encoder is None:
+            self.data_encoder = ActionDataEncoder(self)
+        return self.data_encoder
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["data_encoder"] = None
+        return state
+
     def runtime_data_str(self):
         return ",\t".join([name + "(" + str(bw) + ")" for name, bw in self.runtime_data])
 
@@ -167,7 +244,8 @@ class Action:
         return "{0:30} [{1}]".format(self.name, self.runtime_data_str())
 
 class MeterArray:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.type_ = None
@@ -176,49 +254,127 @@ class MeterArray:
         self.binding = None
         self.rate_count = None
 
-        METER_ARRAYS[name] = self
+        program.meter_arrays[name] = self
 
     def meter_str(self):
         return "{0:30} [{1}, {2}]".format(self.name, self.size,
                                           MeterType.to_str(self.type_))
 
 class CounterArray:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.is_direct = None
         self.size = None
         self.binding = None
 
-        COUNTER_ARRAYS[name] = self
+        program.counter_arrays[name] = self
 
     def counter_str(self):
         return "{0:30} [{1}]".format(self.name, self.size)
 
 class RegisterArray:
-    def __init__(self, name, id_):
+    def __init__(self, program, name, id_):
+        self.program = program
         self.name = name
         self.id_ = id_
         self.width = None
         self.size = None
 
-        REGISTER_ARRAYS[name] = self
+        program.register_arrays[name] = self
 
     def register_str(self):
         return "{0:30} [{1}]".format(self.name, self.size)
 
-def reset_config():
-    TABLES.clear()
-    ACTION_PROFS.clear()
-    ACTIONS.clear()
-    METER_ARRAYS.clear()
-    COUNTER_ARRAYS.clear()
-    REGISTER_ARRAYS.clear()
-    CUSTOM_CRC_CALCS.clear()
+# directory where parsed programs are cached, one file per JSON md5
+PROGRAM_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "p4utils", "programs")
+# version of the cached program format, bump it whenever the attributes of
+# P4ProgramInfo or of the resource classes (Table, Action, ...) change
+PROGRAM_CACHE_VERSION = 1
+
+# md5 of the JSON -> P4ProgramInfo
+_programs = {}
+_programs_lock = threading.Lock()
+# program loaded last, returned by the (deprecated) class level RuntimeAPI getters
+_last_program = P4ProgramInfo()
+
+def get_program_info(json_str, cache_dir=None):
+    """Returns the P4ProgramInfo of a JSON, parsing it only the first time it is seen.
+
+    Args:
+        json_str: P4 JSON
+        cache_dir: optional directory where the parsed program is pickled, so
+                   that later processes can load it instead of parsing the
+                   JSON. Only used if it belongs to the current user and no
+                   one else can write to it.
+
+    Returns:
+        P4ProgramInfo
+    """
+    global _last_program
+    md5 = hashlib.md5(json_str).hexdigest()
+    with _programs_lock:
+        program = _programs.get(md5, None)
+    if program is None and cache_dir:
+        program = read_program_cache(cache_dir, md5)
+    if program is None:
+        program = load_json_str(json_str)
+        if cache_dir:
+            write_program_cache(cache_dir, md5, program)
+    with _programs_lock:
+        program = _programs.setdefault(md5, program)
+        _last_program = program
+    return program
+
+def program_cache_header(md5):
+    return "p4utils-program %d %s" % (PROGRAM_CACHE_VERSION, md5)
+
+def program_cache_path(cache_dir, md5):
+    return os.path.join(cache_dir, md5 + ".pickle")
+
+def is_private_dir(path):
+    """True if path is a directory of the current user that no one else can write to."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid()
+            and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
 
-    SUFFIX_LOOKUP_MAP.clear()
+def read_program_cache(cache_dir, md5):
+    """Returns the program cached for a JSON md5, None if missing, broken or stale.
 
-def load_json_config(standard_client=None, json_path=None):
+    Cache files start with a header line holding the cache format version
+    and the md5 of their JSON, which is checked before anything is unpickled.
+    """
+    if not is_private_dir(cache_dir):
+        return None
+    try:
+        with open(program_cache_path(cache_dir, md5), 'rb') as f:
+            if f.readline().rstrip("\n") != program_cache_header(md5):
+                return None
+            return cPickle.load(f)
+    except Exception:
+        return None
+
+def write_program_cache(cache_dir, md5, program):
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        if not is_private_dir(cache_dir):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(program_cache_header(md5) + "\n")
+            cPickle.dump(program, f, cPickle.HIGHEST_PROTOCOL)
+        # make the new cache visible atomically
+        os.rename(tmp_path, program_cache_path(cache_dir, md5))
+    except (IOError, OSError, cPickle.PicklingError):
+        # the cache is optional, e.g. the home directory is read-only
+        pass
+
+def load_json_config(standard_client=None, json_path=None, cache_program=False):
     def read_conf():
         if json_path:
             if standard_client is not None:
@@ -233,56 +389,48 @@ def load_json_config(standard_client=None, json_path=None):
                 sys.exit(1)
             return json_cfg
 
-    load_json_str(read_conf())
+    cache_dir = PROGRAM_CACHE_DIR if cache_program else None
+    return get_program_info(read_conf(), cache_dir)
 
 def load_json_str(json_str):
-    def get_header_type(header_name, j_headers):
-        for h in j_headers:
-            if h["name"] == header_name:
-                return h["header_type"]
-        assert(0)
-
-    def get_field_bitwidth(header_type, field_name, j_header_types):
-        for h in j_header_types:
-            if h["name"] != header_type: continue
-            for t in h["fields"]:
-                # t can have a third element (field signedness)
-                f, bw = t[0], t[1]
-                if f == field_name:
-                    return bw
-        assert(0)
-
-    reset_config()
+    program = P4ProgramInfo()
     json_ = json.loads(json_str)
 
     def get_json_key(key):
         return json_.get(key, [])
 
+    # header name -> header type name
+    header_types = dict((h["name"], h["header_type"]) for h in get_json_key("headers"))
+    # (header type name, field name) -> bitwidth
+    # (a field can have a third element, its signedness)
+    field_bitwidths = dict(((h["name"], t[0]), t[1])
+                           for h in get_json_key("header_types") for t in h["fields"])
+
     for j_action in get_json_key("actions"):
-        action = Action(j_action["name"], j_action["id"])
+        action = Action(program, j_action["name"], j_action["id"])
         for j_param in j_action["runtime_data"]:
             action.runtime_data += [(j_param["name"], j_param["bitwidth"])]
 
     for j_pipeline in get_json_key("pipelines"):
         if "action_profiles" in j_pipeline:  # new JSON format
             for j_aprof in j_pipeline["action_profiles"]:
-                action_prof = ActionProf(j_aprof["name"], j_aprof["id"])
+                action_prof = ActionProf(program, j_aprof["name"], j_aprof["id"])
                 action_prof.with_selection = "selector" in j_aprof
 
         for j_table in j_pipeline["tables"]:
-            table = Table(j_table["name"], j_table["id"])
+            table = Table(program, j_table["name"], j_table["id"])
             table.match_type = MatchType.from_str(j_table["match_type"])
             table.type_ = TableType.from_str(j_table["type"])
             table.support_timeout = j_table["support_timeout"]
             for action in j_table["actions"]:
-                table.actions[action] = ACTIONS[action]
+                table.actions[action] = program.actions[action]
 
             if table.type_ in {TableType.indirect, TableType.indirect_ws}:
                 if "action_profile" in j_table:
-                    action_prof = ACTION_PROFS[j_table["action_profile"]]
+                    action_prof = program.action_profs[j_table["action_profile"]]
                 else:  # for backward compatibility
                     assert("act_prof_name" in j_table)
-                    action_prof = ActionProf(j_table["act_prof_name"],
+                    action_prof = ActionProf(program, j_table["act_prof_name"],
                                              table.id_)
                     action_prof.with_selection = "selector" in j_table
                 action_prof.actions.update(table.actions)
@@ -300,14 +448,11 @@ def load_json_str(json_str):
                     bitwidth = 1
                 else:
                     field_name = ".".join(target)
-                    header_type = get_header_type(target[0],
-                                                  json_["headers"])
-                    bitwidth = get_field_bitwidth(header_type, target[1],
-                                                  json_["header_types"])
+                    bitwidth = field_bitwidths[(header_types[target[0]], target[1])]
                 table.key += [(field_name, match_type, bitwidth)]
 
     for j_meter in get_json_key("meter_arrays"):
-        meter_array = MeterArray(j_meter["name"], j_meter["id"])
+        meter_array = MeterArray(program, j_meter["name"], j_meter["id"])
         if "is_direct" in j_meter and j_meter["is_direct"]:
             meter_array.is_direct = True
             meter_array.binding = j_meter["binding"]
@@ -318,7 +463,7 @@ def load_json_str(json_str):
         meter_array.rate_count = j_meter["rate_count"]
 
     for j_counter in get_json_key("counter_arrays"):
-        counter_array = CounterArray(j_counter["name"], j_counter["id"])
+        counter_array = CounterArray(program, j_counter["name"], j_counter["id"])
         counter_array.is_direct = j_counter["is_direct"]
         if counter_array.is_direct:
             counter_array.binding = j_counter["binding"]
@@ -326,40 +471,19 @@ def load_json_str(json_str):
             counter_array.size = j_counter["size"]
 
     for j_register in get_json_key("register_arrays"):
-        register_array = RegisterArray(j_register["name"], j_register["id"])
+        register_array = RegisterArray(program, j_register["name"], j_register["id"])
         register_array.size = j_register["size"]
         register_array.width = j_register["bitwidth"]
 
     for j_calc in get_json_key("calculations"):
         calc_name = j_calc["name"]
         if j_calc["algo"] == "crc16_custom":
-            CUSTOM_CRC_CALCS[calc_name] = 16
+            program.custom_crc_calcs[calc_name] = 16
         elif j_calc["algo"] == "crc32_custom":
-            CUSTOM_CRC_CALCS[calc_name] = 32
-
-    # Builds a dictionary mapping (object type, unique suffix) to the object
-    # (Table, Action, etc...). In P4_16 the object name is the fully-qualified
-    # name, which can be quite long, which is why we accept unique suffixes as
-    # valid identifiers.
-    # Auto-complete does not support suffixes, only the fully-qualified names,
-    # but that can be changed in the future if needed.
-    suffix_count = Counter()
-    for res_type, res_dict in [
-            (ResType.table, TABLES), (ResType.action_prof, ACTION_PROFS),
-            (ResType.action, ACTIONS), (ResType.meter_array, METER_ARRAYS),
-            (ResType.counter_array, COUNTER_ARRAYS),
-            (ResType.register_array, REGISTER_ARRAYS)]:
-        for name, res in res_dict.items():
-            suffix = None
-            for s in reversed(name.split('.')):
-                suffix = s if suffix is None else s + '.' + suffix
-                key = (res_type, suffix)
-                SUFFIX_LOOKUP_MAP[key] = res
-                suffix_count[key] += 1
-    #checks if a table is repeated, in that case it removes the only suffix entries
-    for key, c in suffix_count.items():
-        if c > 1:
-            del SUFFIX_LOOKUP_MAP[key]
+            program.custom_crc_calcs[calc_name] = 32
+
+    program.build_suffix_lookup_map()
+    return program
 
 class UIn_Error(Exception):
     def __init__(self, info=""):
@@ -495,101 +619,239 @@ def parse_param(input_str, bitwidth):
     except UIn_BadParamError:
         raise
 
-def parse_runtime_data(action, params):
-    def parse_param_(field, bw):
+class FieldEncoder(object):
+    """Encodes values of a field with a given bitwidth into a byte string.
+
+    The parsing strategy is picked once, from the bitwidth: 32-bit fields
+    accept IPv4 addresses, 48-bit fields MAC addresses and 128-bit fields
+    IPv6 addresses, all fields accept integers. Besides strings (parsed
+    as in parse_param), values can be ints/longs, bytearrays of the right
+    size or address objects with a `packed` attribute (ipaddress/ipaddr).
+
+    Errors are raised as UIn_BadParamError, with the parse_param messages.
+    """
+
+    def __init__(self, bitwidth):
+        self.bitwidth = bitwidth
+        self.num_bytes = (bitwidth + 7) / 8
+        self.hex_digits = 2 * self.num_bytes
+        self.zero = "\0" * self.num_bytes
+        self.parse_address = {
+            32: self.parse_ipv4,
+            48: self.parse_mac,
+            128: self.parse_ipv6
+        }.get(bitwidth, None)
+
+    def encode_int(self, value):
+        # negative values are encoded as 0, like int_to_bytes does
+        if value <= 0:
+            return self.zero
+        if value >> (8 * self.num_bytes):
+            raise UIn_BadParamError("Parameter is too large")
+        return binascii.unhexlify("%0*x" % (self.hex_digits, value))
+
+    def parse_ipv4(self, value):
+        if "." not in value:
+            return None
         try:
-            return parse_param(field, bw)
-        except UIn_BadParamError as e:
-            raise UIn_RuntimeDataError(
-                "Error while parsing %s - %s" % (field, e)
+            return struct.pack("!BBBB", *[int(b) for b in value.split(".")])
+        except (ValueError, struct.error):
+            raise UIn_BadParamError("Invalid IPv4 address")
+
+    def parse_mac(self, value):
+        if ":" not in value:
+            return None
+        try:
+            return struct.pack("!BBBBBB", *[int(b, 16) for b in value.split(":")])
+        except (ValueError, struct.error):
+            raise UIn_BadParamError("Invalid MAC address")
+
+    def parse_ipv6(self, value):
+        if ":" not in value:
+            return None
+        try:
+            return socket.inet_pton(socket.AF_INET6, value)
+        except (socket.error, ValueError):
+            raise UIn_BadParamError("Invalid IPv6 address")
+
+    def encode(self, value):
+        if isinstance(value, (int, long)):
+            return self.encode_int(value)
+        if isinstance(value, basestring):
+            if self.parse_address is not None:
+                encoded = self.parse_address(str(value))
+                if encoded is not None:
+                    return encoded
+            try:
+                value = int(value, 0)
+            except:
+                raise UIn_BadParamError(
+                    "Invalid input, could not cast to integer, try in hex with 0x prefix"
+                )
+            return self.encode_int(value)
+        if isinstance(value, bytearray):
+            encoded = str(value)
+        elif hasattr(value, "packed"):
+            encoded = value.packed
+        else:
+            raise UIn_BadParamError("Invalid input type %s" % type(value).__name__)
+        if len(encoded) != self.num_bytes:
+            raise UIn_BadParamError(
+                "Invalid input, expected %d bytes but got %d" % (self.num_bytes, len(encoded))
             )
+        return encoded
+
+# bitwidth -> FieldEncoder
+_field_encoders = {}
+
+def get_field_encoder(bitwidth):
+    encoder = _field_encoders.get(bitwidth, None)
+    if encoder is None:
+        encoder = _field_encoders[bitwidth] = FieldEncoder(bitwidth)
+    return encoder
+
+def _split_match_value(field, separator, error):
+    """Splits a match value like "10.0.0.0/8" in two, (value, value) tuples are accepted as they are."""
+    if isinstance(field, (tuple, list)):
+        if len(field) != 2:
+            raise UIn_MatchKeyError(error.format(field))
+        return field
+    try:
+        first, second = field.split(separator)
+    except (ValueError, AttributeError):
+        raise UIn_MatchKeyError(error.format(field))
+    return first, second
 
-    bitwidths = [bw for( _, bw) in action.runtime_data]
-    byte_array = []
-    for input_str, bitwidth in zip(params, bitwidths):
-        byte_array += [bytes_to_string(parse_param_(input_str, bitwidth))]
-    return byte_array
+class ActionDataEncoder(object):
+    """Encodes the action parameters of an action, see FieldEncoder."""
 
-_match_types_mapping = {
-    MatchType.EXACT : BmMatchParamType.EXACT,
-    MatchType.LPM : BmMatchParamType.LPM,
-    MatchType.TERNARY : BmMatchParamType.TERNARY,
-    MatchType.VALID : BmMatchParamType.VALID,
-    MatchType.RANGE : BmMatchParamType.RANGE,
-}
+    def __init__(self, action):
+        self.encoders = [get_field_encoder(bw) for (_, bw) in action.runtime_data]
 
-def parse_match_key(table, key_fields):
+    def encode(self, params):
+        runtime_data = []
+        for field, encoder in zip(params, self.encoders):
+            try:
+                runtime_data.append(encoder.encode(field))
+            except UIn_BadParamError as e:
+                raise UIn_RuntimeDataError(
+                    "Error while parsing %s - %s" % (field, e)
+                )
+        return runtime_data
+
+class MatchKeyEncoder(object):
+    """Encodes the match key of a table into BmMatchParams, see FieldEncoder.
 
-    def parse_param_(field, bw):
+    LPM, ternary and range fields can be given as strings ("10.0.0.0/8",
+    "key&&&mask", "start->end") or as 2-tuples of values.
+    """
+
+    def __init__(self, table):
+        encode_field = {
+            MatchType.EXACT: self.encode_exact,
+            MatchType.LPM: self.encode_lpm,
+            MatchType.TERNARY: self.encode_ternary,
+            MatchType.VALID: self.encode_valid,
+            MatchType.RANGE: self.encode_range,
+        }
+        self.fields = [(encode_field[t], get_field_encoder(bw)) for (_, t, bw) in table.key]
+
+    @staticmethod
+    def encode_value(encoder, field):
         try:
-            return parse_param(field, bw)
+            return encoder.encode(field)
         except UIn_BadParamError as e:
             raise UIn_MatchKeyError(
                 "Error while parsing %s - %s" % (field, e)
             )
 
-    params = []
-    match_types = [t for (_, t, _) in table.key]
-    bitwidths = [bw for (_, _, bw) in table.key]
-    for idx, field in enumerate(key_fields):
-        param_type = _match_types_mapping[match_types[idx]]
-        bw = bitwidths[idx]
-        if param_type == BmMatchParamType.EXACT:
-            key = bytes_to_string(parse_param_(field, bw))
-            param = BmMatchParam(type = param_type,
-                                 exact = BmMatchParamExact(key))
-        elif param_type == BmMatchParamType.LPM:
-            try:
-                prefix, length = field.split("/")
-            except ValueError:
-                raise UIn_MatchKeyError(
-                    "Invalid LPM value {}, use '/' to separate prefix "
-                    "and length".format(field))
-            key = bytes_to_string(parse_param_(prefix, bw))
-            param = BmMatchParam(type = param_type,
-                                 lpm = BmMatchParamLPM(key, int(length)))
-        elif param_type == BmMatchParamType.TERNARY:
-            try:
-                key, mask = field.split("&&&")
-            except ValueError:
-                raise UIn_MatchKeyError(
-                    "Invalid ternary value {}, use '&&&' to separate key and "
-                    "mask".format(field))
-            key = bytes_to_string(parse_param_(key, bw))
-            mask = bytes_to_string(parse_param_(mask, bw))
-            if len(mask) != len(key):
-                raise UIn_MatchKeyError(
-                    "Key and mask have different lengths in expression %s" % field
-                )
-            param = BmMatchParam(type = param_type,
-                                 ternary = BmMatchParamTernary(key, mask))
-        elif param_type == BmMatchParamType.VALID:
-            key = bool(int(field))
-            param = BmMatchParam(type = param_type,
-                                 valid = BmMatchParamValid(key))
-        elif param_type == BmMatchParamType.RANGE:
-            try:
-                start, end = field.split("->")
-            except ValueError:
-                raise UIn_MatchKeyError(
-                    "Invalid range value {}, use '->' to separate range start "
-                    "and range end".format(field))
-            start = bytes_to_string(parse_param_(start, bw))
-            end = bytes_to_string(parse_param_(end, bw))
-            if len(start) != len(end):
-                raise UIn_MatchKeyError(
-                    "start and end have different lengths in expression %s" % field
-                )
-            if start > end:
-                raise UIn_MatchKeyError(
-                    "start is less than end in expression %s" % field
-                )
-            param = BmMatchParam(type = param_type,
-                                 range = BmMatchParamRange(start, end))
-        else:
-            assert(0)
-        params.append(param)
-    return params
+    def encode_exact(self, encoder, field):
+        return BmMatchParam(type = BmMatchParamType.EXACT,
+                            exact = BmMatchParamExact(self.encode_value(encoder, field)))
+
+    def encode_lpm(self, encoder, field):
+        prefix, length = _split_match_value(
+            field, "/", "Invalid LPM value {}, use '/' to separate prefix and length")
+        key = self.encode_value(encoder, prefix)
+        return BmMatchParam(type = BmMatchParamType.LPM,
+                            lpm = BmMatchParamLPM(key, int(length)))
+
+    def encode_ternary(self, encoder, field):
+        key, mask = _split_match_value(
+            field, "&&&", "Invalid ternary value {}, use '&&&' to separate key and mask")
+        key = self.encode_value(encoder, key)
+        mask = self.encode_value(encoder, mask)
+        return BmMatchParam(type = BmMatchParamType.TERNARY,
+                            ternary = BmMatchParamTernary(key, mask))
+
+    def encode_valid(self, encoder, field):
+        return BmMatchParam(type = BmMatchParamType.VALID,
+                            valid = BmMatchParamValid(bool(int(field))))
+
+    def encode_range(self, encoder, field):
+        start, end = _split_match_value(
+            field, "->", "Invalid range value {}, use '->' to separate range start and range end")
+        start = self.encode_value(encoder, start)
+        end = self.encode_value(encoder, end)
+        if start > end:
+            raise UIn_MatchKeyError(
+                "start is less than end in expression %s" % (field,)
+            )
+        return BmMatchParam(type = BmMatchParamType.RANGE,
+                            range = BmMatchParamRange(start, end))
+
+    def encode(self, key_fields):
+        return [encode_field(encoder, field)
+                for (encode_field, encoder), field in zip(self.fields, key_fields)]
+
+def parse_runtime_data(action, params):
+    return action.get_data_encoder().encode(params)
+
+def parse_match_key(table, key_fields):
+    return table.get_key_encoder().encode(key_fields)
+
+def mask_prefix(key, prefix_length, bitwidth):
+    """Zeroes the bits of a field value after its first prefix_length bits."""
+    host_bits = max(bitwidth - prefix_length, 0)
+    if not key or not host_bits:
+        return key
+    value = int(binascii.hexlify(key), 16) >> host_bits << host_bits
+    return binascii.unhexlify("%0*x" % (2 * len(key), value))
+
+def mask_ternary(key, mask):
+    """Returns key & mask."""
+    return "".join(chr(ord(k) & ord(m)) for k, m in zip(key, mask))
+
+def match_key_to_bytes(match_key, table=None):
+    """Returns a compact, hashable byte string identifying a list of BmMatchParam.
+
+    Fields have a fixed width per table, so concatenating them is unambiguous
+    for keys of the same table. When the table is given, LPM and ternary keys
+    are masked (with their prefix length or mask) first, as the switch does,
+    so "10.0.0.1/24" and "10.0.0.0/24" give the same bytes.
+    """
+    parts = []
+    for idx, param in enumerate(match_key):
+        if param.type == BmMatchParamType.EXACT:
+            parts.append(param.exact.key)
+        elif param.type == BmMatchParamType.LPM:
+            key = param.lpm.key
+            if table is not None:
+                key = mask_prefix(key, param.lpm.prefix_length, table.key[idx][2])
+            parts.append(key)
+            parts.append(struct.pack("!H", param.lpm.prefix_length))
+        elif param.type == BmMatchParamType.TERNARY:
+            key = param.ternary.key
+            if table is not None:
+                key = mask_ternary(key, param.ternary.mask)
+            parts.append(key)
+            parts.append(param.ternary.mask)
+        elif param.type == BmMatchParamType.VALID:
+            parts.append("\1" if param.valid.key else "\0")
+        elif param.type == BmMatchParamType.RANGE:
+            parts.append(param.range.start)
+            parts.append(param.range.end_)
+    return "".join(parts)
 
 def printable_byte_str(s):
     return ":".join("{:02x}".format(ord(c)) for c in s)
@@ -625,12 +887,126 @@ BmMatchParamValid.to_str = BmMatchParamValid_to_str
 BmMatchParamRange.to_str = BmMatchParamRange_to_str
 
 # services is [(service_name, client_class), ...]
-def thrift_connect(thrift_ip, thrift_port, services):
-    return utils.thrift_connect(thrift_ip, thrift_port, services)
+def thrift_connect(thrift_ip, thrift_port, services, pool=None):
+    """Returns clients of the given services, all sharing the pooled connection to the switch."""
+    connection = (pool or default_pool).get(thrift_ip, thrift_port)
+    return [connection.get_client(service_name, client_cls) if service_name is not None else None
+            for service_name, client_cls in services]
+
+# maximum number of thrift requests in flight on one connection
+PIPELINE_WINDOW = 256
+
+def pipeline_calls(client, method_name, calls, window=PIPELINE_WINDOW):
+    """Runs many calls of the same thrift method without waiting for each reply.
+
+    Requests are written with the client send_<method> functions and the
+    replies are read back in order with recv_<method>, keeping at most
+    window requests in flight.
+
+    Args:
+        client: thrift client
+        method_name: name of the thrift method (e.g. bm_mt_add_entry)
+        calls: list of argument tuples, one per call
+        window: maximum number of requests sent before reading a reply
+
+    Returns:
+        list of (value, exception) tuples, in the order of calls
+    """
+    send = getattr(client, "send_" + method_name, None)
+    recv = getattr(client, "recv_" + method_name, None)
+    results = []
+    if send is None or recv is None:
+        method = getattr(client, method_name)
+        for args in calls:
+            try:
+                results.append((method(*args), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def receive():
+        try:
+            results.append((recv(), None))
+        except (TTransport.TTransportException, socket.error):
+            raise
+        except Exception as e:
+            results.append((None, e))
+
+    in_flight = 0
+    for args in calls:
+        if in_flight == window:
+            receive()
+            in_flight -= 1
+        send(*args)
+        in_flight += 1
+    for _ in xrange(in_flight):
+        receive()
+    return results
+
+class BulkResult(object):
+    """Outcome of a bulk operation.
+
+    Attributes:
+        handles: list with the handle of every entry (None if it failed)
+        errors: dict mapping entry index to the exception it raised
+        elapsed: time taken, in seconds
+    """
+
+    def __init__(self, handles, errors, elapsed):
+        self.handles = handles
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def num_ok(self):
+        return len(self.handles) - len(self.errors)
+
+    def rate(self):
+        "Entries processed per second"
+        if self.elapsed <= 0:
+            return float(len(self.handles))
+        return len(self.handles) / self.elapsed
+
+    def __repr__(self):
+        return "%d/%d entries in %.3fs (%.0f entries/s)" % (
+            self.num_ok(), len(self.handles), self.elapsed, self.rate())
+
+class ReconcileResult(object):
+    """Outcome of a table reconciliation.
+
+    Attributes:
+        added: number of entries added
+        modified: number of entries whose action changed
+        deleted: number of entries deleted
+        unchanged: number of entries already installed as wanted
+        errors: dict mapping the index of a wanted entry to the exception it
+                raised (while parsing, adding or modifying it)
+        delete_errors: dict mapping the handle of an installed entry that
+                       could not be deleted to the exception
+        elapsed: time taken, in seconds
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.modified = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.errors = {}
+        self.delete_errors = {}
+        self.elapsed = 0
+
+    def num_changes(self):
+        return self.added + self.modified + self.deleted
+
+    def __repr__(self):
+        return "%d added, %d modified, %d deleted, %d unchanged, %d errors in %.3fs" % (
+            self.added, self.modified, self.deleted, self.unchanged,
+            len(self.errors) + len(self.delete_errors), self.elapsed)
 
 def handle_bad_input(f):
     @wraps(f)
     def handle(*args, **kwargs):
+        if not args[0].verbose:
+            return f(*args, **kwargs)
         try:
             return f(*args, **kwargs)
         except UIn_MatchKeyError as e:
@@ -668,6 +1044,8 @@ def handle_bad_input(f):
 def handle_bad_input_mc(f):
     @wraps(f)
     def handle(*args, **kwargs):
+        if not args[0].verbose:
+            return f(*args, **kwargs)
         pre_type = args[0].pre_type
         if pre_type == PreType.None:
             return handle_bad_input(f)(*args, **kwargs)
@@ -725,6 +1103,27 @@ def parse_bool(s):
     raise UIn_Error("Invalid bool parameter")
 
 
+class ProgramGetter(object):
+    """Program getter of RuntimeAPI, e.g. get_tables.
+
+    Through an API object it returns an attribute of the object's program.
+    Through the class, as the old static getters did, it returns the one of
+    the program loaded last and warns that this is deprecated.
+    """
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def __get__(self, api, api_cls=None):
+        if api is not None:
+            return lambda: getattr(api.program, self.attribute)
+        def getter():
+            warnings.warn("RuntimeAPI.get_%s() returns the program loaded last, call "
+                          "get_program_%s() on the API object of the switch instead"
+                          % (self.attribute, self.attribute), DeprecationWarning, stacklevel=2)
+            return getattr(_last_program, self.attribute)
+        return getter
+
 class RuntimeAPI(object):
 
     @staticmethod
@@ -741,43 +1140,59 @@ class RuntimeAPI(object):
 
         return services
 
-    def __init__(self, thrift_port, thrift_ip, pre_type, json_path=None):
+    def __init__(self, thrift_port, thrift_ip, pre_type, json_path=None, output=OutputPolicy.PRINT,
+                 cache_program=False, track_entries=True, pool=None):
 
         if isinstance(pre_type, str):
             pre_type = PreType.from_str(pre_type)
 
+        self.set_output_policy(output)
+
+        self.connection = (pool or default_pool).get(thrift_ip, thrift_port)
         standard_client, mc_client = thrift_connect(
             thrift_ip, thrift_port,
-            RuntimeAPI.get_thrift_services(pre_type)
+            RuntimeAPI.get_thrift_services(pre_type), pool
         )
 
-        load_json_config(standard_client, json_path)
+        self.program = load_json_config(standard_client, json_path, cache_program)
 
         self.client = standard_client
         self.mc_client = mc_client
         self.pre_type = pre_type
 
-        self.table_entries_match_to_handle = self.create_match_to_handle_dict()
-        self.load_table_entries_match_to_handle()
+        # if enabled, the match key -> handle mapping of every table is kept,
+        # loaded from the switch the first time a table is used
+        self.track_entries = track_entries
+        # table name -> {match key bytes: entry handle}
+        self.table_entries_match_to_handle = {}
+        # table name -> {entry handle: match key bytes}
+        self.table_entries_handle_to_match = {}
         #self.table_multiple_names = self.load_table_to_all_names()
 
-    def create_match_to_handle_dict(self):
+    def set_output_policy(self, output):
+        """Sets how results and errors are reported, see OutputPolicy.
 
-        d = {}
-        for table_name in self.get_tables():
-            d[table_name] = {}
-        return d
+        Args:
+            output: OutputPolicy value or its name (e.g. "SILENT")
+        """
+        if isinstance(output, str):
+            output = OutputPolicy.from_str(output.upper())
+        self.output = output
+        self.verbose = output == OutputPolicy.PRINT
 
     def shell(self, line):
         "Run a shell command"
         output = os.popen(line).read()
-        print output
+        if self.verbose:
+            print output
+        return output
 
     def get_res(self, type_name, name, res_type):
         key = res_type, name
-        if key not in SUFFIX_LOOKUP_MAP:
+        res = self.program.suffix_lookup_map.get(key, None)
+        if res is None:
             raise UIn_ResourceError(type_name, name)
-        return SUFFIX_LOOKUP_MAP[key]
+        return res
 
     """
     def at_least_n_args(self, args, n):
@@ -802,31 +1217,42 @@ class RuntimeAPI(object):
     @handle_bad_input
     def show_tables(self):
         "List tables defined in the P4 program: show_tables"
-        for table_name in sorted(TABLES):
-            print TABLES[table_name].table_str()
+        table_names = sorted(self.program.tables)
+        if self.verbose:
+            for table_name in table_names:
+                print self.program.tables[table_name].table_str()
+        return table_names
 
     @handle_bad_input
     def show_actions(self):
         "List actions defined in the P4 program: show_actions"
-        for action_name in sorted(ACTIONS):
-            print ACTIONS[action_name].action_str()
+        action_names = sorted(self.program.actions)
+        if self.verbose:
+            for action_name in action_names:
+                print self.program.actions[action_name].action_str()
+        return action_names
 
     @handle_bad_input
     def table_show_actions(self, table_name):
         "List one table's actions as per the P4 program: table_show_actions <table_name>"
 
         table = self.get_res("table", table_name, ResType.table)
-        for action_name in sorted(table.actions):
-            print ACTIONS[action_name].action_str()
+        action_names = sorted(table.actions)
+        if self.verbose:
+            for action_name in action_names:
+                print self.program.actions[action_name].action_str()
+        return action_names
 
     @handle_bad_input
     def table_info(self, table_name):
         "Show info about a table: table_info <table_name>"
         table = self.get_res("table", table_name, ResType.table)
-        print table.table_str()
-        print "*" * 80
-        for action_name in sorted(table.actions):
-            print ACTIONS[action_name].action_str()
+        if self.verbose:
+            print table.table_str()
+            print "*" * 80
+            for action_name in sorted(table.actions):
+                print self.program.actions[action_name].action_str()
+        return table
 
     # for debugging
     def print_set_default(self, table_name, action_name, runtime_data):
@@ -850,7 +1276,8 @@ class RuntimeAPI(object):
 
         runtime_data = self.parse_runtime_data(action, action_params)
 
-        self.print_set_default(table_name, action_name, runtime_data)
+        if self.verbose:
+            self.print_set_default(table_name, action_name, runtime_data)
 
         self.client.bm_mt_set_default_action(0, table.name, action.name, runtime_data)
 
@@ -886,15 +1313,18 @@ class RuntimeAPI(object):
 
         table = self.get_res("table", table_name, ResType.table)
         self.client.bm_mt_clear_entries(0, table.name, False)
+        if table.name in self.table_entries_match_to_handle:
+            self.table_entries_match_to_handle[table.name].clear()
+            self.table_entries_handle_to_match[table.name].clear()
 
     def load_table_to_all_names(self):
 
         d = {}
-        for table_name in self.get_tables():
+        for table_name in self.program.tables:
             #check if short name exists
             short_table_name = table_name.split(".")[-1]
             key = ResType.table, short_table_name
-            if key in SUFFIX_LOOKUP_MAP:
+            if key in self.program.suffix_lookup_map:
                 d[table_name] = [table_name, short_table_name]
 
             else:
@@ -934,10 +1364,9 @@ class RuntimeAPI(object):
         runtime_data = self.parse_runtime_data(action, action_params)
         match_keys = parse_match_key(table, match_keys)
 
-        print "Adding entry to", MatchType.to_str(table.match_type), "match table", table_name
-
-        # disable, maybe a verbose CLI option?
-        self.print_table_add(match_keys, action_name, runtime_data)
+        if self.verbose:
+            print "Adding entry to", MatchType.to_str(table.match_type), "match table", table_name
+            self.print_table_add(match_keys, action_name, runtime_data)
 
         entry_handle = self.client.bm_mt_add_entry(
             0, table.name, match_keys, action.name, runtime_data,
@@ -948,15 +1377,238 @@ class RuntimeAPI(object):
         #for sub_table_name in self.table_multiple_names[table.name]:
         try:
             entry_handle = int(entry_handle)
-            self.table_entries_match_to_handle[table.name][tuple(match_keys)] = entry_handle
+            self.track_entry(table, match_keys, entry_handle)
         except:
-            print "Could not add entry with handle %s" % entry_handle
+            if self.verbose:
+                print "Could not add entry with handle %s" % entry_handle
             return entry_handle
 
-        print "Entry has been added with handle", entry_handle
-        print
+        if self.verbose:
+            print "Entry has been added with handle", entry_handle
+            print
         return entry_handle
 
+    def parse_table_entries(self, table, entries):
+        """Parses entries given as in table_add_many.
+
+        Args:
+            table: Table object
+            entries: iterable of (action name, match keys, action params) or
+                     (action name, match keys, action params, priority) tuples
+
+        Returns:
+            (list of (entry index, action, match key, runtime data, priority),
+             dict mapping entry index to the UIn_Error raised parsing it)
+        """
+        is_ternary = table.match_type in {MatchType.TERNARY, MatchType.RANGE}
+        num_key_fields = table.num_key_fields()
+        actions = {}
+
+        parsed = []
+        errors = {}
+        for idx, entry in enumerate(entries):
+            try:
+                if len(entry) == 4:
+                    action_name, match_keys, action_params, prio = entry
+                else:
+                    action_name, match_keys, action_params = entry
+                    prio = None
+
+                action = actions.get(action_name, None)
+                if action is None:
+                    action = table.get_action(action_name)
+                    if action is None:
+                        raise UIn_Error(
+                            "Table %s has no action %s" % (table.name, action_name)
+                        )
+                    actions[action_name] = action
+
+                if is_ternary:
+                    try:
+                        priority = int(prio)
+                    except:
+                        raise UIn_Error(
+                            "Table is ternary, but could not extract a valid priority from args"
+                        )
+                else:
+                    priority = 0
+
+                if len(match_keys) != num_key_fields:
+                    raise UIn_Error(
+                        "Table %s needs %d key fields" % (table.name, num_key_fields)
+                    )
+
+                runtime_data = self.parse_runtime_data(action, action_params)
+                match_key = parse_match_key(table, match_keys)
+            except UIn_Error as e:
+                errors[idx] = e
+                continue
+
+            parsed.append((idx, action, match_key, runtime_data, priority))
+        return parsed, errors
+
+    @handle_bad_input
+    def table_add_many(self, table_name, entries, window=PIPELINE_WINDOW):
+        """Adds many entries to a match table with pipelined thrift calls.
+
+        Args:
+            table_name: name of the table
+            entries: iterable of (action name, match keys, action params) or
+                     (action name, match keys, action params, priority)
+                     tuples, with the same formats as table_add
+            window: maximum number of requests in flight
+
+        Returns:
+            BulkResult with the handle of every entry and the errors, by entry index
+        """
+
+        start = time.time()
+        table = self.get_res("table", table_name, ResType.table)
+        parsed, errors = self.parse_table_entries(table, entries)
+
+        handles = [None] * (len(parsed) + len(errors))
+        indexes = []
+        calls = []
+        match_keys_list = []
+        for idx, action, match_key, runtime_data, priority in parsed:
+            indexes.append(idx)
+            match_keys_list.append(match_key)
+            calls.append((0, table.name, match_key, action.name, runtime_data,
+                          BmAddEntryOptions(priority = priority)))
+
+        # hold the connection while the pipeline is in flight
+        with self.connection.lock:
+            try:
+                replies = pipeline_calls(self.client, "bm_mt_add_entry", calls, window)
+            except CONNECTION_ERRORS:
+                # unread replies are left on the socket
+                self.connection.close()
+                raise
+
+        for idx, match_key, (entry_handle, e) in zip(indexes, match_keys_list, replies):
+            if e is not None:
+                errors[idx] = e
+                continue
+            entry_handle = int(entry_handle)
+            handles[idx] = entry_handle
+            self.track_entry(table, match_key, entry_handle)
+
+        result = BulkResult(handles, errors, time.time() - start)
+        if self.verbose:
+            print "Added", result, "to", MatchType.to_str(table.match_type), "match table", table_name
+        return result
+
+    @handle_bad_input
+    def table_reconcile(self, table_name, entries, prune=True, window=PIPELINE_WINDOW):
+        """Makes the entries of a match table match a wanted set of entries.
+
+        The installed entries are read once and indexed by match key (and
+        priority), like the wanted ones, so only the entries that differ cost
+        a request: missing entries are added, entries with another action or
+        action data are modified and, with prune, entries that are not wanted
+        are deleted. Requests are pipelined.
+
+        Args:
+            table_name: name of the table (direct tables only)
+            entries: iterable of wanted entries, with the formats of table_add_many
+            prune: delete the installed entries that are not wanted
+            window: maximum number of requests in flight
+
+        Returns:
+            ReconcileResult
+        """
+
+        start = time.time()
+        table = self.get_res("table", table_name, ResType.table)
+        if table.type_ != TableType.simple:
+            raise UIn_Error("Table %s is not a direct table, it can not be reconciled" % table_name)
+        is_ternary = table.match_type in {MatchType.TERNARY, MatchType.RANGE}
+        result = ReconcileResult()
+
+        parsed, result.errors = self.parse_table_entries(table, entries)
+        wanted = {}
+        for idx, action, match_key, runtime_data, priority in parsed:
+            key = match_key_to_bytes(match_key, table), priority
+            if key in wanted:
+                result.errors[idx] = UIn_Error("Entry %d has the same match key as entry %d" % (idx, wanted[key][0]))
+                continue
+            wanted[key] = (idx, action, match_key, runtime_data, priority)
+
+        with self.connection.lock:
+            installed = {}
+            for entry in self.client.bm_mt_get_entries(0, table.name):
+                priority = entry.options.priority if is_ternary else 0
+                installed[(match_key_to_bytes(entry.match_key, table), priority)] = entry
+
+            to_add = []
+            to_modify = []
+            for key, (idx, action, match_key, runtime_data, priority) in wanted.items():
+                entry = installed.get(key, None)
+                if entry is None:
+                    to_add.append(key)
+                elif entry.action_entry.action_type != BmActionEntryType.ACTION_DATA or\
+                     entry.action_entry.action_name != action.name or\
+                     list(entry.action_entry.action_data) != list(runtime_data):
+                    to_modify.append(key)
+                else:
+                    result.unchanged += 1
+            to_delete = [key for key in installed if key not in wanted] if prune else []
+
+            try:
+                # deletes go first, to make room for the new entries
+                delete_replies = pipeline_calls(
+                    self.client, "bm_mt_delete_entry",
+                    [(0, table.name, installed[key].entry_handle) for key in to_delete], window)
+                modify_replies = pipeline_calls(
+                    self.client, "bm_mt_modify_entry",
+                    [(0, table.name, installed[key].entry_handle, wanted[key][1].name, wanted[key][3])
+                     for key in to_modify], window)
+                add_replies = pipeline_calls(
+                    self.client, "bm_mt_add_entry",
+                    [(0, table.name, wanted[key][2], wanted[key][1].name, wanted[key][3],
+                      BmAddEntryOptions(priority = wanted[key][4])) for key in to_add], window)
+            except CONNECTION_ERRORS:
+                # unread replies are left on the socket
+                self.connection.close()
+                # the tracked entries of the table are reloaded on demand
+                self.table_entries_match_to_handle.pop(table.name, None)
+                self.table_entries_handle_to_match.pop(table.name, None)
+                raise
+
+        # installed entries after the changes: (match key, priority) -> handle
+        handles = dict((key, entry.entry_handle) for key, entry in installed.items())
+        for key, (_, e) in zip(to_delete, delete_replies):
+            if e is not None:
+                result.delete_errors[installed[key].entry_handle] = e
+            else:
+                result.deleted += 1
+                del handles[key]
+        for key, (_, e) in zip(to_modify, modify_replies):
+            if e is not None:
+                result.errors[wanted[key][0]] = e
+            else:
+                result.modified += 1
+        for key, (entry_handle, e) in zip(to_add, add_replies):
+            if e is not None:
+                result.errors[wanted[key][0]] = e
+            else:
+                result.added += 1
+                handles[key] = int(entry_handle)
+
+        if self.track_entries:
+            match_to_handle = {}
+            handle_to_match = {}
+            for (match_bytes, _), entry_handle in handles.items():
+                match_to_handle[match_bytes] = entry_handle
+                handle_to_match[entry_handle] = match_bytes
+            self.table_entries_match_to_handle[table.name] = match_to_handle
+            self.table_entries_handle_to_match[table.name] = handle_to_match
+
+        result.elapsed = time.time() - start
+        if self.verbose:
+            print "Reconciled", MatchType.to_str(table.match_type), "match table", table_name + ":", result
+        return result
+
     @handle_bad_input
     def table_set_timeout(self, table_name, entry_handle, timeout_ms):
         "Set a timeout in ms for a given entry; the table has to support timeouts: table_set_timeout <table_name> <entry handle> <timeout (ms)>"
@@ -976,19 +1628,76 @@ class RuntimeAPI(object):
         except:
             raise UIn_Error("Bad format for timeout")
 
-        print "Setting a", timeout_ms, "ms timeout for entry", entry_handle
+        if self.verbose:
+            print "Setting a", timeout_ms, "ms timeout for entry", entry_handle
 
         self.client.bm_mt_set_entry_ttl(0, table.name, entry_handle, timeout_ms)
 
-    def get_handle_from_match(self, table_name, match_keys, pop=False):
+    def get_table_entries(self, table):
+        """Returns the match key -> handle dict of a table, None if entries are not tracked.
+
+        The dict is loaded from the switch the first time a table is used.
+        """
+        if not self.track_entries:
+            return None
+        match_to_handle = self.table_entries_match_to_handle.get(table.name, None)
+        if match_to_handle is None:
+            match_to_handle = {}
+            handle_to_match = {}
+            for entry in self.client.bm_mt_get_entries(0, table.name):
+                key = match_key_to_bytes(entry.match_key, table)
+                match_to_handle[key] = entry.entry_handle
+                handle_to_match[entry.entry_handle] = key
+            self.table_entries_match_to_handle[table.name] = match_to_handle
+            self.table_entries_handle_to_match[table.name] = handle_to_match
+        return match_to_handle
+
+    def track_entry(self, table, match_key, entry_handle):
+        """Records the handle of a new entry, given its parsed match key."""
+        match_to_handle = self.get_table_entries(table)
+        if match_to_handle is None:
+            return
+        key = match_key_to_bytes(match_key, table)
+        match_to_handle[key] = entry_handle
+        self.table_entries_handle_to_match[table.name][entry_handle] = key
+
+    def untrack_entry(self, table, entry_handle):
+        """Forgets a deleted entry."""
+        handle_to_match = self.table_entries_handle_to_match.get(table.name, None)
+        if handle_to_match is None:
+            return
+        key = handle_to_match.pop(entry_handle, None)
+        if key is not None:
+            self.table_entries_match_to_handle[table.name].pop(key, None)
+
+    def untrack_tables(self):
+        """Forgets all the tracked entries, they are loaded again on demand."""
+        self.table_entries_match_to_handle.clear()
+        self.table_entries_handle_to_match.clear()
+
+    def get_handle_from_match(self, table_name, match_keys, pop=False, prio=None):
+        """Returns the handle of the entry with the given match key, None if there is none.
+
+        Uses the tracked entries if enabled, otherwise asks the switch (prio is
+        then needed for ternary and range tables).
+        """
 
         table = self.get_res("table", table_name, ResType.table)
-        match_keys = map(str, match_keys)
-        key = tuple(parse_match_key(table, match_keys))
+        match_key = parse_match_key(table, match_keys)
+
+        match_to_handle = self.get_table_entries(table)
+        if match_to_handle is None:
+            priority = int(prio) if prio is not None else 0
+            try:
+                entry = self.client.bm_mt_get_entry_from_key(
+                    0, table.name, match_key, BmAddEntryOptions(priority = priority))
+            except InvalidTableOperation:
+                return None
+            return entry.entry_handle
 
-        entry_handle = self.table_entries_match_to_handle[table.name].get(key, None)
+        entry_handle = match_to_handle.get(match_key_to_bytes(match_key, table), None)
         if entry_handle is not None and pop:
-            del self.table_entries_match_to_handle[table.name][key]
+            self.untrack_entry(table, entry_handle)
 
         return entry_handle
 
@@ -1011,7 +1720,8 @@ class RuntimeAPI(object):
         action_params = action_parameters
         runtime_data = self.parse_runtime_data(action, action_params)
 
-        print "Modifying entry", entry_handle, "for", MatchType.to_str(table.match_type), "match table", table_name
+        if self.verbose:
+            print "Modifying entry", entry_handle, "for", MatchType.to_str(table.match_type), "match table", table_name
 
         #does not return anything
         self.client.bm_mt_modify_entry(
@@ -1032,21 +1742,22 @@ class RuntimeAPI(object):
     def table_delete(self, table_name, entry_handle):
         "Delete entry from a match table: table_delete <table name> <entry handle>"
 
-        #TODO: delete handle
-
         table = self.get_res("table", table_name, ResType.table)
         try:
             entry_handle = int(entry_handle)
         except:
             raise UIn_Error("Bad format for entry handle " + str(entry_handle))
 
-        print "Deleting entry", entry_handle, "from", table_name
+        if self.verbose:
+            print "Deleting entry", entry_handle, "from", table_name
         self.client.bm_mt_delete_entry(0, table.name, entry_handle)
+        self.untrack_entry(table, entry_handle)
 
     def table_delete_match(self, table_name, match_keys):
 
         entry_handle = self.get_handle_from_match(table_name, match_keys, pop=True)
-        print "trying to delete entry with handle ", entry_handle
+        if self.verbose:
+            print "trying to delete entry with handle ", entry_handle
         if entry_handle is not None:
             self.table_delete(table_name, entry_handle)
         else:
@@ -1085,7 +1796,8 @@ class RuntimeAPI(object):
         runtime_data = self.parse_runtime_data(action, action_params)
         mbr_handle = self.client.bm_mt_act_prof_add_member(
             0, act_prof.name, action.name, runtime_data)
-        print "Member has been created with handle", mbr_handle
+        if self.verbose:
+            print "Member has been created with handle", mbr_handle
 
         return mbr_handle
 
@@ -1270,8 +1982,10 @@ class RuntimeAPI(object):
 
         self.check_act_prof_ws(act_prof)
         grp_handle = self.client.bm_mt_act_prof_create_group(0, act_prof.name)
-        print "Group has been created with handle", grp_handle
+        if self.verbose:
+            print "Group has been created with handle", grp_handle
 
+        return grp_handle
 
     @handle_bad_input
     def act_prof_delete_group(self, act_prof_name, grp_handle):
@@ -1349,7 +2063,8 @@ class RuntimeAPI(object):
         "Create multicast group: mc_mgrp_create <group id>"
 
         mgrp = self.get_mgrp(mgrp)
-        print "Creating multicast group", mgrp
+        if self.verbose:
+            print "Creating multicast group", mgrp
         mgrp_hdl = self.mc_client.bm_mc_mgrp_create(0, mgrp)
         assert(mgrp == mgrp_hdl)
 
@@ -1360,7 +2075,8 @@ class RuntimeAPI(object):
         "Destroy multicast group: mc_mgrp_destroy <group id>"
 
         mgrp = self.get_mgrp(mgrp)
-        print "Destroying multicast group", mgrp
+        if self.verbose:
+            print "Destroying multicast group", mgrp
         self.mc_client.bm_mc_mgrp_destroy(0, mgrp)
 
     def ports_to_port_map_str(self, ports, description="port"):
@@ -1396,12 +2112,15 @@ class RuntimeAPI(object):
         port_map_str = self.ports_to_port_map_str(ports)
         lag_map_str = self.ports_to_port_map_str(lags, description="lag")
         if self.pre_type == PreType.SimplePre:
-            print "Creating node with rid", rid, "and with port map", port_map_str
+            if self.verbose:
+                print "Creating node with rid", rid, "and with port map", port_map_str
             l1_hdl = self.mc_client.bm_mc_node_create(0, rid, port_map_str)
         else:
-            print "Creating node with rid", rid, ", port map", port_map_str, "and lag map", lag_map_str
+            if self.verbose:
+                print "Creating node with rid", rid, ", port map", port_map_str, "and lag map", lag_map_str
             l1_hdl = self.mc_client.bm_mc_node_create(0, rid, port_map_str, lag_map_str)
-        print "node was created with handle", l1_hdl
+        if self.verbose:
+            print "node was created with handle", l1_hdl
 
         return l1_hdl
 
@@ -1419,10 +2138,12 @@ class RuntimeAPI(object):
         port_map_str = self.ports_to_port_map_str(ports)
         lag_map_str = self.ports_to_port_map_str(lags, description="lag")
         if self.pre_type == PreType.SimplePre:
-            print "Updating node", l1_hdl, "with port map", port_map_str
+            if self.verbose:
+                print "Updating node", l1_hdl, "with port map", port_map_str
             self.mc_client.bm_mc_node_update(0, l1_hdl, port_map_str)
         else:
-            print "Updating node", l1_hdl, "with port map", port_map_str, "and lag map", lag_map_str
+            if self.verbose:
+                print "Updating node", l1_hdl, "with port map", port_map_str, "and lag map", lag_map_str
             self.mc_client.bm_mc_node_update(0, l1_hdl, port_map_str, lag_map_str)
 
     @handle_bad_input_mc
@@ -1431,7 +2152,8 @@ class RuntimeAPI(object):
 
         mgrp = self.get_mgrp(mgrp)
         l1_hdl = self.get_node_handle(l1_hdl)
-        print "Associating node", l1_hdl, "to multicast group", mgrp
+        if self.verbose:
+            print "Associating node", l1_hdl, "to multicast group", mgrp
         self.mc_client.bm_mc_node_associate(0, mgrp, l1_hdl)
 
     @handle_bad_input_mc
@@ -1440,7 +2162,8 @@ class RuntimeAPI(object):
 
         mgrp = self.get_mgrp(mgrp)
         l1_hdl = self.get_node_handle(l1_hdl)
-        print "Dissociating node", l1_hdl, "from multicast group", mgrp
+        if self.verbose:
+            print "Dissociating node", l1_hdl, "from multicast group", mgrp
         self.mc_client.bm_mc_node_dissociate(0, mgrp, l1_hdl)
 
     @handle_bad_input_mc
@@ -1448,7 +2171,8 @@ class RuntimeAPI(object):
         "Destroy multicast node: mc_node_destroy <node handle>"
 
         l1_hdl = self.get_node_handle(l1_hdl)
-        print "Destroying node", l1_hdl
+        if self.verbose:
+            print "Destroying node", l1_hdl
         self.mc_client.bm_mc_node_destroy(0, l1_hdl)
 
     @handle_bad_input_mc
@@ -1466,7 +2190,8 @@ class RuntimeAPI(object):
         except:
             raise UIn_Error("Bad format for lag index")
         port_map_str = self.ports_to_port_map_str(ports, description="lag")
-        print "Setting lag membership:", lag_index, "<-", port_map_str
+        if self.verbose:
+            print "Setting lag membership:", lag_index, "<-", port_map_str
         self.mc_client.bm_mc_set_lag_membership(0, lag_index, port_map_str)
 
     @handle_bad_input_mc
@@ -1477,8 +2202,10 @@ class RuntimeAPI(object):
         try:
             mc_json = json.loads(json_dump)
         except:
-            print "Exception when retrieving MC entries"
-            return
+            raise UIn_Error("Exception when retrieving MC entries")
+
+        if not self.verbose:
+            return mc_json
 
         l1_handles = {}
         for h in mc_json["l1_handles"]:
@@ -1510,6 +2237,7 @@ class RuntimeAPI(object):
         else:
             print "None for this PRE type"
         print "=========="
+        return mc_json
 
     @handle_bad_input
     def load_new_config_file(self, filename):
@@ -1517,7 +2245,8 @@ class RuntimeAPI(object):
 
         if not os.path.isfile(filename):
             raise UIn_Error("Not a valid filename")
-        print "Loading new Json config"
+        if self.verbose:
+            print "Loading new Json config"
         with open(filename, 'r') as f:
             json_str = f.read()
             try:
@@ -1525,13 +2254,16 @@ class RuntimeAPI(object):
             except:
                 raise UIn_Error("Not a valid JSON file")
             self.client.bm_load_new_config(json_str)
-            load_json_str(json_str)
+            self.program = get_program_info(json_str)
+            self.untrack_tables()
 
     @handle_bad_input
     def swap_configs(self):
         "Swap the 2 existing configs, need to have called load_new_config_file before"
-        print "Swapping configs"
+        if self.verbose:
+            print "Swapping configs"
         self.client.bm_swap_configs()
+        self.untrack_tables()
 
     @handle_bad_input
     def meter_array_set_rates(self, meter_name, rates):
@@ -1599,13 +2331,15 @@ class RuntimeAPI(object):
         else:
             rates = self.client.bm_meter_get_rates(0, meter.name, index)
         if len(rates) != meter.rate_count:
-            print "WARNING: expected", meter.rate_count, "rates",
-            print "but only received", len(rates)
+            if self.verbose:
+                print "WARNING: expected", meter.rate_count, "rates",
+                print "but only received", len(rates)
 
         values = []
         for idx, rate in enumerate(rates):
-            print "{}: info rate = {}, burst size = {}".format(
-                idx, rate.units_per_micros, rate.burst_size)
+            if self.verbose:
+                print "{}: info rate = {}, burst size = {}".format(
+                    idx, rate.units_per_micros, rate.burst_size)
             values.append(rate.units_per_micros)
             values.append(rate.burst_size)
 
@@ -1622,13 +2356,15 @@ class RuntimeAPI(object):
             raise UIn_Error("Bad format for index")
         if counter.is_direct:
             table_name = counter.binding
-            print "this is the direct counter for table", table_name
+            if self.verbose:
+                print "this is the direct counter for table", table_name
             # index = index & 0xffffffff
             value = self.client.bm_mt_read_counter(0, table_name, index)
         else:
             value = self.client.bm_counter_read(0, counter.name, index)
 
-        print "%s[%d]= " % (counter_name, index), value
+        if self.verbose:
+            print "%s[%d]= " % (counter_name, index), value
         return value
 
 
@@ -1639,27 +2375,38 @@ class RuntimeAPI(object):
         counter = self.get_res("counter", counter_name, ResType.counter_array)
         if counter.is_direct:
             table_name = counter.binding
-            print "this is the direct counter for table", table_name
+            if self.verbose:
+                print "this is the direct counter for table", table_name
             self.client.bm_mt_reset_counters(0, table_name)
         else:
             self.client.bm_counter_reset_all(0, counter.name)
 
     @handle_bad_input
-    def counter_write(self, counter_name, index, value):
-        "Write a value to a counter index: counter_read <name> <entry handle> <value>"
+    def counter_write(self, counter_name, index, pkts, byts):
+        "Write a value to a counter index: counter_write <name> <index> <packets> <bytes>"
 
         counter = self.get_res("counter", counter_name, ResType.counter_array)
         try:
             index = int(index)
         except:
             raise UIn_Error("Bad format for index")
+        try:
+            pkts = int(pkts)
+        except:
+            raise UIn_Error("Bad format for packets")
+        try:
+            byts = int(byts)
+        except:
+            raise UIn_Error("Bad format for bytes")
+        value = BmCounterValue(packets=pkts, bytes=byts)
         if counter.is_direct:
             table_name = counter.binding
-            print "this is the direct counter for table", table_name
+            if self.verbose:
+                print "this is the direct counter for table", table_name
             # index = index & 0xffffffff
             self.client.bm_mt_write_counter(0, table_name, index, value)
         else:
-            self.client.bm_counter_read(0, counter.name, index, value)
+            self.client.bm_counter_write(0, counter.name, index, value)
 
     @handle_bad_input
     def register_read(self, register_name, index=None, show=False):
@@ -1673,12 +2420,12 @@ class RuntimeAPI(object):
             except:
                 raise UIn_Error("Bad format for index")
             value = self.client.bm_register_read(0, register.name, index)
-            if show:
+            if show and self.verbose:
                 print "{}[{}]=".format(register_name, index), value
             return value
         else:
             entries = self.client.bm_register_read_all(0, register.name)
-            if show:
+            if show and self.verbose:
                 sys.stderr.write("register index omitted, reading entire array\n")
                 print "{}=".format(register_name), ", ".join([str(e) for e in entries])
             return entries
@@ -1717,6 +2464,61 @@ class RuntimeAPI(object):
                                 ResType.register_array)
         self.client.bm_register_reset(0, register.name)
 
+    @handle_bad_input
+    def snapshot(self, register_names=(), counter_names=()):
+        """Reads whole register and counter arrays at once.
+
+        All the reads are pipelined on the switch connection. Indirect
+        counters are read one cell per request, as the switch has no call to
+        read a whole counter array.
+
+        Args:
+            register_names: names of the register arrays to read
+            counter_names: names of the (indirect) counter arrays to read
+
+        Returns:
+            Snapshot with numpy arrays (or array.array when numpy is missing)
+        """
+        registers = [(name, self.get_res("register", name, ResType.register_array))
+                     for name in register_names]
+        counters = [(name, self.get_res("counter", name, ResType.counter_array))
+                    for name in counter_names]
+        for name, counter in counters:
+            if counter.is_direct:
+                raise UIn_Error("Counter %s is direct, only indirect counters can be read in a snapshot" % name)
+
+        start = time.time()
+        with self.connection.lock:
+            try:
+                register_replies = pipeline_calls(
+                    self.client, "bm_register_read_all",
+                    [(0, register.name) for _, register in registers])
+                counter_replies = pipeline_calls(
+                    self.client, "bm_counter_read",
+                    [(0, counter.name, index) for _, counter in counters
+                     for index in xrange(counter.size)])
+            except CONNECTION_ERRORS:
+                # unread replies are left on the socket
+                self.connection.close()
+                raise
+        elapsed = time.time() - start
+
+        for _, e in register_replies + counter_replies:
+            if e is not None:
+                raise e
+
+        register_values = {}
+        for (name, register), (values, _) in zip(registers, register_replies):
+            register_values[name] = to_array(values, register.width)
+        counter_values = {}
+        offset = 0
+        for name, counter in counters:
+            replies = counter_replies[offset:offset + counter.size]
+            offset += counter.size
+            counter_values[name] = (to_array([value.bytes for value, _ in replies]),
+                                    to_array([value.packets for value, _ in replies]))
+        return Snapshot(start, elapsed, register_values, counter_values)
+
     def dump_action_and_data(self, action_name, action_data):
         def hexstr(v):
             return "".join("{:02x}".format(ord(c)) for c in v)
@@ -1802,7 +2604,9 @@ class RuntimeAPI(object):
             raise UIn_Error("Bad format for entry handle")
 
         entry = self.client.bm_mt_get_entry(0, table.name, entry_handle)
-        self.dump_one_entry(table, entry)
+        if self.verbose:
+            self.dump_one_entry(table, entry)
+        return entry
 
     @handle_bad_input
     def act_prof_dump_member(self, act_prof_name, mbr_handle):
@@ -1818,7 +2622,9 @@ class RuntimeAPI(object):
 
         member = self.client.bm_mt_act_prof_get_member(
             0, act_prof.name, mbr_handle)
-        self.dump_one_member(member)
+        if self.verbose:
+            self.dump_one_member(member)
+        return member
 
     @handle_bad_input
     def act_prof_dump_group(self, act_prof_name, grp_handle):
@@ -1833,19 +2639,25 @@ class RuntimeAPI(object):
 
         group = self.client.bm_mt_act_prof_get_group(
             0, act_prof.name, grp_handle)
-        self.dump_one_group(group)
+        if self.verbose:
+            self.dump_one_group(group)
+        return group
 
     def _dump_act_prof(self, act_prof):
         act_prof_name = act_prof.name
         members = self.client.bm_mt_act_prof_get_members(0, act_prof.name)
-        print "=========="
-        print "MEMBERS"
-        self.dump_members(members)
+        if self.verbose:
+            print "=========="
+            print "MEMBERS"
+            self.dump_members(members)
+        groups = []
         if act_prof.with_selection:
             groups = self.client.bm_mt_act_prof_get_groups(0, act_prof.name)
-            print "=========="
-            print "GROUPS"
-            self.dump_groups(groups)
+            if self.verbose:
+                print "=========="
+                print "GROUPS"
+                self.dump_groups(groups)
+        return members, groups
 
     @handle_bad_input
     def act_prof_dump(self, act_prof_name):
@@ -1853,18 +2665,15 @@ class RuntimeAPI(object):
 
         act_prof = self.get_res("action profile", act_prof_name,
                                 ResType.action_prof)
-        self._dump_act_prof(act_prof)
+        return self._dump_act_prof(act_prof)
 
 
     def load_table_entries_match_to_handle(self):
+        """Loads the entries of all the tables now instead of on first use."""
 
-        for table_name, table in self.get_tables().items():
-            #remove the entries if any
-            self.table_entries_match_to_handle[table_name].clear()
-            switch_entries = self.client.bm_mt_get_entries(0, table.name)
-            for entry in switch_entries:
-                self.table_entries_match_to_handle[table_name][tuple(entry.match_key)] = \
-                    entry.entry_handle
+        self.untrack_tables()
+        for table in self.program.tables.values():
+            self.get_table_entries(table)
 
     @handle_bad_input
     def table_dump(self, table_name):
@@ -1873,12 +2682,13 @@ class RuntimeAPI(object):
         table = self.get_res("table", table_name, ResType.table)
         entries = self.client.bm_mt_get_entries(0, table.name)
 
-        print "=========="
-        print "TABLE ENTRIES"
+        if self.verbose:
+            print "=========="
+            print "TABLE ENTRIES"
 
-        for e in entries:
-            print "**********"
-            self.dump_one_entry(table, e)
+            for e in entries:
+                print "**********"
+                self.dump_one_entry(table, e)
 
         if table.type_ == TableType.indirect or\
            table.type_ == TableType.indirect_ws:
@@ -1887,11 +2697,13 @@ class RuntimeAPI(object):
 
         # default entry
         default_entry = self.client.bm_mt_get_default_entry(0, table.name)
-        print "=========="
-        print "Dumping default entry"
-        self.dump_action_entry(default_entry)
+        if self.verbose:
+            print "=========="
+            print "Dumping default entry"
+            self.dump_action_entry(default_entry)
 
-        print "=========="
+            print "=========="
+        return entries, default_entry
 
     @handle_bad_input
     def table_dump_entry_from_key(self, table_name, match_keys, priority):
@@ -1917,7 +2729,9 @@ class RuntimeAPI(object):
 
         entry = self.client.bm_mt_get_entry_from_key(
             0, table.name, match_key, BmAddEntryOptions(priority = priority))
-        self.dump_one_entry(table, entry)
+        if self.verbose:
+            self.dump_one_entry(table, entry)
+        return entry
 
     @handle_bad_input
     def port_add(self, iface_name, port_num, pcap_path=""):
@@ -1944,6 +2758,8 @@ class RuntimeAPI(object):
     def show_ports(self):
         "Shows the ports connected to the switch: show_ports"
         ports = self.client.bm_dev_mgr_show_ports()
+        if not self.verbose:
+            return ports
         print "{:^10}{:^20}{:^10}{}".format(
             "port #", "iface name", "status", "extra info")
         print "=" * 50
@@ -1953,21 +2769,26 @@ class RuntimeAPI(object):
                 [k + "=" + v for k, v in port_info.extra.items()])
             print "{:^10}{:^20}{:^10}{}".format(
                 port_info.port_num, port_info.iface_name, status, extra_info)
+        return ports
 
     @handle_bad_input
     def switch_info(self):
         "Show some basic info about the switch: switch_info"
 
         info = self.client.bm_mgmt_get_info()
+        if not self.verbose:
+            return info
         attributes = [t[2] for t in info.thrift_spec[1:]]
         out_attr_w = 5 + max(len(a) for a in attributes)
         for a in attributes:
             print "{:{w}}: {}".format(a, getattr(info, a), w=out_attr_w)
+        return info
 
     @handle_bad_input
     def reset_state(self):
         "Reset all state in the switch (table entries, registers, ...), but P4 config is preserved: reset_state"
         self.client.bm_reset_state()
+        self.untrack_tables()
 
     @handle_bad_input
     def write_config_to_file(self, filename):
@@ -1991,7 +2812,7 @@ class RuntimeAPI(object):
         thrift_fn = {16: self.client.bm_set_crc16_custom_parameters,
                      32: self.client.bm_set_crc32_custom_parameters}[crc_width]
 
-        if name not in CUSTOM_CRC_CALCS or CUSTOM_CRC_CALCS[name] != crc_width:
+        if self.program.custom_crc_calcs.get(name, None) != crc_width:
             raise UIn_ResourceError("crc{}_custom".format(crc_width), name)
         config_args = [conversion_fn(a) for a in [polynomial, initial_remainder, final_xor_value]]
         config_args += [parse_bool(a) for a in [reflect_data, reflect_remainder]]
@@ -2008,36 +2829,40 @@ class RuntimeAPI(object):
         "Change the parameters for a custom crc32 hash: set_crc32_parameters <name> <polynomial> <initial remainder> <final xor value> <reflect data?> <reflect remainder?>"
         self.set_crc_parameters_common(name, polynomial, initial_remainder, final_xor_value, reflect_data, reflect_remainder, 32)
 
-    #Global Variable Getters
+    #Program Getters
 
-    @staticmethod
-    def get_tables():
-        return TABLES
+    # Called on an API object, get_tables() and friends return the objects of
+    # its program. Called on the class (deprecated), they return the ones of
+    # the program loaded last by any API object.
+    get_tables = ProgramGetter('tables')
+    get_action_profs = ProgramGetter('action_profs')
+    get_actions = ProgramGetter('actions')
+    get_meter_arrays = ProgramGetter('meter_arrays')
+    get_counter_arrays = ProgramGetter('counter_arrays')
+    get_register_arrays = ProgramGetter('register_arrays')
+    get_custom_crc_calcs = ProgramGetter('custom_crc_calcs')
+    get_suffix_lookup_map = ProgramGetter('suffix_lookup_map')
 
-    @staticmethod
-    def get_action_profs():
-        return ACTION_PROFS
+    def get_program_tables(self):
+        return self.program.tables
 
-    @staticmethod
-    def get_actions():
-        return ACTIONS
+    def get_program_action_profs(self):
+        return self.program.action_profs
 
-    @staticmethod
-    def get_meter_arrays():
-        return METER_ARRAYS
+    def get_program_actions(self):
+        return self.program.actions
 
-    @staticmethod
-    def get_counter_arrays():
-        return COUNTER_ARRAYS
+    def get_program_meter_arrays(self):
+        return self.program.meter_arrays
 
-    @staticmethod
-    def get_register_arrays():
-        return REGISTER_ARRAYS
+    def get_program_counter_arrays(self):
+        return self.program.counter_arrays
 
-    @staticmethod
-    def get_custom_crc_calcs():
-        return CUSTOM_CRC_CALCS
+    def get_program_register_arrays(self):
+        return self.program.register_arrays
 
-    @staticmethod
-    def get_suffix_lookup_map():
-        return SUFFIX_LOOKUP_MAP
+    def get_program_custom_crc_calcs(self):
+        return self.program.custom_crc_calcs
+
+    def get_program_suffix_lookup_map(self):
+        return self.program.suffix_lookup_map
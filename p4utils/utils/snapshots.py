@@ -0,0 +1,117 @@
+"""Whole-array snapshots of registers and counters.
+
+Thrift returns register and counter values as signed 64 bit integers, so
+values are stored as signed 64 bit integers too: in numpy int64 arrays
+when numpy is installed, and in `array.array('l')` objects otherwise (or
+lists, where C longs are 32 bits). Values wider than 64 bits do not fit
+either, they are kept in numpy object arrays or python lists.
+
+Deltas are computed modulo 2**64, so a counter wrapping around (or a value
+above 2**63 read as negative) still gives the right difference.
+"""
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# array.array typecode holding signed 64 bit integers, None if there is none
+INT64_TYPECODE = 'l' if array('l').itemsize == 8 else None
+
+def to_int64(value):
+    """Returns value modulo 2**64 as a signed 64 bit integer."""
+    return ((value + 2 ** 63) % 2 ** 64) - 2 ** 63
+
+def is_int64(value):
+    """Returns True if value fits in a signed 64 bit integer."""
+    return -2 ** 63 <= value < 2 ** 63
+
+def delta64(current, previous):
+    """Returns current - previous modulo 2**64, as a signed 64 bit integer."""
+    return to_int64(int(current) - int(previous))
+
+def to_array(values, bitwidth=64):
+    """Converts a list of integers into a numpy array or array.array.
+
+    Args:
+        values: list of integers, signed 64 bit values as returned by thrift
+                (larger unsigned values are wrapped)
+        bitwidth: maximum width of the values
+
+    Returns:
+        numpy int64 array (or array.array('l')) for bitwidths up to 64 bits,
+        a numpy object array (or list) otherwise
+    """
+    if bitwidth > 64:
+        return np.array(values, dtype=object) if np is not None else list(values)
+    try:
+        if np is not None:
+            return np.array(values, dtype=np.int64)
+        if INT64_TYPECODE is not None:
+            return array(INT64_TYPECODE, values)
+    except OverflowError:
+        return to_array([to_int64(value) for value in values], bitwidth)
+    return [to_int64(value) for value in values]
+
+def array_delta(current, previous):
+    """Returns current - previous, element-wise.
+
+    64 bit values are subtracted modulo 2**64 (a counter that wrapped around
+    gives its increment), in numpy arrays, arrays and lists alike. Wider
+    values are subtracted as they are.
+    """
+    if np is not None and isinstance(current, np.ndarray):
+        if current.dtype == np.int64:
+            # int64 arithmetic wraps around
+            with np.errstate(over='ignore'):
+                return current - previous
+        return current - previous
+    if isinstance(current, array):
+        return array(INT64_TYPECODE, [delta64(c, p) for c, p in zip(current, previous)])
+    # lists hold 64 bit values where C longs are 32 bits, and wider values
+    return [delta64(c, p) if is_int64(c) and is_int64(p) else c - p
+            for c, p in zip(current, previous)]
+
+class Snapshot(object):
+    """Values of a set of register and counter arrays, read at (about) the same time.
+
+    Attributes:
+        timestamp: time at which the snapshot was taken
+        elapsed: time it took to read all the arrays
+        registers: dict mapping register names to arrays of values
+        counters: dict mapping counter names to (bytes, packets) arrays
+    """
+
+    def __init__(self, timestamp, elapsed, registers=None, counters=None):
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+        self.registers = registers or {}
+        self.counters = counters or {}
+
+    def delta(self, previous):
+        """Returns the difference between this snapshot and an older one.
+
+        Args:
+            previous: older Snapshot of (at least) the same arrays
+
+        Returns:
+            Snapshot holding the per-cell differences, its elapsed attribute
+            is the time between the two snapshots
+        """
+        interval = self.timestamp - previous.timestamp
+        registers = dict((name, array_delta(values, previous.registers[name]))
+                         for name, values in self.registers.items()
+                         if name in previous.registers)
+        counters = {}
+        for name, (byte_values, packet_values) in self.counters.items():
+            if name in previous.counters:
+                previous_bytes, previous_packets = previous.counters[name]
+                counters[name] = (array_delta(byte_values, previous_bytes),
+                                  array_delta(packet_values, previous_packets))
+        return Snapshot(self.timestamp, interval, registers, counters)
+
+    def __repr__(self):
+        return "Snapshot(%d registers, %d counters, taken in %.3fs)" % (
+            len(self.registers), len(self.counters), self.elapsed)
@@ -32,6 +32,8 @@ def handle_bad_input(f):
     @wraps(f)
     @runtime_API.handle_bad_input
     def handle(*args, **kwargs):
+        if not args[0].verbose:
+            return f(*args, **kwargs)
         try:
             return f(*args, **kwargs)
         except InvalidMirroringOperation as e:
@@ -44,15 +46,19 @@ class SimpleSwitchAPI(runtime_API.RuntimeAPI):
     def get_thrift_services():
         return [("simple_switch", SimpleSwitch.Client)]
 
-    def __init__(self, thrift_port, thrift_ip = 'localhost', json_path=None):
+    def __init__(self, thrift_port, thrift_ip = 'localhost', json_path=None,
+                 output=runtime_API.OutputPolicy.PRINT, cache_program=False,
+                 track_entries=True, pool=None):
 
         pre_type = runtime_API.PreType.SimplePreLAG
 
         runtime_API.RuntimeAPI.__init__(self, thrift_port,
-                                        thrift_ip, pre_type, json_path)
+                                        thrift_ip, pre_type, json_path, output,
+                                        cache_program, track_entries, pool)
 
+        # shares the connection of the runtime API services
         self.sswitch_client = runtime_API.thrift_connect(
-            thrift_ip, thrift_port, SimpleSwitchAPI.get_thrift_services()
+            thrift_ip, thrift_port, SimpleSwitchAPI.get_thrift_services(), pool
         )[0]
 
 
@@ -117,17 +123,25 @@ class SimpleSwitchAPI(runtime_API.RuntimeAPI):
         "Display mirroring session: mirroring_get <mirror_id>"
         mirror_id = self.parse_int(mirror_id, "mirror_id")
         config = self.sswitch_client.mirroring_session_get(mirror_id)
-        print config
+        if self.verbose:
+            print config
+        return config
 
     @handle_bad_input
     def get_time_elapsed(self):
         "Get time elapsed (in microseconds) since the switch started: get_time_elapsed"
-        print self.sswitch_client.get_time_elapsed_us()
+        time_elapsed = self.sswitch_client.get_time_elapsed_us()
+        if self.verbose:
+            print time_elapsed
+        return time_elapsed
 
     @handle_bad_input
     def get_time_since_epoch(self):
         "Get time elapsed (in microseconds) since the switch clock's epoch: get_time_since_epoch"
-        print self.sswitch_client.get_time_since_epoch_us()
+        time_since_epoch = self.sswitch_client.get_time_since_epoch_us()
+        if self.verbose:
+            print time_since_epoch
+        return time_since_epoch
 
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+"""Shared thrift connections to bmv2 switches.
+
+A `SwitchConnection` keeps a single socket to a switch, multiplexed between
+all the thrift services (standard, simple_pre_lag, simple_switch, ...), so
+every API object talking to the same switch shares one file descriptor.
+Connections are opened on first use and reopened when a call fails because
+the switch went away (e.g. after `p4switch_reboot`).
+
+Only calls that can safely run twice (reads, and writes that set a value)
+are retried after reconnecting, see `RETRY_SAFE_CALLS`. Other calls may
+have reached the switch before the connection broke, they reconnect and
+raise the error.
+
+A `ConnectionPool` hands out one connection per (ip, port) and keeps at most
+`max_connections` sockets open, closing the least recently used ones (they
+reconnect transparently if they are used again).
+"""
+
+import socket
+import sys
+import threading
+from collections import OrderedDict
+
+from thrift.transport import TSocket
+from thrift.transport import TTransport
+from thrift.protocol import TBinaryProtocol
+from thrift.protocol import TMultiplexedProtocol
+
+# errors meaning the connection is broken
+CONNECTION_ERRORS = (TTransport.TTransportException, socket.error)
+
+# calls with the same effect when they run twice, retried after a reconnection
+RETRY_SAFE_CALLS = frozenset([
+    # reads
+    "bm_mgmt_get_info", "bm_get_config", "bm_get_config_md5", "bm_serialize_state",
+    "bm_dev_mgr_show_ports", "bm_mt_get_entries", "bm_mt_get_entry",
+    "bm_mt_get_entry_from_key", "bm_mt_get_default_entry", "bm_mt_get_num_entries",
+    "bm_mt_get_meter_rates", "bm_mt_read_counter", "bm_mt_act_prof_get_member",
+    "bm_mt_act_prof_get_members", "bm_mt_act_prof_get_group", "bm_mt_act_prof_get_groups",
+    "bm_counter_read", "bm_register_read", "bm_register_read_all", "bm_meter_get_rates",
+    "bm_mc_get_entries", "mirroring_session_get", "get_time_elapsed_us",
+    "get_time_since_epoch_us",
+    # writes setting a value
+    "bm_mt_set_default_action", "bm_mt_modify_entry", "bm_mt_set_entry_ttl",
+    "bm_mt_set_meter_rates", "bm_mt_write_counter", "bm_counter_write",
+    "bm_register_write", "bm_register_write_range", "bm_register_reset",
+    "bm_meter_set_rates", "bm_meter_array_set_rates", "set_egress_queue_depth",
+    "set_all_egress_queue_depths", "set_egress_queue_rate", "set_all_egress_queue_rates",
+])
+
+class ServiceClient(object):
+    """Thrift client of one service on a SwitchConnection.
+
+    Calls are serialized with the connection lock. If a call fails because
+    the connection is broken, the connection is reopened and, for the calls
+    in RETRY_SAFE_CALLS, the call is retried once. The send_<method> and
+    recv_<method> functions are passed through without retries, pipelined
+    callers should hold `lock`.
+    """
+
+    def __init__(self, connection, service_name, client):
+        self._connection = connection
+        self._service_name = service_name
+        self._client = client
+        self.lock = connection.lock
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        if name.startswith("send_") or name.startswith("recv_"):
+            def call(*args, **kwargs):
+                with self.lock:
+                    self._connection.open()
+                    return getattr(self._client, name)(*args, **kwargs)
+        else:
+            def call(*args, **kwargs):
+                return self._connection.call(self._client, name, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+class SwitchConnection(object):
+    """One multiplexed thrift connection to a switch.
+
+    Attributes:
+        thrift_ip: ip of the switch thrift server
+        thrift_port: port of the switch thrift server
+        lock: lock held while a request is in flight
+        reconnects: number of times the connection has been reopened
+    """
+
+    def __init__(self, thrift_ip, thrift_port, pool=None):
+        self.thrift_ip = thrift_ip
+        self.thrift_port = thrift_port
+        self.pool = pool
+        self.lock = threading.RLock()
+        self.reconnects = 0
+        self.transport = None
+        # service name -> raw thrift client
+        self.clients = {}
+
+    def is_open(self):
+        return self.transport is not None and self.transport.isOpen()
+
+    def _bind(self, service_name, client):
+        protocol = TMultiplexedProtocol.TMultiplexedProtocol(self.protocol, service_name)
+        client._iprot = client._oprot = protocol
+
+    def open(self):
+        """Opens the connection if it is not open yet.
+
+        Raises:
+            TTransportException: if the switch can not be reached
+        """
+        with self.lock:
+            if self.is_open():
+                return
+            transport = TTransport.TBufferedTransport(TSocket.TSocket(self.thrift_ip, self.thrift_port))
+            transport.open()
+            self.transport = transport
+            self.protocol = TBinaryProtocol.TBinaryProtocol(transport)
+            # existing clients are rebound to the new socket
+            for service_name, client in self.clients.items():
+                self._bind(service_name, client)
+        if self.pool is not None:
+            self.pool.opened(self)
+
+    def close(self):
+        with self.lock:
+            if self.transport is not None:
+                try:
+                    self.transport.close()
+                except CONNECTION_ERRORS:
+                    pass
+                self.transport = None
+
+    def reconnect(self):
+        with self.lock:
+            self.close()
+            self.reconnects += 1
+            self.open()
+
+    def call(self, client, method_name, *args, **kwargs):
+        """Calls a method of a client of this connection.
+
+        If the connection breaks during the call, it is reopened. The call is
+        then retried if it is in RETRY_SAFE_CALLS, otherwise the error is
+        raised, as the request may have reached the switch.
+        """
+        with self.lock:
+            self.open()
+            if self.pool is not None:
+                self.pool.used(self)
+            try:
+                return getattr(client, method_name)(*args, **kwargs)
+            except CONNECTION_ERRORS:
+                if method_name not in RETRY_SAFE_CALLS:
+                    exc_info = sys.exc_info()
+                    self.close()
+                    try:
+                        self.reconnects += 1
+                        self.open()
+                    except CONNECTION_ERRORS:
+                        # the next call tries again
+                        pass
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                self.reconnect()
+                return getattr(client, method_name)(*args, **kwargs)
+
+    def get_client(self, service_name, client_cls):
+        """Returns the ServiceClient of a service, creating it if needed."""
+        with self.lock:
+            client = self.clients.get(service_name, None)
+            if client is None:
+                # clients are bound to the socket when the connection opens
+                client = client_cls(None)
+                self.clients[service_name] = client
+                if self.is_open():
+                    self._bind(service_name, client)
+        return ServiceClient(self, service_name, client)
+
+    def check_health(self):
+        """Returns True if the switch answers a management request."""
+        from bm_runtime.standard import Standard
+        try:
+            self.get_client("standard", Standard.Client).bm_mgmt_get_info()
+            return True
+        except Exception:
+            self.close()
+            return False
+
+class ConnectionPool(object):
+    """Connections to many switches, one per (ip, port).
+
+    Attributes:
+        max_connections: maximum number of sockets kept open
+    """
+
+    def __init__(self, max_connections=256):
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        # (ip, port) -> SwitchConnection, least recently used first
+        self.connections = OrderedDict()
+
+    def get(self, thrift_ip, thrift_port):
+        """Returns the connection to a switch (not opened yet if it is new)."""
+        key = (thrift_ip, int(thrift_port))
+        with self.lock:
+            connection = self.connections.get(key, None)
+            if connection is None:
+                connection = self.connections[key] = SwitchConnection(thrift_ip, int(thrift_port), self)
+        return connection
+
+    def used(self, connection):
+        """Marks a connection as the most recently used one."""
+        key = (connection.thrift_ip, connection.thrift_port)
+        with self.lock:
+            if key in self.connections:
+                self.connections[key] = self.connections.pop(key)
+
+    def opened(self, connection):
+        """Closes the least recently used idle connections above max_connections."""
+        self.used(connection)
+        with self.lock:
+            open_connections = [c for c in self.connections.values() if c.is_open()]
+        for c in open_connections[:max(0, len(open_connections) - self.max_connections)]:
+            # connections in use are skipped, they are not idle
+            if c is not connection and c.lock.acquire(False):
+                try:
+                    c.close()
+                finally:
+                    c.lock.release()
+
+    def check_health(self):
+        """Returns a dict mapping (ip, port) to the health of its switch."""
+        with self.lock:
+            connections = self.connections.items()
+        return dict((key, c.check_health()) for key, c in connections)
+
+    def close_all(self):
+        with self.lock:
+            connections = self.connections.values()
+        for c in connections:
+            c.close()
+
+# pool used by RuntimeAPI objects unless told otherwise
+default_pool = ConnectionPool()
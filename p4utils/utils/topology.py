@@ -5,7 +5,7 @@ import pprint
 import networkx as nx
 from ipaddress import ip_interface
 
-from p4utils import NodeDoesNotExist, InvalidHostIP
+from p4utils import NodeDoesNotExist, InvalidHostIP, InvalidHostMAC
 from p4utils.logger import log
 
 
@@ -33,6 +33,40 @@ class TopologyDB(object):
             self.load(db)
         else:
             log.warning('Topology instantiated without any data')
+        self.build_indexes()
+
+    def build_indexes(self):
+        """Builds the lookup tables used by the query methods.
+
+        Called once the network is loaded, call it again after modifying
+        _network.
+        """
+        # type ('host', 'switch', 'controller' or 'p4switch') -> {node: properties}
+        self._nodes_by_type = {}
+        # (node, port number) -> neighbor and interface
+        self._port_to_node = {}
+        self._port_to_intf = {}
+        # host interface mac -> host
+        self._mac_to_host = {}
+        # node -> hosts connected to it
+        self._hosts_connected_to = {}
+        # switch -> set of host networks, filled on demand
+        self._direct_host_networks = {}
+
+        for name, props in self._network.items():
+            self._nodes_by_type.setdefault(props['type'], {})[name] = props
+            if props['type'] == 'switch' and props.get('subtype', None) == 'p4switch':
+                self._nodes_by_type.setdefault('p4switch', {})[name] = props
+            interfaces_to_port = props.get('interfaces_to_port', {})
+            for intf, port in interfaces_to_port.items():
+                self._port_to_intf[(name, port)] = intf
+            for intf, neighbor in props.get('interfaces_to_node', {}).items():
+                port = interfaces_to_port.get(intf, None)
+                if port is not None:
+                    self._port_to_node[(name, port)] = neighbor
+                if props['type'] == 'host':
+                    self._mac_to_host[props[neighbor]['mac'].lower()] = name
+                    self._hosts_connected_to.setdefault(neighbor, []).append(name)
 
     def __iter__(self):
         """Enables iteration on this object"""
@@ -251,7 +285,8 @@ class TopologyDBP4(TopologyDB):
             if intf.params.get('sw_ip', None):
                 intf.ip, intf.prefixLen = intf.params['sw_ip'].split("/")
 
-        self._add_node(node, {'type': 'switch', 'subtype': 'p4switch', 'sw_id': node.device_id}) # 'thrift_port': node.thrift_port, 
+        self._add_node(node, {'type': 'switch', 'subtype': 'p4switch', 'sw_id': node.device_id,
+                              'thrift_port': node.thrift_port})
 
         # clean the IPs, this seems to make no sense, but when the p4switch is
         # started again, if the interface has an IP, the interface is not added
@@ -263,13 +298,11 @@ class TopologyDBP4(TopologyDB):
                 continue
             intf.ip, intf.prefixLen = None, None
 
-    # def get_thrift_port(self, switch):
+    def get_thrift_port(self, switch):
         """Return the Thrift port used to communicate with the P4 switch."""
-        """
         if self._node(switch).get('subtype', None) != 'p4switch':
             raise TypeError('%s is not a P4 switch' % switch)
         return self._node(switch)['thrift_port']
-        """
 
 class Topology(TopologyDBP4):
     """
@@ -340,6 +373,17 @@ class Topology(TopologyDBP4):
         nhop = self.get_interfaces_to_node(name)[intf]
         return self[name][nhop]['mac']
 
+    def get_host_name_from_mac(self, mac):
+        """Returns the host name to a MAC address.
+
+        Args:
+            mac: mac of one of the host's interfaces
+        """
+        name = self._mac_to_host.get(mac.lower(), None)
+        if name:
+            return name
+        raise InvalidHostMAC(mac)
+
     def is_host(self, node):
         """Checks if node is a host.
 
@@ -375,15 +419,15 @@ class Topology(TopologyDBP4):
 
     def get_hosts(self):
         """Returns the hosts from the topologyDB."""
-        return {node: self[node] for node in self if self.is_host(node)}
+        return dict(self._nodes_by_type.get('host', {}))
 
     def get_switches(self):
         """Returns the switches from the topologyDB."""
-        return {node: self[node] for node in self if self.is_switch(node)}
+        return dict(self._nodes_by_type.get('switch', {}))
 
     def get_p4switches(self):
         """Returns the P4 switches from the topologyDB."""
-        return {node: self[node] for node in self if self.is_p4switch(node)}
+        return dict(self._nodes_by_type.get('p4switch', {}))
 
     def get_host_first_interface(self, name):
         """Returns the first interface from a host. Assume it's single-homed.
@@ -433,8 +477,8 @@ class Topology(TopologyDBP4):
         Returns: list of hosts
 
         """
-        nodes = self.get_neighbors(node)
-        return [host for host in nodes if self.get_node_type(host) == 'host']
+        self._node(node)
+        return list(self._hosts_connected_to.get(node, []))
 
     def get_direct_host_networks_from_switch(self, switch):
         """
@@ -446,11 +490,12 @@ class Topology(TopologyDBP4):
         Returns: Returns set of networks
 
         """
-        networks = []
-        hosts = self.get_hosts_connected_to(switch)
-        for host in hosts:
-            sub_nets = [self.subnet(host, neighbor) for neighbor in self[host]['interfaces_to_node'].values()]
-            networks += sub_nets
+        networks = self._direct_host_networks.get(switch, None)
+        if networks is None:
+            networks = set()
+            for host in self.get_hosts_connected_to(switch):
+                networks.update(self.subnet(host, neighbor) for neighbor in self[host]['interfaces_to_node'].values())
+            self._direct_host_networks[switch] = networks
         return set(networks)
 
     def get_interfaces_to_node(self, node):
@@ -490,6 +535,26 @@ class Topology(TopologyDBP4):
         """
         return self[node]['interfaces_to_port'][intf]
 
+    def port_to_node(self, node, port):
+        """
+        Returns name of the neighbor connected to node's port
+
+        Args:
+            node: node we are quering
+            port: port number
+        """
+        return self._port_to_node[(node, port)]
+
+    def port_to_interface(self, node, port):
+        """
+        Returns name of node's interface with the given port number
+
+        Args:
+            node: node we are quering
+            port: port number
+        """
+        return self._port_to_intf[(node, port)]
+
     def node_to_node_port_num(self, node1, node2):
         """
         Returns the port number from node1 point of view that connects to node2
@@ -522,6 +587,36 @@ class Topology(TopologyDBP4):
         """
         return self.network_graph.get_paths_between_nodes(node1, node2)
 
+    def get_number_of_shortest_paths_between_nodes(self, node1, node2):
+        """
+        Returns the number of shortest paths between node1 and node2
+        Args:
+            node1: src node
+            node2: dst node
+
+        Returns: number of paths (0 if node2 can not be reached)
+
+        """
+        return self.network_graph.get_number_of_paths_between_nodes(node1, node2)
+
+    def get_shortest_paths_next_hops(self, node1, node2):
+        """
+        Returns the neighbors of node1 on a shortest path to node2 (e.g. the ECMP next hops)
+        Args:
+            node1: src node
+            node2: dst node
+
+        Returns: List of neighbors
+
+        """
+        return self.network_graph.get_next_hops(node1, node2)
+
+    def precompute_paths(self):
+        """
+        Computes the shortest paths between all nodes once, see NetworkGraph.precompute_paths
+        """
+        self.network_graph.precompute_paths()
+
     def get_cpu_port_intf(self, p4switch, cpu_node='sw-cpu'):
         """
         Returns the port index of p4switch's cpu port
@@ -561,11 +656,19 @@ class NetworkGraph(nx.Graph):
     using networkx useful graph algorithms. For instance we can easily
     get short paths between two nodes.
 
+    Shortest paths are computed on every query by default. After calling
+    precompute_paths, a Dijkstra run per source node is kept (as its
+    predecessor lists and path counts) and answers the path, path count and
+    next hop queries, until the graph changes.
+
     Attributes:
         topology_db: TopologyDB object. It is used to load the networkx object.
     """
 
     def __init__(self, topology_db, *args, **kwargs):
+        # source node -> (predecessors, path counts), see precompute_paths
+        self._paths_table = {}
+        self._precompute_paths = False
         super(NetworkGraph, self).__init__(*args, **kwargs)
 
         self.topology_db = topology_db
@@ -581,6 +684,17 @@ class NetworkGraph(nx.Graph):
         """Connects node1 and node2 using an edge"""
         if node1 in self.node and node2 in self.node:
             super(NetworkGraph, self).add_edge(node1, node2)
+            self.invalidate_paths()
+
+    def remove_edge(self, node1, node2):
+        """Removes the edge between node1 and node2"""
+        super(NetworkGraph, self).remove_edge(node1, node2)
+        self.invalidate_paths()
+
+    def remove_node(self, node):
+        """Removes node and its edges"""
+        super(NetworkGraph, self).remove_node(node)
+        self.invalidate_paths()
 
     def add_node(self, node, attributes):
         """
@@ -601,6 +715,7 @@ class NetworkGraph(nx.Graph):
             if neighbor_node in self.nodes():
                 weight = attributes[neighbor_node].get("weight", 1)
                 super(NetworkGraph, self).add_edge(node, neighbor_node, weight=weight)
+        self.invalidate_paths()
 
     def set_node_shape(self, node, shape):
         """Sets node's shape. Used when plotting the network"""
@@ -655,26 +770,115 @@ class NetworkGraph(nx.Graph):
         """Return all neighbors for a given node."""
         return self.adj[node].keys()
 
+    def precompute_paths(self, sources=None):
+        """Keeps the shortest paths from every source node instead of computing them per query.
+
+        The tables are dropped when nodes or edges are added or removed through
+        this object, call invalidate_paths after changing the graph (e.g. edge
+        weights) any other way.
+
+        Args:
+            sources: nodes to compute the tables of now, the other nodes get
+                     theirs on their first query. All the nodes by default.
+        """
+        self._precompute_paths = True
+        for source in (self.nodes() if sources is None else sources):
+            self._get_paths_table(source)
+
+    def invalidate_paths(self):
+        """Drops the precomputed shortest paths, they are computed again on demand."""
+        self._paths_table.clear()
+
+    def _get_paths_table(self, source):
+        """Returns (predecessors, path counts) of the shortest paths from source.
+
+        predecessors maps every node reachable from source to the tuple of its
+        neighbors one hop closer to source, path counts maps them to their
+        number of shortest paths from source.
+        """
+        table = self._paths_table.get(source, None)
+        if table is not None:
+            return table
+
+        pred, _ = nx.dijkstra_predecessor_and_distance(self, source, weight='weight')
+        pred = dict((node, tuple(node_pred)) for node, node_pred in pred.iteritems())
+        counts = {source: 1}
+        for node in pred:
+            stack = [node]
+            while stack:
+                top = stack[-1]
+                if top in counts:
+                    stack.pop()
+                    continue
+                missing = [p for p in pred[top] if p not in counts]
+                if missing:
+                    stack.extend(missing)
+                else:
+                    counts[top] = sum(counts[p] for p in pred[top])
+                    stack.pop()
+
+        table = pred, counts
+        if self._precompute_paths:
+            self._paths_table[source] = table
+        return table
+
     def total_number_of_paths(self):
         """Returns the total number of shortests paths between all host pairs in the network"""
         total_paths = 0
-        for host in self.get_hosts():
-            for host_pair in self.get_hosts():
+        hosts = self.get_hosts()
+        for host in hosts:
+            _, counts = self._get_paths_table(host)
+            for host_pair in hosts:
                 if host == host_pair:
                     continue
-
-                # compute the number of paths
-                npaths = sum(1 for _ in nx.all_shortest_paths(self, host, host_pair, 'weight'))
-                total_paths += npaths
+                total_paths += counts.get(host_pair, 0)
 
         return total_paths
 
     def get_paths_between_nodes(self, node1, node2):
         """Compute the paths between two nodes."""
-        paths = nx.all_shortest_paths(self, node1, node2, 'weight')
-        paths = [tuple(x) for x in paths]
+        if not self._precompute_paths:
+            paths = nx.all_shortest_paths(self, node1, node2, 'weight')
+            paths = [tuple(x) for x in paths]
+            return paths
+
+        # same walk (and path order) as nx.all_shortest_paths
+        pred, _ = self._get_paths_table(node1)
+        if node2 not in pred:
+            raise nx.NetworkXNoPath('Target {} cannot be reached'
+                                    'from Source {}'.format(node2, node1))
+        paths = []
+        stack = [[node2, 0]]
+        top = 0
+        while top >= 0:
+            node, i = stack[top]
+            if node == node1:
+                paths.append(tuple(p for p, n in reversed(stack[:top + 1])))
+            if len(pred[node]) > i:
+                top += 1
+                if top == len(stack):
+                    stack.append([pred[node][i], 0])
+                else:
+                    stack[top] = [pred[node][i], 0]
+            else:
+                stack[top - 1][1] += 1
+                top -= 1
         return paths
 
+    def get_number_of_paths_between_nodes(self, node1, node2):
+        """Returns the number of shortest paths between two nodes (0 if there is none)."""
+        _, counts = self._get_paths_table(node1)
+        return counts.get(node2, 0)
+
+    def get_next_hops(self, node1, node2):
+        """Returns the neighbors of node1 that are on a shortest path to node2.
+
+        The graph is undirected, so these are node1's predecessors in the
+        shortest paths from node2.
+        """
+        pred, _ = self._get_paths_table(node2)
+        return list(pred.get(node1, ()))
+
 if __name__ == '__main__':
     import sys
 
@@ -2,12 +2,18 @@ from __future__ import print_function
 import sys, os
 import subprocess
 import json
+import time
+import socket
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from mininet import log
 import mininet.clean
 
 from p4utils import DEFAULT_COMPILER, DEFAULT_CLI
-
-import psutil
+from p4utils.utils.compile_cache import CompileCache, DEFAULT_CACHE_DIR
+from p4utils.utils.include_graph import IncludeGraph
 
 def cleanup():
     mininet.clean.cleanup()
@@ -16,11 +22,98 @@ def cleanup():
         mininet.clean.sh("ifconfig %s down" %bridge)
         mininet.clean.sh("brctl delbr %s" % bridge)
 
-def check_listening_on_port(port):
-    for c in psutil.net_connections(kind='inet'):
-        if c.status == 'LISTEN' and c.laddr[1] == port:
-            return True
-    return False
+def check_listening_on_port(port, host='localhost'):
+    """Check if a process is listening on a TCP port.
+
+    Uses a single connection attempt instead of scanning all the sockets of
+    the host. Only servers reachable through host are detected.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(0.5)
+    try:
+        return sock.connect_ex((host, port)) == 0
+    finally:
+        sock.close()
+
+def check_port_free(port):
+    """Check if a TCP port can be bound (i.e. nobody is listening on it)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(('', port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+class PortAllocator(object):
+    """Hands out free TCP ports, starting from a base port.
+
+    Ports are probed by binding them once, ports already in use are skipped,
+    and every port is handed out only once. Allocation is thread safe.
+
+    Attributes:
+        next_port: next port number that will be probed
+    """
+
+    def __init__(self, first_port):
+        self.next_port = first_port
+        self._lock = threading.Lock()
+
+    def reserve(self, count):
+        """Returns a list of count free ports."""
+        ports = []
+        with self._lock:
+            while len(ports) < count:
+                port = self.next_port
+                if port > 65535:
+                    raise Exception('No free TCP ports left')
+                self.next_port += 1
+                if check_port_free(port):
+                    ports.append(port)
+                else:
+                    log.debug('Port %d is in use, skipping it\n' % port)
+        return ports
+
+    def allocate(self):
+        """Returns one free port."""
+        return self.reserve(1)[0]
+
+def wait_for_port(port, pid=None, timeout=10, host='localhost', max_delay=0.5):
+    """Wait until a TCP port accepts connections.
+
+    The port is probed with an exponentially increasing delay between
+    attempts (starting at 10ms, capped at max_delay).
+
+    Args:
+        port: TCP port to probe
+        pid: if given, stop waiting as soon as this process is gone
+        timeout: seconds to wait before giving up
+        host: address to connect to
+        max_delay: maximum delay between two probes
+
+    Returns:
+        True if the port is accepting connections, False if the process
+        died or the timeout expired
+    """
+    deadline = time.time() + timeout
+    delay = 0.01
+    while True:
+        if pid is not None and not os.path.exists(os.path.join("/proc", str(pid))):
+            return False
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(0.5)
+        try:
+            if sock.connect_ex((host, port)) == 0:
+                return True
+        finally:
+            sock.close()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
 
 class CompilationError(Exception):
     pass
@@ -53,55 +146,70 @@ def last_modified(input_file, output_file):
 
     return os.path.getmtime(input_file) > os.path.getmtime(output_file)
 
-def get_imported_files(input_file):
-    includes = []
-
-    with open(input_file, "r") as f:
-        lines = f.readlines()
-
-    for line in lines:
-        tmp = line.strip()
-        if tmp.startswith("#include"):
-            file_name = tmp.split(" ")[1]
-
-            # find if it is surrounded by <>
-            if  not (file_name.startswith("<") and file_name.endswith(">")):
-                includes.append(file_name.strip('"'))
-
-    return includes
-
-def check_imports_last_modified(input_file, import_last_modifications):
+def check_imports_last_modified(input_file, import_last_modifications, options=None):
     """Check if imports/includes in main P4 program have been modified.
 
+    All the files transitively included by the program are checked, resolved
+    relative to the including file and to the -I paths found in options.
+
     Args:
         input_file: path to main P4 file
         import_last_modifications: dict where time of last modification of each P4 file is saved
+        options: compiler options string
+
+    Raises:
+        IOError: if an included file does not exist
     """
-    previous_path = os.getcwd()
-    imported_files = get_imported_files(input_file)
-    #move to the main file path so we check input files relative to that
-    dst_dir = os.path.dirname(input_file)
-    if not dst_dir:
-        dst_dir = "./"
-    os.chdir(dst_dir)
+    try:
+        imported_files = IncludeGraph.from_options(options).dependencies(input_file)
+    except IOError as e:
+        log.error("%s\n" % e)
+        raise
+
     compile_flag = False
     for import_file in imported_files:
-
-        if not os.path.exists(import_file):
-            log.error("File %s does not exist \n" % import_file)
-
-            os.chdir(previous_path)
-            raise IOError
-
         # add if they are bigger or not.
         last_time = os.path.getmtime(import_file)
         if last_time > import_last_modifications.get(import_file, 0):
             import_last_modifications[import_file] = last_time
             compile_flag = True
 
-    os.chdir(previous_path)
     return compile_flag
 
+def run_node_scripts(node_scripts):
+    """Run one shell script per mininet node, all nodes in parallel.
+
+    Every script is written to a temporary file and executed by the node's
+    shell with a single command, which avoids one shell round-trip per
+    command and the length limit of the node's terminal line.
+
+    Args:
+        node_scripts: dict of mininet node -> list of shell command lines
+
+    Returns:
+        dict of mininet node -> output of its script
+    """
+    script_files = {}
+    outputs = {}
+    try:
+        for node, lines in node_scripts.items():
+            if not lines:
+                continue
+            fd, path = tempfile.mkstemp(prefix='p4utils-%s-' % node.name, suffix='.sh')
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            script_files[node] = path
+
+        # start all the scripts before waiting for any of them
+        for node, path in script_files.items():
+            node.sendCmd('sh %s' % path)
+        for node in script_files:
+            outputs[node] = node.waitOutput()
+    finally:
+        for path in script_files.values():
+            os.remove(path)
+    return outputs
+
 def load_conf(conf_file):
     with open(conf_file, 'r') as f:
         config = json.load(f)
@@ -120,17 +228,15 @@ def read_entries(filename):
         entries = [x.strip() for x in f.readlines() if x.strip() != ""]
     return entries
 
-def compile_p4_to_bmv2(config):
-    """Compile P4 program to JSON file that can be loaded by bmv2.
+def get_compiler_command(config):
+    """Build the compiler command line for a P4 program.
 
     Args:
         config: dictionary with info about P4 version and P4 file to compile
 
     Returns:
-        Compiled P4 program as a JSON file
-
-    Raises:
-        CompilationError: if compilation is not successful
+        (command, output_file) tuple, where command is the shell command that
+        compiles the program and output_file the JSON file it produces
     """
     compiler_args = []
 
@@ -165,18 +271,163 @@ def compile_p4_to_bmv2(config):
         log_error("Unknown P4 file %s" % program_file)
         sys.exit(1)
 
-    print (compiler + ' %s' % ' '.join(compiler_args))
-    return_value = run_command(compiler + ' %s' % ' '.join(compiler_args))
+    return compiler + ' %s' % ' '.join(compiler_args), output_file
+
+def compile_p4_to_bmv2(config):
+    """Compile P4 program to JSON file that can be loaded by bmv2.
+
+    Args:
+        config: dictionary with info about P4 version and P4 file to compile
+
+    Returns:
+        Compiled P4 program as a JSON file
+
+    Raises:
+        CompilationError: if compilation is not successful
+    """
+    command, output_file = get_compiler_command(config)
+
+    print (command)
+    return_value = run_command(command)
 
     if return_value != 0:
         raise CompilationError
 
     return output_file
 
+class CompilationJob(object):
+    """Compilation of one (program, options, compiler) tuple.
+
+    Attributes:
+        program: path to the P4 program
+        options: compiler options string
+        compiler: compiler executable
+        command: shell command used to compile the program
+        output_file: JSON file produced by the compiler
+        return_code: exit status of the compiler (None until the job runs)
+        stdout: captured compiler standard output
+        stderr: captured compiler standard error
+        elapsed: seconds spent running the job
+        cached: True if the outputs were restored from the compilation cache
+    """
+
+    def __init__(self, program, options, compiler):
+        self.program = program
+        self.options = options
+        self.compiler = compiler
+        self.command, self.output_file = get_compiler_command(self.config())
+
+        self.return_code = None
+        self.stdout = ""
+        self.stderr = ""
+        self.elapsed = None
+        self.cached = False
+
+    @property
+    def key(self):
+        return self.program, self.options, self.compiler
+
+    def config(self):
+        return {"program": self.program, "options": self.options, "compiler": self.compiler}
+
+    def succeeded(self):
+        return self.return_code == 0
+
+    def run(self, cache=None):
+        """Run the compiler capturing its output.
+
+        Args:
+            cache: CompileCache used to skip the compiler when the program
+                   has already been compiled
+
+        Returns:
+            the job itself, so it can be used directly as a pool task
+        """
+        start = time.time()
+        cache_key = cache.job_key(self) if cache else None
+        if cache and cache.restore(self, cache_key):
+            self.cached = True
+            self.return_code = 0
+            self.elapsed = time.time() - start
+            return self
+
+        log.debug(self.command + "\n")
+        p = subprocess.Popen(self.command, shell=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.stdout, self.stderr = p.communicate()
+        self.return_code = p.returncode
+        self.elapsed = time.time() - start
+
+        if cache and self.succeeded():
+            cache.store(self, cache_key, start)
+        return self
+
+def run_compilation_jobs(jobs, max_jobs=None, cache=None):
+    """Run compilation jobs on a bounded pool of compiler processes.
+
+    Every job spawns its own compiler process, the pool only bounds how many
+    of them run at the same time.
+
+    Args:
+        jobs: list of CompilationJob objects
+        max_jobs: maximum number of compilers running in parallel
+                  (defaults to the number of CPUs)
+        cache: optional CompileCache shared by all the jobs
+
+    Raises:
+        CompilationError: if any job fails. Failures are reported in the same
+        order as jobs, regardless of which compiler finished first.
+    """
+    if not jobs:
+        return
+
+    if not max_jobs:
+        max_jobs = multiprocessing.cpu_count()
+    max_jobs = max(1, min(int(max_jobs), len(jobs)))
+
+    start = time.time()
+    if max_jobs == 1:
+        for job in jobs:
+            job.run(cache)
+    else:
+        pool = ThreadPool(max_jobs)
+        try:
+            pool.map(lambda job: job.run(cache), jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    failed = []
+    for job in jobs:
+        if job.cached:
+            log.info("Using cached compilation of %s\n" % job.program)
+        elif job.succeeded():
+            print (job.command)
+            log.info("Compiled %s in %.2fs\n" % (job.program, job.elapsed))
+            if job.stderr:
+                log.info(job.stderr)
+        else:
+            failed.append(job)
+            print (job.command)
+            log.error("Compilation of %s failed (exit status %d) after %.2fs:\n%s\n" %
+                      (job.program, job.return_code, job.elapsed, job.stderr))
+
+    log.info("Compiled %d P4 program(s) in %.2fs using %d job(s)\n" %
+             (len(jobs), time.time() - start, max_jobs))
+
+    if failed:
+        raise CompilationError("Failed to compile: %s" % ", ".join(job.program for job in failed))
+
 def compile_all_p4(config):
     """Compiles all the .p4 files that are found in the project configuration file.
     Avoid compiling the same P4 program twice.
 
+    The distinct (program, options, compiler) tuples are collected first and
+    then compiled in parallel, using at most `compile_jobs` compilers at once.
+    Unless `compile_cache` is disabled, programs whose sources, includes,
+    options and compiler did not change are restored from the compilation
+    cache (`compile_cache_dir`) instead of being compiled again.
+
     Args:
         config: dictionary of topology configuration (from configuration file)
 
@@ -184,7 +435,6 @@ def compile_all_p4(config):
         dictionary of JSON file names, keyed by switch names
     """
     switch_to_json = {}
-    p4programs_already_compiled = {}
     topo = config.get("topology", None)
 
     #mandatory defaults if not defined we should complain
@@ -196,17 +446,38 @@ def compile_all_p4(config):
 
     default_config = {"program": default_p4, "options": default_options, "compiler": default_compiler}
 
+    # jobs keyed by (program, options, compiler), in discovery order
+    jobs = []
+    jobs_by_key = {}
+    jobs_by_output = {}
+
+    def get_job(program_conf):
+        job = CompilationJob(program_conf["program"], program_conf["options"], program_conf["compiler"])
+        if job.key in jobs_by_key:
+            return jobs_by_key[job.key]
+        # two tuples would write the same output file, keep the first one
+        other = jobs_by_output.get(job.output_file, None)
+        if other:
+            log.warn("%s is already compiled with options '%s', ignoring options '%s'\n" %
+                     (job.program, other.options, job.options))
+            return other
+        jobs.append(job)
+        jobs_by_key[job.key] = job
+        jobs_by_output[job.output_file] = job
+        return job
+
     if default_p4 and default_options:
-        json_name = compile_p4_to_bmv2(default_config)
-        p4programs_already_compiled[default_p4] = json_name
+        get_job(default_config)
     else:
         log.debug('Default program was not compiled')
 
     if topo:
         switches = topo.get("switches", None)
+        switch_jobs = []
         if switches:
             # make a set with all the P4 programs to compile
-            for switch_name, sw_attributes in switches.iteritems():
+            for switch_name in sorted(switches):
+                sw_attributes = switches[switch_name]
                 #merge defaults with switch attributes
                 switch_conf = default_config.copy()
                 switch_conf.update(sw_attributes)
@@ -214,17 +485,18 @@ def compile_all_p4(config):
                 program_name = switch_conf.get("program", None)
 
                 if program_name:
-                    json_name = p4programs_already_compiled.get(program_name, None)
-                    if json_name:
-                        sw_attributes.update({"json":json_name})
-                        switch_to_json[switch_name] = sw_attributes
-                    else:
-                        json_name = compile_p4_to_bmv2(switch_conf)
-                        sw_attributes.update({"json": json_name})
-                        switch_to_json[switch_name] = sw_attributes
-                        p4programs_already_compiled[program_name] = json_name
+                    switch_jobs.append((switch_name, sw_attributes, get_job(switch_conf)))
                 else:
                     raise Exception('Did not find a P4 program for switch %s' % switch_name)
+
+        cache = None
+        if config.get("compile_cache", True):
+            cache = CompileCache(config.get("compile_cache_dir", DEFAULT_CACHE_DIR))
+        run_compilation_jobs(jobs, config.get("compile_jobs", None), cache)
+
+        for switch_name, sw_attributes, job in switch_jobs:
+            sw_attributes.update({"json": job.output_file})
+            switch_to_json[switch_name] = sw_attributes
         return switch_to_json
 
     raise Exception('No topology or switches in configuration file.')
@@ -36,10 +36,14 @@ setup(
         'setuptools',
         'networkx',
         'ipaddress',
-        'scapy',
-        'psutil'
+        'scapy'
     ],
-    extras_require={}
+    extras_require={
+        # p4utils.utils.async_runtime_API
+        'async': ['futures', 'trollius'],
+        # numpy arrays in p4utils.utils.snapshots
+        'numpy': ['numpy']
+    }
     #tests_require=['pytest'],
     #setup_requires=['pytest-runner']
 )
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+
+def _link(network, node1, node2, intf1, intf2, port1, port2, ip1, ip2, mac1, mac2):
+    network[node1][node2] = {'ip': ip1, 'mac': mac1, 'intf': intf1, 'bw': -1, 'loss': 0,
+                             'weight': 1, 'delay': 0, 'queue_length': -1}
+    network[node2][node1] = {'ip': ip2, 'mac': mac2, 'intf': intf2, 'bw': -1, 'loss': 0,
+                             'weight': 1, 'delay': 0, 'queue_length': -1}
+    network[node1]['interfaces_to_node'][intf1] = node2
+    network[node1]['interfaces_to_port'][intf1] = port1
+    network[node2]['interfaces_to_node'][intf2] = node1
+    network[node2]['interfaces_to_port'][intf2] = port2
+
+
+def make_network():
+    """Four P4 switches in a square, a host on s1 and s4, a legacy switch on s4.
+
+        h1 - s1 - s2
+             |    |
+             s3 - s4 - h2
+                  |
+                  s5
+    """
+    network = {}
+    for i in range(1, 5):
+        network['s%d' % i] = {'type': 'switch', 'subtype': 'p4switch', 'sw_id': i,
+                              'thrift_port': 9089 + i,
+                              'interfaces_to_node': {}, 'interfaces_to_port': {}}
+    network['s5'] = {'type': 'switch', 'interfaces_to_node': {}, 'interfaces_to_port': {}}
+    for i, switch in ((1, 's1'), (2, 's4')):
+        network['h%d' % i] = {'type': 'host', 'gateway': '10.0.%d.254' % i,
+                              'interfaces_to_node': {}, 'interfaces_to_port': {}}
+    _link(network, 'h1', 's1', 'h1-eth0', 's1-eth1', 0, 1, '10.0.1.1/24', None,
+          '00:00:0a:00:01:01', '00:01:0a:00:01:01')
+    _link(network, 'h2', 's4', 'h2-eth0', 's4-eth1', 0, 1, '10.0.2.1/24', None,
+          '00:00:0A:00:02:01', '00:01:0a:00:02:01')
+    for switch1, port1, switch2, port2 in (('s1', 2, 's2', 1), ('s1', 3, 's3', 1),
+                                           ('s2', 2, 's4', 2), ('s3', 2, 's4', 3),
+                                           ('s4', 4, 's5', 1)):
+        _link(network, switch1, switch2, '%s-eth%d' % (switch1, port1),
+              '%s-eth%d' % (switch2, port2), port1, port2, None, None,
+              '00:02:00:00:%s:%02x' % (switch1[1:].zfill(2), port1),
+              '00:02:00:00:%s:%02x' % (switch2[1:].zfill(2), port2))
+    return network
+
+
+@pytest.fixture
+def topology_db(tmpdir):
+    """Path of a topology database holding make_network()."""
+    path = tmpdir.join("topology.db")
+    path.write(json.dumps(make_network()))
+    return str(path)
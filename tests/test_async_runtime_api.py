@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+pytest.importorskip("concurrent.futures")
+
+from p4utils.utils.async_runtime_API import AsyncSwitchAPI, SwitchWorker, SwitchBusyError
+
+
+class FakeAPI(object):
+    """Records its calls, waits for `release` before answering."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def counter_read(self, name, index):
+        self.release.wait()
+        self.calls.append((name, index))
+        if index < 0:
+            raise ValueError("bad index")
+        return index * 10
+
+
+def test_calls_run_in_order():
+    api = FakeAPI()
+    proxy = AsyncSwitchAPI(api)
+    futures = [proxy.counter_read("c", i) for i in range(5)]
+    assert [future.result(1) for future in futures] == [0, 10, 20, 30, 40]
+    assert api.calls == [("c", i) for i in range(5)]
+
+    with pytest.raises(ValueError):
+        proxy.counter_read("c", -1).result(1)
+    proxy.close()
+
+
+def test_full_queue_does_not_block():
+    api = FakeAPI()
+    api.release.clear()
+    worker = SwitchWorker(api, max_pending=2)
+    futures = [worker.submit_nowait("counter_read", "c", i) for i in range(5)]
+
+    # one call is running, two are queued, the others are refused at once
+    busy = [future for future in futures if future.done()]
+    assert len(busy) >= 2
+    for future in busy:
+        assert isinstance(future.exception(0), SwitchBusyError)
+
+    api.release.set()
+    for future in futures:
+        if future not in busy:
+            assert future.result(1) is not None
+    worker.stop()
@@ -0,0 +1,154 @@
+import pytest
+
+pytest.importorskip("bm_runtime")
+
+from p4utils.utils.command_loader import (CommandError, parse_command, iter_commands,
+                                          load_commands)
+from p4utils.utils.runtime_API import BulkResult, MatchType, UIn_Error, handle_bad_input
+
+
+class FakeTable(object):
+
+    def __init__(self, match_type):
+        self.match_type = match_type
+
+
+class FakeAPI(object):
+    """Records the API calls, table_add_many fails the entries whose action is "bad"."""
+
+    tables = {"exact_t": FakeTable(MatchType.EXACT),
+              "ternary_t": FakeTable(MatchType.TERNARY)}
+
+    def __init__(self):
+        self.calls = []
+
+    def get_res(self, type_name, name, res_type):
+        if name not in self.tables:
+            raise UIn_Error("Unknown %s name '%s'" % (type_name, name))
+        return self.tables[name]
+
+    def table_add_many(self, table_name, entries):
+        self.calls.append(("table_add_many", table_name, len(entries)))
+        handles = []
+        errors = {}
+        for idx, (action_name, _, _, _) in enumerate(entries):
+            if action_name == "bad":
+                handles.append(None)
+                errors[idx] = UIn_Error("bad action")
+            else:
+                handles.append(len(self.calls) * 100 + idx)
+        return BulkResult(handles, errors, 0)
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name,) + args)
+            return name
+        return call
+
+
+class PrintingAPI(FakeAPI):
+    """API with the PRINT output policy, table_add_many prints its error and returns None."""
+
+    verbose = True
+
+    @handle_bad_input
+    def table_add_many(self, table_name, entries):
+        self.calls.append(("table_add_many", table_name, len(entries)))
+        raise UIn_Error("table is full")
+
+
+def test_parse_commands():
+    api = FakeAPI()
+    assert parse_command(api, "table_add exact_t fwd 10.0.0.1 => 1") == \
+        ("table_add", ("exact_t", "fwd", ["10.0.0.1"], ["1"], None))
+    assert parse_command(api, "table_add ternary_t fwd 1&&&3 => 2 10") == \
+        ("table_add", ("ternary_t", "fwd", ["1&&&3"], ["2"], "10"))
+    assert parse_command(api, "mc_node_create 0 1 2 | 3") == \
+        ("mc_node_create", ("0", ["1", "2"], ["3"]))
+    assert parse_command(api, "counter_write c 1 10 1000") == \
+        ("counter_write", ("c", "1", "10", "1000"))
+    assert parse_command(api, "mirroring_add 1 'a b'") == ("mirroring_add", ("1", "a b"))
+
+
+@pytest.mark.parametrize("line", [
+    "unknown_command 1",
+    "table_add ternary_t fwd 1&&&3",
+    "counter_write c 1 10",
+    "table_delete exact_t",
+    "mirroring_add 1 'unterminated",
+])
+def test_parse_errors(line):
+    with pytest.raises(CommandError):
+        parse_command(FakeAPI(), line)
+
+
+def test_consecutive_table_adds_are_batched():
+    api = FakeAPI()
+    lines = ["table_add exact_t fwd 1 => 1",
+             "# comment",
+             "",
+             "table_add exact_t fwd 2 => 1",
+             "table_add ternary_t fwd 1&&&1 => 1 1",
+             "table_set_default exact_t drop",
+             "table_add exact_t fwd 3 => 1"]
+    results = load_commands(api, lines)
+
+    assert api.calls == [("table_add_many", "exact_t", 2),
+                         ("table_add_many", "ternary_t", 1),
+                         ("table_set_default", "exact_t", "drop", []),
+                         ("table_add_many", "exact_t", 1)]
+    assert [result.line_number for result in results] == [1, 4, 5, 6, 7]
+    assert all(result.ok() for result in results)
+    assert [result.value for result in results[:2]] == [100, 101]
+
+
+def test_errors_are_reported_per_line():
+    api = FakeAPI()
+    results = load_commands(api, ["table_add exact_t fwd 1 => 1",
+                                  "table_add exact_t bad 2 => 1",
+                                  "table_add unknown_t fwd 3 => 1",
+                                  "table_add exact_t fwd 4 => 1"])
+
+    # the line that can not be parsed does not break the batch
+    assert api.calls == [("table_add_many", "exact_t", 3)]
+    assert [result.ok() for result in results] == [True, False, False, True]
+    assert str(results[1].error) == "bad action"
+    assert results[3].value == 102
+
+
+def test_batch_size():
+    api = FakeAPI()
+    lines = ["table_add exact_t fwd %d => 1" % i for i in range(5)]
+    load_commands(api, lines, batch_size=2)
+    assert [call[2] for call in api.calls] == [2, 2, 1]
+
+    api = FakeAPI()
+    load_commands(api, lines, batch_size=1)
+    assert api.calls == [("table_add", "exact_t", "fwd", [str(i)], ["1"], None)
+                         for i in range(5)]
+
+
+def test_commands_are_run_lazily():
+    api = FakeAPI()
+    read = []
+
+    def lines():
+        for line in ["table_set_default exact_t drop", "table_clear exact_t"]:
+            read.append(line)
+            yield line
+
+    results = iter_commands(api, lines())
+    assert next(results).command == "table_set_default"
+    assert read == ["table_set_default exact_t drop"]
+    assert [result.command for result in results] == ["table_clear"]
+
+
+def test_failed_batch_with_print_output(capsys):
+    api = PrintingAPI()
+    results = load_commands(api, ["table_add exact_t fwd 1 => 1",
+                                  "table_add exact_t fwd 2 => 1",
+                                  "table_clear exact_t"])
+
+    assert "table is full" in capsys.readouterr()[0]
+    assert [result.ok() for result in results] == [False, False, True]
+    assert api.calls[-1] == ("table_clear", "exact_t")
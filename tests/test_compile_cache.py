@@ -0,0 +1,133 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("mininet")
+
+from p4utils.utils.compile_cache import CompileCache
+
+
+class Job(object):
+    """Minimal stand-in for utils.CompilationJob."""
+
+    def __init__(self, program, options="", compiler="p4c"):
+        self.program = program
+        self.options = options
+        self.compiler = compiler
+        self.output_file = os.path.splitext(program)[0] + ".json"
+
+
+@pytest.fixture
+def compiler(tmpdir):
+    path = tmpdir.join("bin", "p4c")
+    path.write("#!/bin/sh\necho p4c 1.2.3\n", ensure=True)
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return CompileCache(str(tmpdir.join("cache")))
+
+
+def compile_outputs(job, names, content="compiled"):
+    base = os.path.splitext(job.output_file)[0]
+    for extension in names:
+        with open(base + extension, "w") as f:
+            f.write(content + extension)
+
+
+def test_key_depends_on_includes_and_options(tmpdir, cache, compiler):
+    program = tmpdir.join("src", "main.p4")
+    program.write('#include "headers.p4"\n', ensure=True)
+    headers = tmpdir.join("src", "headers.p4")
+    headers.write("header h_t { bit<8> f; }\n")
+
+    job = Job(str(program), compiler=compiler)
+    key = cache.job_key(job)
+    assert key == cache.job_key(Job(str(program), compiler=compiler))
+    assert key != cache.job_key(Job(str(program), "--p4v 14", compiler))
+
+    headers.write("header h_t { bit<16> f; }\n")
+    assert key != cache.job_key(job)
+
+
+def test_missing_include_disables_caching(tmpdir, cache, compiler):
+    program = tmpdir.join("main.p4")
+    program.write('#include "missing.p4"\n')
+    assert cache.job_key(Job(str(program), compiler=compiler)) is None
+
+
+def test_store_and_restore(tmpdir, cache, compiler):
+    program = tmpdir.join("main.p4")
+    program.write("control c() { apply {} }\n")
+    job = Job(str(program), compiler=compiler)
+    key = cache.job_key(job)
+
+    start = time.time() - 1
+    compile_outputs(job, [".json", ".p4i"])
+    cache.store(job, key, start)
+
+    os.remove(job.output_file)
+    os.remove(str(tmpdir.join("main.p4i")))
+    assert cache.restore(job, key)
+    assert tmpdir.join("main.json").read() == "compiled.json"
+    assert tmpdir.join("main.p4i").read() == "compiled.p4i"
+    assert not cache.restore(job, "unknown")
+
+
+def test_store_ignores_outputs_of_other_jobs(tmpdir, cache, compiler):
+    program = tmpdir.join("foo.p4")
+    program.write("control c() { apply {} }\n")
+    job = Job(str(program), compiler=compiler)
+    key = cache.job_key(job)
+
+    start = time.time() - 1
+    compile_outputs(job, [".json", ".p4i"])
+    # written at the same time by a job compiling foo_v2.p4
+    compile_outputs(Job(str(tmpdir.join("foo_v2.p4"))), [".json", ".p4i"], "other")
+    cache.store(job, key, start)
+
+    entry = os.listdir(os.path.join(cache.cache_dir, key))
+    assert sorted(entry) == ["0-foo.json", "1-foo.p4i", CompileCache.MANIFEST]
+
+
+def test_store_skips_failed_outputs(tmpdir, cache, compiler):
+    program = tmpdir.join("main.p4")
+    program.write("control c() { apply {} }\n")
+    job = Job(str(program), compiler=compiler)
+    key = cache.job_key(job)
+
+    # the JSON was left there by an earlier compilation
+    compile_outputs(job, [".json"])
+    cache.store(job, key, time.time() + 10)
+    assert not cache.restore(job, key)
+
+
+def test_extra_outputs():
+    job = Job("main.p4", "--p4runtime-files out/a.txt,out/b.json --p4runtime-file=c.txt")
+    assert CompileCache.extra_outputs(job) == ["out/a.txt", "out/b.json", "c.txt"]
+
+
+def test_store_skips_stale_extra_outputs(tmpdir, cache, compiler):
+    program = tmpdir.join("main.p4")
+    program.write("control c() { apply {} }\n")
+    p4info = tmpdir.join("main.p4info.txt")
+    job = Job(str(program), "--p4runtime-files %s" % p4info, compiler)
+    key = cache.job_key(job)
+
+    # left there by an earlier build
+    p4info.write("old p4info")
+    stale = time.time() - 100
+    os.utime(str(p4info), (stale, stale))
+    start = time.time() - 1
+    compile_outputs(job, [".json"])
+    cache.store(job, key, start)
+    assert not cache.restore(job, key)
+
+    p4info.write("new p4info")
+    cache.store(job, key, start)
+    p4info.remove()
+    assert cache.restore(job, key)
+    assert p4info.read() == "new p4info"
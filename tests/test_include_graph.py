@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from p4utils.utils.include_graph import (IncludeGraph, MissingIncludeError,
+                                         include_paths_from_options)
+
+
+def write(path, content=""):
+    path.write(content, ensure=True)
+    return os.path.realpath(str(path))
+
+
+def test_include_paths_from_options(tmpdir):
+    paths = include_paths_from_options('-I lib -Iinclude --p4v 16', cwd=str(tmpdir))
+    assert paths == [os.path.realpath(str(tmpdir.join("lib"))),
+                     os.path.realpath(str(tmpdir.join("include")))]
+    assert include_paths_from_options(None) == []
+
+
+def test_transitive_dependencies(tmpdir):
+    main = write(tmpdir.join("main.p4"),
+                 '#include <core.p4>\n#include "headers.p4"\n  # include <parser.p4>\n')
+    headers = write(tmpdir.join("headers.p4"), '#include "common/types.p4"\n')
+    types = write(tmpdir.join("common", "types.p4"))
+    parser = write(tmpdir.join("lib", "parser.p4"), '#include "../headers.p4"\n')
+
+    graph = IncludeGraph([str(tmpdir.join("lib"))])
+    # core.p4 is a compiler system header, it is not part of the graph
+    assert graph.dependencies(main) == set([headers, types, parser])
+    assert graph.graph(main)[parser] == set([headers])
+
+
+def test_angle_includes_are_not_relative(tmpdir):
+    main = write(tmpdir.join("main.p4"), '#include <headers.p4>\n')
+    write(tmpdir.join("headers.p4"))
+    assert IncludeGraph().dependencies(main) == set()
+
+
+def test_missing_quoted_include(tmpdir):
+    main = write(tmpdir.join("main.p4"), '#include "missing.p4"\n')
+    with pytest.raises(MissingIncludeError) as excinfo:
+        IncludeGraph().dependencies(main)
+    assert excinfo.value.include == "missing.p4"
+
+
+def test_include_cycles(tmpdir):
+    a = write(tmpdir.join("a.p4"), '#include "b.p4"\n')
+    b = write(tmpdir.join("b.p4"), '#include "a.p4"\n')
+    assert IncludeGraph().dependencies(a) == set([b])
+
+
+def test_changed_files_are_parsed_again(tmpdir):
+    main = tmpdir.join("main.p4")
+    write(main, '#include "a.p4"\n')
+    a = write(tmpdir.join("a.p4"))
+    b = write(tmpdir.join("b.p4"))
+    assert IncludeGraph().dependencies(str(main)) == set([a])
+
+    write(main, '#include "b.p4"\n')
+    # make sure the mtime changes even on coarse grained file systems
+    mtime = int(os.path.getmtime(str(main))) + 10
+    os.utime(str(main), (mtime, mtime))
+    assert IncludeGraph().dependencies(str(main)) == set([b])
+    assert IncludeGraph().last_modified(str(main)) == mtime
@@ -0,0 +1,173 @@
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("bm_runtime")
+
+from p4utils.utils.multicast import MulticastManager, node_spec
+from p4utils.utils.runtime_API import PreType, UIn_Error
+
+
+class FakePRE(object):
+    """In-memory SimplePre multicast engine, calls in fail_calls raise."""
+
+    def __init__(self):
+        self.groups = {}
+        self.nodes = {}
+        self.next_handle = 0
+        self.fail_calls = set()
+        self.calls = []
+
+    def _call(self, name, *args):
+        self.calls.append(name)
+        if (name,) + args in self.fail_calls:
+            raise ValueError("%s failed" % name)
+
+    def bm_mc_get_entries(self, cxt_id):
+        return json.dumps({
+            "mgrps": [{"id": mgrp, "l1_handles": handles} for mgrp, handles in self.groups.items()],
+            "l1_handles": [{"handle": handle, "rid": rid, "l2_handle": handle}
+                           for handle, (rid, _) in self.nodes.items()],
+            "l2_handles": [{"handle": handle, "ports": ports}
+                           for handle, (_, ports) in self.nodes.items()]})
+
+    def bm_mc_mgrp_create(self, cxt_id, mgrp):
+        self._call("mgrp_create", mgrp)
+        self.groups[mgrp] = []
+
+    def bm_mc_mgrp_destroy(self, cxt_id, mgrp):
+        self._call("mgrp_destroy", mgrp)
+        del self.groups[mgrp]
+
+    def bm_mc_node_create(self, cxt_id, rid, port_map):
+        self._call("node_create", rid)
+        self.next_handle += 1
+        self.nodes[self.next_handle] = (rid, self.ports(port_map))
+        return self.next_handle
+
+    def bm_mc_node_update(self, cxt_id, handle, port_map):
+        self._call("node_update", handle)
+        self.nodes[handle] = (self.nodes[handle][0], self.ports(port_map))
+
+    def bm_mc_node_destroy(self, cxt_id, handle):
+        self._call("node_destroy", handle)
+        del self.nodes[handle]
+
+    def bm_mc_node_associate(self, cxt_id, mgrp, handle):
+        self._call("node_associate", mgrp)
+        self.groups[mgrp].append(handle)
+
+    def bm_mc_node_dissociate(self, cxt_id, mgrp, handle):
+        self._call("node_dissociate", mgrp)
+        self.groups[mgrp].remove(handle)
+
+    @staticmethod
+    def ports(port_map):
+        return [port for port, bit in enumerate(reversed(port_map)) if bit == "1"]
+
+
+class FakeConnection(object):
+    lock = threading.RLock()
+
+
+class FakeAPI(object):
+    pre_type = PreType.SimplePre
+
+    def __init__(self):
+        self.mc_client = FakePRE()
+        self.connection = FakeConnection()
+
+    def check_has_pre(self):
+        pass
+
+    def get_mgrp(self, mgrp):
+        return int(mgrp)
+
+    def ports_to_port_map_str(self, ports, description="port"):
+        port_map = ["0"] * (max(ports) + 1 if ports else 0)
+        for port in ports:
+            port_map[-port - 1] = "1"
+        return "".join(port_map)
+
+
+@pytest.fixture
+def api():
+    return FakeAPI()
+
+
+@pytest.fixture
+def manager(api):
+    return MulticastManager(api)
+
+
+def test_node_spec():
+    assert node_spec((1, [3, 1, 3])) == (1, (1, 3), ())
+    assert node_spec(("2", [1], [0])) == (2, (1,), (0,))
+    with pytest.raises(UIn_Error):
+        node_spec(("x", [1]))
+
+
+def test_diff_group(manager):
+    manager.synced = True
+    manager.groups = {1: [10, 11, 12, 13]}
+    manager.nodes = {10: (0, (1, 2), ()), 11: (1, (3,), ()),
+                     12: (2, (4,), ()), 13: (0, (1, 2), ())}
+
+    to_create, to_update, to_remove = manager.diff_group(
+        1, [(0, (1, 2), ()), (1, (3, 4), ()), (3, (5,), ())])
+    assert to_create == [(3, (5,), ())]
+    assert to_update == [(11, (1, (3, 4), ()))]
+    assert sorted(to_remove) == [12, 13]
+
+    assert manager.diff_group(2, [(0, (1,), ())]) == ([(0, (1,), ())], [], [])
+
+
+def test_apply_only_sends_changes(api, manager):
+    result = manager.apply({1: [(0, [1, 2]), (1, [3])], 2: [(0, [4])]})
+    assert not result.errors
+    assert result.operations == {"mgrp_create": 2, "node_create": 3, "node_associate": 3}
+    assert manager.get_groups() == {1: [(0, (1, 2), ()), (1, (3,), ())], 2: [(0, (4,), ())]}
+
+    del api.mc_client.calls[:]
+    assert manager.apply({1: [(1, [3]), (0, [1, 2])], 2: [(0, [4])]}).num_operations() == 0
+    assert api.mc_client.calls == []
+
+    result = manager.apply({1: [(0, [1, 2]), (1, [5])]})
+    assert result.operations == {"node_update": 1, "node_dissociate": 1,
+                                 "node_destroy": 1, "mgrp_destroy": 1}
+
+    # the mirror matches the switch
+    mirror = manager.get_groups()
+    manager.sync()
+    assert manager.get_groups() == mirror == {1: [(0, (1, 2), ()), (1, (5,), ())]}
+
+
+def test_remove_groups(api, manager):
+    manager.apply({1: [(0, [1])], 2: [(0, [2])]})
+    manager.remove_groups([1])
+    assert sorted(api.mc_client.groups) == [2]
+    assert len(api.mc_client.nodes) == 1
+
+
+def test_failed_group_creation(api, manager):
+    api.mc_client.fail_calls.add(("mgrp_create", 2))
+    result = manager.apply({1: [(0, [1])], 2: [(0, [2]), (1, [3])]})
+
+    assert [error[0] for error in result.errors] == ["mgrp_create"]
+    # no node is created for the group that does not exist
+    assert len(api.mc_client.nodes) == 1
+    assert not manager.synced
+    assert manager.get_groups() == {1: [(0, (1,), ())]}
+
+
+def test_failed_association(api, manager):
+    api.mc_client.fail_calls.add(("node_associate", 2))
+    result = manager.apply({1: [(0, [1])], 2: [(0, [2])]})
+
+    assert [error[0] for error in result.errors] == ["node_associate"]
+    # the node that could not be associated is destroyed
+    assert result.operations["node_destroy"] == 1
+    assert len(api.mc_client.nodes) == 1
+    assert not manager.synced
+    assert manager.get_groups() == {1: [(0, (1,), ())], 2: []}
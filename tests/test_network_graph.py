@@ -0,0 +1,53 @@
+import networkx as nx
+import pytest
+
+from p4utils.utils.topology import Topology
+
+
+@pytest.fixture
+def topo(topology_db):
+    return Topology(db=topology_db)
+
+
+@pytest.fixture
+def precomputed(topology_db):
+    topo = Topology(db=topology_db)
+    topo.precompute_paths()
+    return topo
+
+
+def test_same_answers_as_networkx(topo, precomputed):
+    nodes = sorted(topo.network_graph.nodes())
+    for node1 in nodes:
+        for node2 in nodes:
+            expected = topo.get_shortest_paths_between_nodes(node1, node2)
+            assert precomputed.get_shortest_paths_between_nodes(node1, node2) == expected
+            assert precomputed.get_number_of_shortest_paths_between_nodes(node1, node2) == \
+                len(expected)
+            assert topo.get_number_of_shortest_paths_between_nodes(node1, node2) == len(expected)
+    assert precomputed.network_graph.total_number_of_paths() == \
+        topo.network_graph.total_number_of_paths() == 4
+
+
+def test_paths_and_next_hops(precomputed):
+    assert sorted(precomputed.get_shortest_paths_between_nodes('h1', 'h2')) == \
+        [('h1', 's1', 's2', 's4', 'h2'), ('h1', 's1', 's3', 's4', 'h2')]
+    assert sorted(precomputed.get_shortest_paths_next_hops('s1', 'h2')) == ['s2', 's3']
+    assert precomputed.get_shortest_paths_next_hops('s2', 'h2') == ['s4']
+    assert precomputed.get_shortest_paths_next_hops('h2', 'h2') == []
+
+
+def test_tables_follow_graph_changes(precomputed):
+    graph = precomputed.network_graph
+    graph.remove_edge('s2', 's4')
+    assert precomputed.get_number_of_shortest_paths_between_nodes('h1', 'h2') == 1
+    assert precomputed.get_shortest_paths_next_hops('s1', 'h2') == ['s3']
+
+    graph.remove_edge('s3', 's4')
+    assert precomputed.get_number_of_shortest_paths_between_nodes('h1', 'h2') == 0
+    with pytest.raises(nx.NetworkXNoPath):
+        precomputed.get_shortest_paths_between_nodes('h1', 'h2')
+
+    graph.add_edge('s1', 's4')
+    assert precomputed.get_shortest_paths_between_nodes('h1', 'h2') == \
+        [('h1', 's1', 's4', 'h2')]
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+pytest.importorskip("bm_runtime")
+
+from p4utils.utils.poller import Poller, RingBuffer
+from p4utils.utils.snapshots import Snapshot, to_array
+
+
+def test_ring_buffer_keeps_the_last_samples():
+    buffer = RingBuffer(3, 2)
+    for i in range(5):
+        buffer.append(float(i), to_array([i, -i]))
+
+    assert len(buffer) == 3
+    timestamp, values = buffer.get()
+    assert timestamp == 4.0 and list(values) == [4, -4]
+    assert list(buffer.get(2)[1]) == [2, -2]
+    with pytest.raises(IndexError):
+        buffer.get(3)
+
+    timestamps, cells = buffer.series(index=1)
+    assert list(timestamps) == [2.0, 3.0, 4.0]
+    assert list(cells) == [-2, -3, -4]
+    timestamps, rows = buffer.series(since=2.0)
+    assert list(timestamps) == [3.0, 4.0]
+    assert [list(row) for row in rows] == [[3, -3], [4, -4]]
+
+
+def test_ring_buffer_stores_signed_values():
+    buffer = RingBuffer(2, 2)
+    buffer.append(0.0, to_array([-1, 2 ** 63 - 1]))
+    assert list(buffer.get()[1]) == [-1, 2 ** 63 - 1]
+
+
+class FakeSwitch(object):
+
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+
+    def snapshot(self, registers, counters):
+        snapshot = self.snapshots.pop(0)
+        if isinstance(snapshot, Exception):
+            raise snapshot
+        return snapshot
+
+
+def make_poller(switch, width=2):
+    # skip __init__, it connects to the switches
+    poller = Poller.__new__(Poller)
+    poller.lock = threading.Lock()
+    poller.errors = {}
+    poller.controllers = {"s1": switch}
+    poller.arrays = {"s1": (["reg"], [])}
+    poller.buffers = {"s1": {("reg", None): RingBuffer(4, width)}}
+    return poller
+
+
+def register_snapshot(timestamp, values):
+    return Snapshot(timestamp, 0.0, {"reg": to_array(values)})
+
+
+def test_rate():
+    poller = make_poller(FakeSwitch([register_snapshot(1.0, [0, 10]),
+                                     register_snapshot(3.0, [4, 6])]))
+    poller.poll_switch("s1")
+    assert poller.rate("s1", "reg") is None
+    poller.poll_switch("s1")
+    assert list(poller.rate("s1", "reg")) == [2.0, -2.0]
+    assert poller.rate("s1", "reg", index=0) == 2.0
+
+
+def test_rate_of_samples_taken_at_the_same_time():
+    poller = make_poller(FakeSwitch([register_snapshot(1.0, [0, 0]),
+                                     register_snapshot(1.0, [1, 1])]))
+    poller.poll_switch("s1")
+    poller.poll_switch("s1")
+    assert poller.rate("s1", "reg") is None
+    assert poller.rate("s1", "reg", index=0) is None
+
+
+def test_failed_samples_are_recorded():
+    error = IOError("connection lost")
+    poller = make_poller(FakeSwitch([error, None, register_snapshot(1.0, [1, 2])]))
+    poller.poll_switch("s1")
+    assert poller.errors["s1"] is error
+    poller.poll_switch("s1")
+    assert isinstance(poller.errors["s1"], RuntimeError)
+    poller.poll_switch("s1")
+    assert list(poller.latest("s1", "reg")[1]) == [1, 2]
+
+
+@pytest.mark.parametrize("interval", [0, -1.0])
+def test_interval_must_be_positive(interval):
+    with pytest.raises(ValueError):
+        Poller(None, registers=["reg"], interval=interval)
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        Poller(None, registers=["reg"], capacity=0)
@@ -0,0 +1,54 @@
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip("mininet")
+
+from p4utils.utils.utils import PortAllocator, check_port_free
+
+
+@pytest.fixture
+def listening_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('', 0))
+    sock.listen(1)
+    yield sock
+    sock.close()
+
+
+def test_ports_are_handed_out_once():
+    allocator = PortAllocator(45000)
+    ports = allocator.reserve(3) + [allocator.allocate()]
+    assert len(set(ports)) == 4
+    assert ports == sorted(ports)
+    assert all(port >= 45000 for port in ports)
+
+
+def test_bound_ports_are_skipped(listening_socket):
+    port = listening_socket.getsockname()[1]
+    assert not check_port_free(port)
+    assert PortAllocator(port).allocate() > port
+
+
+def test_concurrent_allocation():
+    allocator = PortAllocator(46000)
+    ports = []
+    lock = threading.Lock()
+
+    def allocate():
+        port = allocator.allocate()
+        with lock:
+            ports.append(port)
+
+    threads = [threading.Thread(target=allocate) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ports)) == 20
+
+
+def test_no_ports_left():
+    with pytest.raises(Exception):
+        PortAllocator(65536).allocate()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("bm_runtime")
+
+from bm_runtime.standard.ttypes import (BmActionEntry, BmActionEntryType, BmMtEntry,
+                                        BmAddEntryOptions)
+from p4utils.utils import runtime_API
+from p4utils.utils.runtime_API import (RuntimeAPI, OutputPolicy, get_program_info,
+                                       parse_match_key, match_key_to_bytes, mask_prefix,
+                                       mask_ternary, read_program_cache, write_program_cache,
+                                       program_cache_path)
+
+PROGRAM = {
+    "header_types": [{"name": "ipv4_t", "fields": [["dst", 32, False]]}],
+    "headers": [{"name": "ipv4", "header_type": "ipv4_t"}],
+    "actions": [{"name": "ingress.fwd", "id": 0,
+                 "runtime_data": [{"name": "port", "bitwidth": 9}]}],
+    "pipelines": [{"name": "ingress", "action_profiles": [], "tables": [
+        {"name": "ingress.routes", "id": 0, "match_type": "lpm", "type": "simple",
+         "support_timeout": False, "actions": ["ingress.fwd"],
+         "key": [{"match_type": "lpm", "target": ["ipv4", "dst"]}]}]}],
+}
+
+
+class FakeClient(object):
+    """Match table of a switch, calls on the handles in fail_handles raise."""
+
+    def __init__(self):
+        self.entries = {}
+        self.next_handle = 0
+        self.fail_handles = set()
+
+    def bm_mt_get_entries(self, cxt_id, table_name):
+        return list(self.entries.values())
+
+    def bm_mt_add_entry(self, cxt_id, table_name, match_key, action_name, action_data, options):
+        handle = self.next_handle
+        self.next_handle += 1
+        self.entries[handle] = BmMtEntry(
+            match_key=match_key, entry_handle=handle, options=options,
+            action_entry=BmActionEntry(action_type=BmActionEntryType.ACTION_DATA,
+                                       action_name=action_name, action_data=action_data))
+        return handle
+
+    def bm_mt_modify_entry(self, cxt_id, table_name, handle, action_name, action_data):
+        if handle in self.fail_handles:
+            raise ValueError("modify failed")
+        self.entries[handle].action_entry.action_name = action_name
+        self.entries[handle].action_entry.action_data = action_data
+
+    def bm_mt_delete_entry(self, cxt_id, table_name, handle):
+        if handle in self.fail_handles:
+            raise ValueError("delete failed")
+        del self.entries[handle]
+
+
+class FakeConnection(object):
+    lock = threading.RLock()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def api():
+    # skip __init__, it connects to the switch
+    api = RuntimeAPI.__new__(RuntimeAPI)
+    api.set_output_policy(OutputPolicy.SILENT)
+    api.program = get_program_info(json.dumps(PROGRAM))
+    api.client = FakeClient()
+    api.connection = FakeConnection()
+    api.track_entries = True
+    api.table_entries_match_to_handle = {}
+    api.table_entries_handle_to_match = {}
+    return api
+
+
+def test_program_getters(api):
+    other = RuntimeAPI.__new__(RuntimeAPI)
+    other_program = dict(PROGRAM, pipelines=[dict(PROGRAM["pipelines"][0], tables=[])])
+    other.program = get_program_info(json.dumps(other_program))
+
+    assert list(api.get_tables()) == ["ingress.routes"]
+    assert other.get_tables() == {}
+    assert api.get_program_tables() is api.program.tables
+    # through the class, the program loaded last
+    with pytest.deprecated_call():
+        assert RuntimeAPI.get_tables() == {}
+
+
+def test_program_cache(tmpdir, monkeypatch):
+    json_str = json.dumps(PROGRAM)
+    md5 = hashlib.md5(json_str).hexdigest()
+    cache_dir = str(tmpdir.join("programs"))
+    program = get_program_info(json_str)
+
+    write_program_cache(cache_dir, md5, program)
+    assert oct(os.stat(cache_dir).st_mode & 0o777) == oct(0o700)
+    assert list(read_program_cache(cache_dir, md5).tables) == ["ingress.routes"]
+    assert read_program_cache(cache_dir, "0" * 32) is None
+
+    # files written with another cache format are misses
+    monkeypatch.setattr(runtime_API, "PROGRAM_CACHE_VERSION", runtime_API.PROGRAM_CACHE_VERSION + 1)
+    assert read_program_cache(cache_dir, md5) is None
+    write_program_cache(cache_dir, md5, program)
+    assert read_program_cache(cache_dir, md5) is not None
+
+    # broken files are misses too
+    with open(program_cache_path(cache_dir, md5), "rb") as f:
+        header = f.readline()
+    with open(program_cache_path(cache_dir, md5), "wb") as f:
+        f.write(header + "not a pickle")
+    assert read_program_cache(cache_dir, md5) is None
+
+
+def test_shared_program_cache_is_not_used(tmpdir):
+    json_str = json.dumps(PROGRAM)
+    md5 = hashlib.md5(json_str).hexdigest()
+    cache_dir = str(tmpdir.join("programs"))
+    write_program_cache(cache_dir, md5, get_program_info(json_str))
+    os.chmod(cache_dir, 0o777)
+    assert read_program_cache(cache_dir, md5) is None
+
+
+def test_masks():
+    assert mask_prefix("\x0a\x00\x00\x01", 24, 32) == "\x0a\x00\x00\x00"
+    assert mask_prefix("\x01\xff", 9, 9) == "\x01\xff"
+    assert mask_prefix("\x01\xff", 4, 9) == "\x01\xe0"
+    assert mask_ternary("\x12\x34", "\xf0\x0f") == "\x10\x04"
+
+
+def test_match_keys_are_masked(api):
+    table = api.program.tables["ingress.routes"]
+    host = parse_match_key(table, ["10.0.0.1/24"])
+    network = parse_match_key(table, ["10.0.0.0/24"])
+    assert match_key_to_bytes(host) != match_key_to_bytes(network)
+    assert match_key_to_bytes(host, table) == match_key_to_bytes(network, table)
+    assert match_key_to_bytes(parse_match_key(table, ["10.0.0.0/16"]), table) != \
+        match_key_to_bytes(network, table)
+
+
+def test_reconcile(api):
+    api.table_add_many("routes", [("fwd", ["10.0.0.0/24"], ["1"]),
+                                  ("fwd", ["10.0.1.0/24"], ["2"]),
+                                  ("fwd", ["10.0.2.0/24"], ["3"])])
+
+    result = api.table_reconcile("routes", [("fwd", ["10.0.0.1/24"], ["1"]),
+                                            ("fwd", ["10.0.1.0/24"], ["4"]),
+                                            ("fwd", ["10.0.3.0/24"], ["5"]),
+                                            ("missing_action", ["10.0.4.0/24"], [])])
+    assert (result.unchanged, result.modified, result.added, result.deleted) == (1, 1, 1, 1)
+    assert list(result.errors) == [3]
+
+    table = api.program.tables["ingress.routes"]
+    installed = dict((match_key_to_bytes(entry.match_key, table), entry.action_entry.action_data)
+                     for entry in api.client.entries.values())
+    assert len(installed) == 3
+    assert installed[match_key_to_bytes(parse_match_key(table, ["10.0.1.0/24"]), table)] == \
+        ["\x00\x04"]
+
+    # the tracked entries follow the table
+    assert sorted(api.table_entries_handle_to_match["ingress.routes"]) == \
+        sorted(api.client.entries)
+
+    result = api.table_reconcile("routes", [("fwd", ["10.0.0.0/24"], ["1"])], prune=False)
+    assert (result.unchanged, result.deleted) == (1, 0)
+
+
+def test_reconcile_errors(api):
+    api.table_add_many("routes", [("fwd", ["10.0.0.0/24"], ["1"]),
+                                  ("fwd", ["10.0.1.0/24"], ["2"])])
+    api.client.fail_handles.update([0, 1])
+
+    result = api.table_reconcile("routes", [("fwd", ["10.0.0.0/24"], ["3"]),
+                                            ("fwd", ["10.0.0.0/24"], ["4"])])
+    # wanted entries and installed entries are reported separately
+    assert sorted(result.errors) == [0, 1]
+    assert list(result.delete_errors) == [1]
+    assert sorted(api.client.entries) == [0, 1]
@@ -0,0 +1,47 @@
+from p4utils.utils.snapshots import to_array, array_delta, delta64, to_int64
+
+MAX_INT64 = 2 ** 63 - 1
+MIN_INT64 = -2 ** 63
+
+
+def test_to_int64():
+    assert to_int64(5) == 5
+    assert to_int64(-1) == -1
+    assert to_int64(2 ** 64 - 1) == -1
+    assert to_int64(2 ** 63) == MIN_INT64
+
+
+def test_to_array_keeps_signed_values():
+    values = to_array([0, -1, MAX_INT64, MIN_INT64])
+    assert list(values) == [0, -1, MAX_INT64, MIN_INT64]
+
+
+def test_to_array_wraps_unsigned_values():
+    assert list(to_array([2 ** 64 - 1, 2 ** 63])) == [-1, MIN_INT64]
+
+
+def test_wide_values_are_kept():
+    values = to_array([2 ** 70, 1], bitwidth=80)
+    assert list(values) == [2 ** 70, 1]
+    assert list(array_delta(values, to_array([1, 1], bitwidth=80))) == [2 ** 70 - 1, 0]
+
+
+def test_delta():
+    current = to_array([10, 0, -5])
+    previous = to_array([3, 0, -7])
+    assert list(array_delta(current, previous)) == [7, 0, 2]
+
+
+def test_delta_across_wraparound():
+    # a counter going past 2**63 - 1 is read back as negative
+    current = to_array([MIN_INT64 + 2, 1])
+    previous = to_array([MAX_INT64 - 1, -1])
+    assert list(array_delta(current, previous)) == [4, 2]
+    assert delta64(MIN_INT64, MAX_INT64) == 1
+    assert delta64(2, -3) == 5
+
+
+def test_list_delta_across_wraparound():
+    # without numpy, and where C longs are 32 bits, values are kept in lists
+    assert array_delta([MIN_INT64 + 2, 1], [MAX_INT64 - 1, -1]) == [4, 2]
+    assert array_delta([2 ** 70, 3], [1, 1]) == [2 ** 70 - 1, 2]
@@ -0,0 +1,65 @@
+import socket
+
+import pytest
+
+pytest.importorskip("thrift")
+
+from p4utils.utils.thrift_pool import SwitchConnection
+
+
+class FakeSwitchConnection(SwitchConnection):
+    """Connection that does not open sockets."""
+
+    def __init__(self):
+        super(FakeSwitchConnection, self).__init__("localhost", 9090)
+        self.opens = 0
+        self.connected = False
+
+    def is_open(self):
+        return self.connected
+
+    def open(self):
+        if not self.connected:
+            self.opens += 1
+            self.connected = True
+
+    def close(self):
+        self.connected = False
+
+
+class FlakyClient(object):
+    """Thrift client whose first call fails with a broken connection."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if len(self.calls) == 1:
+            raise socket.error("connection reset")
+        return name
+
+    def bm_mt_get_entries(self, cxt_id, table_name):
+        return self._call("bm_mt_get_entries")
+
+    def bm_mt_add_entry(self, cxt_id, table_name):
+        return self._call("bm_mt_add_entry")
+
+
+def test_retry_safe_calls_are_retried():
+    connection = FakeSwitchConnection()
+    client = FlakyClient()
+    assert connection.call(client, "bm_mt_get_entries", 0, "t") == "bm_mt_get_entries"
+    assert client.calls == ["bm_mt_get_entries"] * 2
+    assert connection.reconnects == 1
+
+
+def test_other_calls_reconnect_and_raise():
+    connection = FakeSwitchConnection()
+    client = FlakyClient()
+    with pytest.raises(socket.error):
+        connection.call(client, "bm_mt_add_entry", 0, "t")
+    # the entry may have been added, it is not added a second time
+    assert client.calls == ["bm_mt_add_entry"]
+    assert connection.is_open() and connection.opens == 2
+    assert connection.call(client, "bm_mt_add_entry", 0, "t") == "bm_mt_add_entry"
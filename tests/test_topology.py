@@ -0,0 +1,57 @@
+import pytest
+
+from p4utils import InvalidHostMAC
+from p4utils.utils.topology import Topology
+
+
+@pytest.fixture
+def topo(topology_db):
+    return Topology(db=topology_db)
+
+
+def test_nodes_by_type(topo):
+    assert sorted(topo.get_hosts()) == ['h1', 'h2']
+    assert sorted(topo.get_switches()) == ['s1', 's2', 's3', 's4', 's5']
+    assert sorted(topo.get_p4switches()) == ['s1', 's2', 's3', 's4']
+    assert topo.get_p4switches()['s2']['sw_id'] == 2
+    assert topo.get_thrift_port('s3') == 9092
+    with pytest.raises(TypeError):
+        topo.get_thrift_port('s5')
+
+
+def test_host_lookups(topo):
+    assert topo.get_host_ip('h2') == '10.0.2.1'
+    assert topo.get_host_name('10.0.1.1') == 'h1'
+    # macs are matched case insensitively
+    assert topo.get_host_name_from_mac('00:00:0a:00:02:01') == 'h2'
+    assert topo.get_host_name_from_mac('00:00:0A:00:01:01') == 'h1'
+    with pytest.raises(InvalidHostMAC):
+        topo.get_host_name_from_mac('00:01:0a:00:01:01')
+
+
+def test_port_lookups(topo):
+    assert topo.port_to_node('s4', 1) == 'h2'
+    assert topo.port_to_node('s4', 4) == 's5'
+    assert topo.port_to_interface('s1', 3) == 's1-eth3'
+    assert topo.node_to_node_port_num('s3', 's4') == 2
+    with pytest.raises(KeyError):
+        topo.port_to_node('s1', 10)
+
+
+def test_hosts_connected_to(topo):
+    assert topo.get_hosts_connected_to('s4') == ['h2']
+    assert topo.get_hosts_connected_to('s2') == []
+    assert topo.get_direct_host_networks_from_switch('s1') == set(['10.0.1.0/24'])
+    assert topo.get_direct_host_networks_from_switch('s3') == set()
+
+
+def test_lookups_return_copies(topo):
+    topo.get_hosts().pop('h1')
+    topo.get_p4switches().clear()
+    topo.get_hosts_connected_to('s4').append('h1')
+    topo.get_direct_host_networks_from_switch('s1').add('10.0.9.0/24')
+
+    assert sorted(topo.get_hosts()) == ['h1', 'h2']
+    assert len(topo.get_p4switches()) == 4
+    assert topo.get_hosts_connected_to('s4') == ['h2']
+    assert topo.get_direct_host_networks_from_switch('s1') == set(['10.0.1.0/24'])